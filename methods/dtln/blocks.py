@@ -0,0 +1,172 @@
+import logging
+import numpy as np
+
+# Block framing and overlap-add for the stateless DTLN model, kept free of TensorFlow:
+# model is anything with predict_on_batch() taking (n, BLOCK_LEN) float32 blocks and
+# returning n processed blocks.
+BLOCK_LEN = 512        # Corresponds to 32ms
+BLOCK_SHIFT = 128      # Corresponds to 8ms (75% overlap)
+DEFAULT_BATCH_SIZE = 1024 # Blocks per inference call in batched mode
+
+
+def process_audio(model, audio_data):
+    """Processes audio data through the DTLN model block by block."""
+    logging.info(f"Starting block processing for audio of length {len(audio_data)} samples.")
+    # Pre-allocate buffer for enhanced audio
+    out_file = np.zeros((len(audio_data)))
+    # Create buffer for processing blocks
+    in_buffer = np.zeros((BLOCK_LEN))
+    out_buffer = np.zeros((BLOCK_LEN))
+    # Calculate number of blocks
+    num_blocks = (audio_data.shape[0] - (BLOCK_LEN - BLOCK_SHIFT)) // BLOCK_SHIFT
+
+    logging.debug(f"Processing {num_blocks} blocks...")
+    # Iterate over blocks
+    for idx in range(num_blocks):
+        if (idx + 1) % 100 == 0:
+            logging.debug(f"Processed block {idx + 1}/{num_blocks}")
+        # Shift buffer
+        in_buffer[:-BLOCK_SHIFT] = in_buffer[BLOCK_SHIFT:]
+        # Read new audio data
+        in_buffer[-BLOCK_SHIFT:] = audio_data[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT]
+        # --- DTLN Processing --- #
+        # Expand dims for model (expects batch size 1)
+        in_block = np.expand_dims(in_buffer, axis=0).astype('float32')
+
+        # *** Use model.predict_on_batch() as potentially expected by DTLN_model ***
+        # (Check DTLN_model.py or run_evaluation.py if this causes issues)
+        # Process block through the model
+        # out_block = model.predict(in_block, batch_size=1) # Original
+        out_block = model.predict_on_batch(in_block) # Using predict_on_batch
+
+        # Squeeze batch dimension
+        out_block = np.squeeze(out_block, axis=0)
+        # --- Overlap-Add --- #
+        # Shift output buffer
+        out_buffer[:-BLOCK_SHIFT] = out_buffer[BLOCK_SHIFT:]
+        out_buffer[-BLOCK_SHIFT:] = np.zeros((BLOCK_SHIFT))
+        # Add new processed block
+        out_buffer += out_block
+        # Write output to file
+        out_file[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT] = out_buffer[:BLOCK_SHIFT]
+
+    logging.info(f"Finished block processing ({num_blocks} blocks processed).")
+    return out_file
+
+
+def frame_audio(audio_data):
+    """Frames audio into the (num_blocks, BLOCK_LEN) blocks seen by the per-block loop.
+
+    Block idx covers audio[idx * BLOCK_SHIFT - (BLOCK_LEN - BLOCK_SHIFT) : (idx + 1) * BLOCK_SHIFT],
+    with the samples before the start of the signal taken as zeros (the initial in_buffer state).
+    """
+    num_blocks = (audio_data.shape[0] - (BLOCK_LEN - BLOCK_SHIFT)) // BLOCK_SHIFT
+    if num_blocks <= 0:
+        return np.zeros((0, BLOCK_LEN), dtype='float32')
+    history = np.zeros(BLOCK_LEN - BLOCK_SHIFT, dtype='float32')
+    signal = np.concatenate((history, audio_data.astype('float32')))
+    # Strided view, no copy until the blocks are handed to the model
+    blocks = np.lib.stride_tricks.sliding_window_view(signal, BLOCK_LEN)[::BLOCK_SHIFT]
+    return blocks[:num_blocks]
+
+
+def overlap_add(out_blocks, num_samples):
+    """Overlap-adds processed blocks exactly like the shifting out_buffer in process_audio."""
+    num_blocks = out_blocks.shape[0]
+    hops_per_block = BLOCK_LEN // BLOCK_SHIFT
+    out_file = np.zeros((num_samples))
+    # Hop idx of the output is the sum of hop k of block (idx - k), k = 0..hops_per_block-1
+    hops = out_blocks.reshape(num_blocks, hops_per_block, BLOCK_SHIFT)
+    acc = np.zeros((num_blocks + hops_per_block, BLOCK_SHIFT))
+    for k in range(hops_per_block):
+        acc[k:k + num_blocks] += hops[:, k, :]
+    out_file[:num_blocks * BLOCK_SHIFT] = acc[:num_blocks].reshape(-1)
+    return out_file
+
+
+def process_audio_batched(model, audio_data, batch_size=DEFAULT_BATCH_SIZE):
+    """Processes audio data through the DTLN model with all blocks batched together.
+
+    The stateless model treats every block independently, so the blocks of the whole
+    signal are framed up front and run through the model in a few large calls.
+    """
+    blocks = frame_audio(audio_data)
+    num_blocks = blocks.shape[0]
+    logging.info(f"Starting batched processing of {num_blocks} blocks (batch size {batch_size}).")
+
+    out_blocks = np.zeros((num_blocks, BLOCK_LEN), dtype='float32')
+    for start in range(0, num_blocks, batch_size):
+        end = min(start + batch_size, num_blocks)
+        out_blocks[start:end] = model.predict_on_batch(np.ascontiguousarray(blocks[start:end]))
+
+    logging.info(f"Finished batched processing ({num_blocks} blocks processed).")
+    return overlap_add(out_blocks, len(audio_data))
+
+
+class BlockPool:
+    """Pools the blocks of many signals into shared inference batches of batch_blocks blocks.
+
+    A signal's blocks may be split over several batches. Once all of them are back,
+    finish(key, enhanced) is called with the overlap-added signal, as process_audio_batched()
+    returns it. Signals in a batch that failed are logged and never finished.
+    """
+
+    def __init__(self, model, batch_blocks, finish):
+        self.model = model
+        self.batch_blocks = batch_blocks
+        self.finish = finish
+        self._parts = [] # (item, start, end) slices of per-signal blocks in the current batch
+        self._fill = 0
+
+    def add(self, key, audio_data):
+        """Queues a signal, running every batch it fills up."""
+        blocks = frame_audio(audio_data)
+        item = {
+            'key': key,
+            'blocks': blocks,
+            'out_blocks': np.zeros((len(blocks), BLOCK_LEN), dtype='float32'),
+            'num_samples': len(audio_data),
+            'done': 0,
+            'failed': False,
+        }
+        if len(blocks) == 0:
+            self._finish(item)
+            return
+
+        # Split the signal's blocks over as many batches as needed
+        pos = 0
+        while pos < len(blocks):
+            take = min(self.batch_blocks - self._fill, len(blocks) - pos)
+            self._parts.append((item, pos, pos + take))
+            self._fill += take
+            pos += take
+            if self._fill == self.batch_blocks:
+                self._run_batch()
+
+    def close(self):
+        """Runs the last, partly filled batch."""
+        if self._parts:
+            self._run_batch()
+
+    def _finish(self, item):
+        self.finish(item['key'], overlap_add(item['out_blocks'], item['num_samples']))
+
+    def _run_batch(self):
+        in_batch = np.concatenate([item['blocks'][start:end] for item, start, end in self._parts])
+        try:
+            out_batch = self.model.predict_on_batch(in_batch)
+        except Exception as e:
+            logging.error(f"Error running batch of {len(in_batch)} blocks: {e}")
+            for item, _, _ in self._parts:
+                item['failed'] = True
+            out_batch = np.zeros_like(in_batch)
+        offset = 0
+        for item, start, end in self._parts:
+            item['out_blocks'][start:end] = out_batch[offset:offset + end - start]
+            offset += end - start
+            item['done'] += end - start
+            if item['done'] == len(item['blocks']) and not item['failed']:
+                self._finish(item)
+        logging.debug(f"Ran batch of {len(in_batch)} blocks from {len(self._parts)} part(s).")
+        self._parts.clear()
+        self._fill = 0
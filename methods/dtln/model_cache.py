@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+import hashlib
+import sys
+import logging
+import tensorflow as tf
+
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils.hashing import file_sha256
+
+CACHE_FORMAT_VERSION = 1 # Bump when the layout of a cache entry changes
+
+
+def cache_key(weights_path, norm_stft, block_len, block_shift):
+    """Returns (key, key_fields) built from everything that changes the compiled model."""
+    key_fields = {
+        'format': CACHE_FORMAT_VERSION,
+        'weights_sha256': file_sha256(weights_path),
+        'norm_stft': bool(norm_stft),
+        'block_len': block_len,
+        'block_shift': block_shift,
+        'tensorflow': tf.__version__,
+    }
+    return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode('utf-8')).hexdigest()[:16], key_fields
+
+
+class CachedDTLNModel:
+    """Inference-only stand-in for the Keras model, backed by a cached SavedModel.
+
+    Exposes predict_on_batch() so the block, batched and corpus paths in run.py
+    can use it unchanged.
+    """
+
+    def __init__(self, loaded):
+        self._loaded = loaded
+        self._infer = loaded.infer
+
+    def predict_on_batch(self, in_blocks):
+        return self._infer(tf.convert_to_tensor(in_blocks, dtype=tf.float32)).numpy()
+
+
+def load_from_cache(cache_dir, key):
+    """Loads a cached model, or returns None if there's no usable entry for the key."""
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return None
+    try:
+        return CachedDTLNModel(tf.saved_model.load(entry_dir))
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable model cache entry {entry_dir}: {e}")
+        return None
+
+
+def save_to_cache(keras_model, cache_dir, key, key_fields, block_len):
+    """Saves the Keras model as a SavedModel with one concrete inference function.
+
+    The entry is written to a temporary directory and renamed into place, so
+    concurrent workers never see a partial entry.
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    os.makedirs(cache_dir, exist_ok=True)
+
+    module = tf.Module()
+    module.dtln_variables = list(keras_model.weights) # Track the weights so they are saved
+    module.infer = tf.function(
+        lambda in_blocks: keras_model(in_blocks, training=False),
+        input_signature=[tf.TensorSpec(shape=[None, block_len], dtype=tf.float32)],
+    )
+    try:
+        tf.saved_model.save(module, tmp_dir)
+        with open(os.path.join(tmp_dir, 'cache_key.json'), 'w') as f:
+            json.dump(key_fields, f, indent=2, sort_keys=True)
+        os.rename(tmp_dir, entry_dir)
+        logging.info(f"Saved compiled model to cache: {entry_dir}")
+    except OSError:
+        # Another worker finished the same entry first
+        logging.info(f"Model cache entry {entry_dir} already exists.")
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -1,3 +1,5 @@
+import time
+STARTUP_T0 = time.perf_counter() # Startup time is logged once the model is ready
 import os
 import glob
 import argparse
@@ -6,6 +8,7 @@ import numpy as np
 import soundfile as sf
 import tensorflow as tf
 import sys
+TF_IMPORTED_T = time.perf_counter()
 
 # Add the DTLN library path to sys.path to import its modules if needed
 # Adjust the path if your DTLN repo is located elsewhere
@@ -13,102 +16,95 @@ DTLN_LIB_PATH = os.path.join(os.path.dirname(__file__), 'lib', 'DTLN')
 if DTLN_LIB_PATH not in sys.path:
     sys.path.append(DTLN_LIB_PATH)
 
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
 # Attempt to import DTLN utilities if available and needed, otherwise use direct TF/Numpy
 from DTLN_model import DTLN_model # Import the DTLN model class
+from blocks import BLOCK_LEN, BLOCK_SHIFT, DEFAULT_BATCH_SIZE, BlockPool, process_audio, process_audio_batched
+from model_cache import cache_key, load_from_cache, save_to_cache
+from streaming import DTLNStreamingEngine, export_tflite, tflite_model_paths, summarize_hop_times, log_latency_stats
+from utils.method_registry import method_sample_rate, method_rate_suffix
+from preparation import ensure_prepared
+from utils.corpus_store import list_inputs, input_filename, input_num_samples, read_input
+from utils.output_spectrograms import SPECTROGRAM_MODES, OutputSpectrograms
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants - Copied from DTLN common practices
-SAMPLE_RATE = 16000
-SAMPLE_RATE_KEY = "_16k" # To identify correct input files
-BLOCK_LEN = 512        # Corresponds to 32ms
-BLOCK_SHIFT = 128      # Corresponds to 8ms (75% overlap)
+SAMPLE_RATE = method_sample_rate("dtln") # 16 kHz
+SAMPLE_RATE_KEY = method_rate_suffix("dtln") # To identify correct input files
+DEFAULT_BATCH_MEMORY_MB = 64 # Input + output block memory per batch in corpus mode
+BYTES_PER_BLOCK = 2 * BLOCK_LEN * 4 # float32 input and output block
 
 DEFAULT_INPUT_DIR = "../../assets/prepared"
 DEFAULT_OUTPUT_DIR = "./output"
+DEFAULT_TFLITE_DIR = os.path.join(os.path.dirname(__file__), "tflite") # Exported streaming models
+DEFAULT_MODEL_CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache") # Compiled SavedModel entries
 # Use the specific model file path from the command line argument or default
 # DEFAULT_MODEL_PATH = os.path.join(DTLN_LIB_PATH, "pretrained_model/", "DTLN_norm_500h.h5")
 
 
-def process_audio(model, audio_data):
-    """Processes audio data through the DTLN model block by block."""
-    logging.info(f"Starting block processing for audio of length {len(audio_data)} samples.")
-    # Pre-allocate buffer for enhanced audio
-    out_file = np.zeros((len(audio_data)))
-    # Create buffer for processing blocks
-    in_buffer = np.zeros((BLOCK_LEN))
-    out_buffer = np.zeros((BLOCK_LEN))
-    # Calculate number of blocks
-    num_blocks = (audio_data.shape[0] - (BLOCK_LEN - BLOCK_SHIFT)) // BLOCK_SHIFT
-
-    logging.debug(f"Processing {num_blocks} blocks...")
-    # Iterate over blocks
-    for idx in range(num_blocks):
-        if (idx + 1) % 100 == 0:
-            logging.debug(f"Processed block {idx + 1}/{num_blocks}")
-        # Shift buffer
-        in_buffer[:-BLOCK_SHIFT] = in_buffer[BLOCK_SHIFT:]
-        # Read new audio data
-        in_buffer[-BLOCK_SHIFT:] = audio_data[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT]
-        # --- DTLN Processing --- #
-        # Expand dims for model (expects batch size 1)
-        in_block = np.expand_dims(in_buffer, axis=0).astype('float32')
-
-        # *** Use model.predict_on_batch() as potentially expected by DTLN_model ***
-        # (Check DTLN_model.py or run_evaluation.py if this causes issues)
-        # Process block through the model
-        # out_block = model.predict(in_block, batch_size=1) # Original
-        out_block = model.predict_on_batch(in_block) # Using predict_on_batch
-
-        # Squeeze batch dimension
-        out_block = np.squeeze(out_block, axis=0)
-        # --- Overlap-Add --- #
-        # Shift output buffer
-        out_buffer[:-BLOCK_SHIFT] = out_buffer[BLOCK_SHIFT:]
-        out_buffer[-BLOCK_SHIFT:] = np.zeros((BLOCK_SHIFT))
-        # Add new processed block
-        out_buffer += out_block
-        # Write output to file
-        out_file[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT] = out_buffer[:BLOCK_SHIFT]
-
-    logging.info(f"Finished block processing ({num_blocks} blocks processed).")
-    return out_file
-
-
-def process_file(model, input_path, output_path):
-    """Loads an audio file, processes it, and saves the result."""
-    try:
-        logging.info(f"Processing {input_path}...")
-        # Load audio file
-        audio, sr = sf.read(input_path, dtype='float32')
+def load_padded_audio(input_path):
+    """Loads a prepared file (or corpus store clip) and pads it for block processing.
 
-        if sr != SAMPLE_RATE:
-            logging.warning(f"Input sample rate {sr} doesn't match expected {SAMPLE_RATE}. Skipping file.")
-            # Optionally, add resampling here if needed, but preparation.py should handle it.
-            return
+    Returns (padded_audio, len_orig), or None if the file can't be used.
+    """
+    # Load audio file, or map the clip from the corpus store
+    audio, sr = read_input(input_path)
 
-        if len(audio.shape) > 1:
-            logging.warning("Audio is not mono, converting to mono by averaging channels.")
-            audio = np.mean(audio, axis=1)
+    if sr != SAMPLE_RATE:
+        logging.warning(f"Input sample rate {sr} doesn't match expected {SAMPLE_RATE}. Skipping file.")
+        # Optionally, add resampling here if needed, but preparation.py should handle it.
+        return None
 
-        # *** Pad audio similar to run_evaluation.py for potential stateful model ***
-        # (This assumes the model might be stateful or requires specific padding)
-        # get length of file
-        len_orig = len(audio)
-        # pad audio
-        zero_pad = np.zeros(BLOCK_LEN) # Pad with block length
-        audio = np.concatenate((zero_pad, audio, zero_pad), axis=0)
+    if len(audio.shape) > 1:
+        logging.warning("Audio is not mono, converting to mono by averaging channels.")
+        audio = np.mean(audio, axis=1)
 
-        # Process the padded audio data
-        enhanced_audio_padded = process_audio(model, audio)
+    # *** Pad audio similar to run_evaluation.py for potential stateful model ***
+    # (This assumes the model might be stateful or requires specific padding)
+    # get length of file
+    len_orig = len(audio)
+    # pad audio
+    zero_pad = np.zeros(BLOCK_LEN) # Pad with block length
+    audio = np.concatenate((zero_pad, audio, zero_pad), axis=0)
+    return audio, len_orig
 
-        # *** Unpad the enhanced audio ***
-        enhanced_audio = enhanced_audio_padded[BLOCK_LEN : BLOCK_LEN + len_orig]
 
+def save_enhanced_audio(enhanced_audio_padded, len_orig, output_path, spectrograms=None):
+    """Unpads the enhanced audio and saves it (and hands it to spectrograms, if given)."""
+    # *** Unpad the enhanced audio ***
+    enhanced_audio = enhanced_audio_padded[BLOCK_LEN : BLOCK_LEN + len_orig]
 
-        # Save the enhanced audio file
-        sf.write(output_path, enhanced_audio, SAMPLE_RATE)
-        logging.info(f"Saved enhanced audio to {output_path}")
+    # Save the enhanced audio file
+    sf.write(output_path, enhanced_audio, SAMPLE_RATE)
+    logging.info(f"Saved enhanced audio to {output_path}")
+    if spectrograms is not None:
+        spectrograms.add(output_path, enhanced_audio, SAMPLE_RATE)
+
+
+def process_file(model, input_path, output_path, batch_size=DEFAULT_BATCH_SIZE, spectrograms=None):
+    """Loads an audio file, processes it, and saves the result.
+
+    A batch_size of 0 selects the original block-by-block path.
+    """
+    try:
+        logging.info(f"Processing {input_path}...")
+        loaded = load_padded_audio(input_path)
+        if loaded is None:
+            return
+        audio, len_orig = loaded
+
+        # Process the padded audio data
+        if batch_size > 0:
+            enhanced_audio_padded = process_audio_batched(model, audio, batch_size)
+        else:
+            enhanced_audio_padded = process_audio(model, audio)
+
+        save_enhanced_audio(enhanced_audio_padded, len_orig, output_path, spectrograms)
 
     except Exception as e:
         logging.error(f"Error processing {input_path}: {e}")
@@ -117,33 +113,77 @@ def process_file(model, input_path, output_path):
         # logging.error(traceback.format_exc())
 
 
-def main(input_dir, output_dir, model_path):
-    """Finds prepared 16k audio files and processes them with DTLN."""
-    logging.info(f"Starting DTLN processing...")
-    logging.info(f"Input directory: {input_dir}")
-    logging.info(f"Output directory: {output_dir}")
-    logging.info(f"Model path: {model_path}")
+def process_file_streaming(engine, input_path, output_path, spectrograms=None):
+    """Processes a file hop by hop through the stateful streaming engine and saves the result."""
+    try:
+        logging.info(f"Streaming {input_path}...")
+        loaded = load_padded_audio(input_path)
+        if loaded is None:
+            return
+        audio, len_orig = loaded
 
-    if not os.path.exists(model_path):
-        logging.error(f"DTLN model weights file not found at {model_path}.")
-        # logging.error("You might need to download it or check the path in methods/dtln/lib/DTLN/models/")
-        return
+        engine.reset()
+        out_file = np.zeros((len(audio)))
+        num_blocks = (audio.shape[0] - (BLOCK_LEN - BLOCK_SHIFT)) // BLOCK_SHIFT
+        for idx in range(num_blocks):
+            hop = audio[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT]
+            out_file[idx * BLOCK_SHIFT : idx * BLOCK_SHIFT + BLOCK_SHIFT] = engine.process_hop(hop)
 
-    os.makedirs(output_dir, exist_ok=True)
+        log_latency_stats(engine.latency_stats(), f"Per-hop latency for {input_filename(input_path)}")
+        save_enhanced_audio(out_file, len_orig, output_path, spectrograms)
 
-    # Find only the 16k prepared files
-    search_pattern = os.path.join(input_dir, f"*{SAMPLE_RATE_KEY}.wav")
-    audio_files = glob.glob(search_pattern)
+    except Exception as e:
+        logging.error(f"Error processing {input_path}: {e}")
 
-    if not audio_files:
-        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {input_dir}. Did you run preparation.py?")
-        return
 
-    logging.info(f"Found {len(audio_files)} audio file(s) to process.")
+def process_corpus(model, jobs, batch_memory_mb=DEFAULT_BATCH_MEMORY_MB, spectrograms=None):
+    """Processes many files with their blocks pooled into shared inference batches.
+
+    Args:
+        model: Stateless DTLN Keras model.
+        jobs: List of (input_path, output_path) tuples.
+        batch_memory_mb: Budget for the input and output block arrays of one batch.
+        spectrograms: OutputSpectrograms for the written files, or None.
+    """
+    batch_blocks = max(1, int(batch_memory_mb * 1024 * 1024) // BYTES_PER_BLOCK)
+    logging.info(f"Corpus mode: {len(jobs)} file(s), up to {batch_blocks} blocks per batch ({batch_memory_mb} MB).")
+
+    # Length bucketing: files of similar length complete in the same batches,
+    # so their pending blocks are written out and released early.
+    jobs = sorted(jobs, key=lambda job: input_num_samples(job[0]))
+
+    def finish(key, enhanced_audio_padded):
+        output_path, len_orig = key
+        try:
+            save_enhanced_audio(enhanced_audio_padded, len_orig, output_path, spectrograms)
+        except Exception as e:
+            logging.error(f"Error saving {output_path}: {e}")
+
+    pool = BlockPool(model, batch_blocks, finish)
+    for input_path, output_path in jobs:
+        try:
+            logging.info(f"Queueing {input_path}...")
+            loaded = load_padded_audio(input_path)
+        except Exception as e:
+            logging.error(f"Error processing {input_path}: {e}")
+            continue
+        if loaded is None:
+            continue
+        audio, len_orig = loaded
+        pool.add((output_path, len_orig), audio)
+    pool.close()
 
-    # Load the DTLN model using the library's method
+    logging.info("Corpus processing finished.")
+
+
+def load_keras_model(model_path, model_cache_dir=None):
+    """Builds the stateless DTLN model and loads its weights. Returns None on failure.
+
+    With a model_cache_dir, a compiled SavedModel keyed by the weights hash, norm_stft,
+    BLOCK_LEN and BLOCK_SHIFT is loaded instead of rebuilding the graph, and written
+    there after the first build.
+    """
     try:
-        logging.info("Building DTLN model structure...")
         # Determine if normalization is used based on model filename convention
         if model_path.find('_norm_') != -1:
             norm_stft = True
@@ -152,6 +192,15 @@ def main(input_dir, output_dir, model_path):
             norm_stft = False
             logging.info("Detected model does not use STFT normalization.")
 
+        if model_cache_dir:
+            key, key_fields = cache_key(model_path, norm_stft, BLOCK_LEN, BLOCK_SHIFT)
+            cached_model = load_from_cache(model_cache_dir, key)
+            if cached_model is not None:
+                logging.info(f"Loaded compiled DTLN model from cache entry {key}.")
+                return cached_model
+            logging.info(f"No model cache entry {key}, building the model.")
+
+        logging.info("Building DTLN model structure...")
         # Create class instance
         modelClass = DTLN_model()
         # Set constants based on the script's values (might be redundant if DTLN_model uses defaults)
@@ -163,17 +212,79 @@ def main(input_dir, output_dir, model_path):
         logging.info(f"Loading model weights from {model_path}...")
         modelClass.model.load_weights(model_path)
         logging.info("DTLN model loaded successfully.")
-        model_for_processing = modelClass.model # Get the actual Keras model
+
+        if model_cache_dir:
+            try:
+                save_to_cache(modelClass.model, model_cache_dir, key, key_fields, BLOCK_LEN)
+            except Exception as e:
+                logging.warning(f"Could not write model cache entry {key}: {e}")
+
+        return modelClass.model # Get the actual Keras model
 
     except Exception as e:
         logging.error(f"Error loading DTLN model from {model_path}: {e}")
         # Optionally log traceback
         # import traceback
         # logging.error(traceback.format_exc())
+        return None
+
+
+def main(input_dir, output_dir, model_path, batch_size=DEFAULT_BATCH_SIZE,
+         corpus=False, batch_memory_mb=DEFAULT_BATCH_MEMORY_MB,
+         engine="keras", tflite_model=None, tflite_threads=1,
+         model_cache_dir=DEFAULT_MODEL_CACHE_DIR, corpus_store=None, spectrograms=None):
+    """Finds prepared 16k audio files and processes them with DTLN."""
+    logging.info(f"Starting DTLN processing...")
+    logging.info(f"Input directory: {input_dir}")
+    logging.info(f"Output directory: {output_dir}")
+    logging.info(f"Model path: {model_path}")
+    if engine == "tflite":
+        logging.info(f"Processing mode: TFLite streaming engine, one {BLOCK_SHIFT}-sample hop per call")
+    elif corpus:
+        logging.info(f"Processing mode: corpus (batch memory {batch_memory_mb} MB)")
+    else:
+        logging.info(f"Processing mode: {f'batched (batch size {batch_size})' if batch_size > 0 else 'block by block'}")
+
+    if not os.path.exists(model_path):
+        logging.error(f"DTLN model weights file not found at {model_path}.")
+        # logging.error("You might need to download it or check the path in methods/dtln/lib/DTLN/models/")
         return
 
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Find only the 16k prepared files (or the 16k clips of the corpus store)
+    audio_files = list_inputs(input_dir, SAMPLE_RATE, corpus_store)
+
+    if not audio_files:
+        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {corpus_store or input_dir}. Did you run preparation.py?")
+        return
+
+    logging.info(f"Found {len(audio_files)} audio file(s) to process.")
+
+    if engine == "tflite":
+        # Streaming engine: export the stateful two-stage model once, then reuse it
+        if tflite_model is None:
+            tflite_model = os.path.join(DEFAULT_TFLITE_DIR, os.path.splitext(os.path.basename(model_path))[0])
+        try:
+            if not all(os.path.exists(p) for p in tflite_model_paths(tflite_model)):
+                export_tflite(model_path, tflite_model)
+            logging.info(f"Loading TFLite streaming engine from {tflite_model}_[1|2].tflite ({tflite_threads} thread(s))...")
+            streaming_engine = DTLNStreamingEngine(tflite_model, num_threads=tflite_threads)
+        except Exception as e:
+            logging.error(f"Error preparing TFLite streaming engine from {model_path}: {e}")
+            return
+    else:
+        model_for_processing = load_keras_model(model_path, model_cache_dir)
+        if model_for_processing is None:
+            return
+
+    ready_t = time.perf_counter()
+    logging.info(f"Startup took {ready_t - STARTUP_T0:.2f} s "
+                 f"(TensorFlow import {TF_IMPORTED_T - STARTUP_T0:.2f} s, model ready after {ready_t - TF_IMPORTED_T:.2f} s).")
+
+    jobs = []
     for input_file in audio_files:
-        filename = os.path.basename(input_file)
+        filename = input_filename(input_file)
         # Construct output path
         output_filename = filename.replace(SAMPLE_RATE_KEY, "_dtln_enhanced")
         output_path = os.path.join(output_dir, output_filename)
@@ -181,9 +292,22 @@ def main(input_dir, output_dir, model_path):
         if os.path.exists(output_path):
             logging.info(f"Skipping {output_path}, file already exists.")
             continue
-
-        # Pass the loaded Keras model to process_file
-        process_file(model_for_processing, input_file, output_path)
+        jobs.append((input_file, output_path))
+
+    # Spectrograms of the outputs, rendered from memory (spectrograms: None, 'inline' or 'background')
+    with OutputSpectrograms(spectrograms) as output_spectrograms:
+        if engine == "tflite":
+            hop_times_ms = []
+            for input_file, output_path in jobs:
+                process_file_streaming(streaming_engine, input_file, output_path, output_spectrograms)
+                hop_times_ms.extend(streaming_engine.hop_times_ms)
+            log_latency_stats(summarize_hop_times(hop_times_ms), "Per-hop latency over all files")
+        elif corpus:
+            process_corpus(model_for_processing, jobs, batch_memory_mb, output_spectrograms)
+        else:
+            for input_file, output_path in jobs:
+                # Pass the loaded Keras model to process_file
+                process_file(model_for_processing, input_file, output_path, batch_size, output_spectrograms)
 
     logging.info("DTLN processing finished.")
 
@@ -199,13 +323,42 @@ if __name__ == "__main__":
                         help=f"Directory to save enhanced audio files (default: {DEFAULT_OUTPUT_DIR})")
     parser.add_argument("--model", type=str, default=DEFAULT_MODEL_PATH,
                         help=f"Path to the DTLN model weights file (.h5) (default: {DEFAULT_MODEL_PATH})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Blocks per inference call; 0 processes block by block like the original loop (default: {DEFAULT_BATCH_SIZE})")
+
+    parser.add_argument("--corpus", action="store_true",
+                        help="Pool the blocks of all files into shared inference batches (for many short clips)")
+    parser.add_argument("--batch-memory-mb", type=float, default=DEFAULT_BATCH_MEMORY_MB,
+                        help=f"Memory budget for the block arrays of one batch in --corpus mode (default: {DEFAULT_BATCH_MEMORY_MB})")
+    parser.add_argument("--engine", type=str, choices=["keras", "tflite"], default="keras",
+                        help="keras: stateless model on whole blocks; tflite: stateful streaming engine fed one 128-sample hop at a time (default: keras)")
+    parser.add_argument("--tflite-model", type=str, default=None,
+                        help="Prefix of the exported <prefix>_1.tflite/<prefix>_2.tflite models; exported from --model if missing (default: tflite/<weights name>)")
+    parser.add_argument("--tflite-threads", type=int, default=1,
+                        help="Interpreter threads for the streaming engine (default: 1, the real-time target)")
+    parser.add_argument("--model-cache-dir", type=str, default=DEFAULT_MODEL_CACHE_DIR,
+                        help=f"Directory for compiled model cache entries (default: {DEFAULT_MODEL_CACHE_DIR})")
+    parser.add_argument("--no-model-cache", action="store_true",
+                        help="Always build the Keras model from the weights file")
+    parser.add_argument("--corpus-store", type=str, default=None, metavar="DIR",
+                        help="Read the 16k clips from this memory-mapped corpus store (preparation.py --corpus-store) instead of --input-dir")
+    parser.add_argument("--spectrograms", choices=SPECTROGRAM_MODES, default=None,
+                        help="Also render each output's spectrogram for summary.py from memory, in this process (inline) or on a background thread")
+    parser.add_argument("--no-prepare", action="store_true",
+                        help="Don't build missing or stale 16k inputs in assets/prepared (preparation.py) before processing")
 
     args = parser.parse_args()
 
+    if not args.corpus_store and not args.no_prepare:
+        ensure_prepared(args.input_dir, SAMPLE_RATE) # Creates the prepared directory if needed
+
     # Basic input validation
-    if not os.path.isdir(args.input_dir):
+    if not args.corpus_store and not os.path.isdir(args.input_dir):
         logging.error(f"Input directory not found: {args.input_dir}")
         sys.exit(1)
     # Model path validation moved inside main()
 
-    main(args.input_dir, args.output_dir, args.model)
+    main(args.input_dir, args.output_dir, args.model, args.batch_size,
+         args.corpus, args.batch_memory_mb,
+         args.engine, args.tflite_model, args.tflite_threads,
+         None if args.no_model_cache else args.model_cache_dir, args.corpus_store, args.spectrograms)
@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import logging
+import numpy as np
+import tensorflow as tf
+
+# Add the DTLN library path to sys.path to import its modules
+DTLN_LIB_PATH = os.path.join(os.path.dirname(__file__), 'lib', 'DTLN')
+if DTLN_LIB_PATH not in sys.path:
+    sys.path.append(DTLN_LIB_PATH)
+
+from DTLN_model import DTLN_model # Import the DTLN model class
+
+# Constants - must match run.py
+SAMPLE_RATE = 16000
+BLOCK_LEN = 512        # Corresponds to 32ms
+BLOCK_SHIFT = 128      # Corresponds to 8ms (75% overlap)
+HOP_BUDGET_MS = 1000.0 * BLOCK_SHIFT / SAMPLE_RATE # Real-time budget for one hop (8 ms)
+
+
+def tflite_model_paths(model_prefix):
+    """Returns the paths of the two TFLite models written for a prefix."""
+    return model_prefix + '_1.tflite', model_prefix + '_2.tflite'
+
+
+def export_tflite(weights_path, model_prefix):
+    """Exports the stateful two-stage DTLN model to <prefix>_1.tflite and <prefix>_2.tflite.
+
+    Uses the DTLN library's converter, which builds the stateful model, loads the
+    weights and splits it at the complex-valued masking step that TFLite can't run.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(model_prefix)), exist_ok=True)
+    logging.info(f"Exporting stateful DTLN model from {weights_path} to {model_prefix}_[1|2].tflite...")
+    modelClass = DTLN_model()
+    modelClass.blockLen = BLOCK_LEN
+    modelClass.block_shift = BLOCK_SHIFT
+    # Detects STFT normalization from the weights file name, like run.py does
+    modelClass.create_tf_lite_model(weights_path, model_prefix)
+    logging.info("TFLite export finished.")
+
+
+def _split_details(details):
+    """Splits interpreter tensor details into (audio, states); states are the 4-D tensors."""
+    audio = next(d for d in details if len(d['shape']) != 4)
+    states = next(d for d in details if len(d['shape']) == 4)
+    return audio, states
+
+
+class DTLNStreamingEngine:
+    """Real-time DTLN: takes one BLOCK_SHIFT hop and returns BLOCK_SHIFT enhanced samples.
+
+    Runs the two TFLite stages of the stateful model and carries both LSTM states
+    between calls, so each hop costs one FFT, two small interpreter invocations
+    and one inverse FFT. Output is aligned like the block loop in run.py.
+    """
+
+    def __init__(self, model_prefix, num_threads=1):
+        model_1_path, model_2_path = tflite_model_paths(model_prefix)
+        self.interpreter_1 = tf.lite.Interpreter(model_path=model_1_path, num_threads=num_threads)
+        self.interpreter_1.allocate_tensors()
+        self.interpreter_2 = tf.lite.Interpreter(model_path=model_2_path, num_threads=num_threads)
+        self.interpreter_2.allocate_tensors()
+
+        self._in_1, self._in_states_1 = _split_details(self.interpreter_1.get_input_details())
+        self._out_1, self._out_states_1 = _split_details(self.interpreter_1.get_output_details())
+        self._in_2, self._in_states_2 = _split_details(self.interpreter_2.get_input_details())
+        self._out_2, self._out_states_2 = _split_details(self.interpreter_2.get_output_details())
+
+        self.hop_times_ms = []
+        self.reset()
+
+    def reset(self):
+        """Clears the audio buffers, the LSTM states and the latency log."""
+        self._states_1 = np.zeros(self._in_states_1['shape'], dtype='float32')
+        self._states_2 = np.zeros(self._in_states_2['shape'], dtype='float32')
+        self._in_buffer = np.zeros((BLOCK_LEN), dtype='float32')
+        self._out_buffer = np.zeros((BLOCK_LEN), dtype='float32')
+        self.hop_times_ms = []
+
+    def process_hop(self, hop):
+        """Processes one hop of BLOCK_SHIFT samples and returns BLOCK_SHIFT enhanced samples."""
+        start = time.perf_counter()
+
+        # Shift in the new samples
+        self._in_buffer[:-BLOCK_SHIFT] = self._in_buffer[BLOCK_SHIFT:]
+        self._in_buffer[-BLOCK_SHIFT:] = hop
+
+        # Stage 1: magnitude mask in the frequency domain
+        in_block_fft = np.fft.rfft(self._in_buffer)
+        in_mag = np.abs(in_block_fft)
+        in_phase = np.angle(in_block_fft)
+        in_mag = np.reshape(in_mag, (1, 1, -1)).astype('float32')
+        self.interpreter_1.set_tensor(self._in_states_1['index'], self._states_1)
+        self.interpreter_1.set_tensor(self._in_1['index'], in_mag)
+        self.interpreter_1.invoke()
+        out_mask = self.interpreter_1.get_tensor(self._out_1['index'])
+        self._states_1 = self.interpreter_1.get_tensor(self._out_states_1['index'])
+
+        # Complex masking happens outside the model (TFLite has no complex support)
+        estimated_complex = in_mag * out_mask * np.exp(1j * in_phase)
+        estimated_block = np.fft.irfft(estimated_complex)
+        estimated_block = np.reshape(estimated_block, (1, 1, -1)).astype('float32')
+
+        # Stage 2: time-domain refinement
+        self.interpreter_2.set_tensor(self._in_states_2['index'], self._states_2)
+        self.interpreter_2.set_tensor(self._in_2['index'], estimated_block)
+        self.interpreter_2.invoke()
+        out_block = self.interpreter_2.get_tensor(self._out_2['index'])
+        self._states_2 = self.interpreter_2.get_tensor(self._out_states_2['index'])
+
+        # Overlap-add
+        self._out_buffer[:-BLOCK_SHIFT] = self._out_buffer[BLOCK_SHIFT:]
+        self._out_buffer[-BLOCK_SHIFT:] = 0.0
+        self._out_buffer += np.squeeze(out_block)
+        out_hop = self._out_buffer[:BLOCK_SHIFT].copy()
+
+        self.hop_times_ms.append(1000.0 * (time.perf_counter() - start))
+        return out_hop
+
+    def latency_stats(self):
+        """Summarizes the per-hop processing times recorded since the last reset."""
+        return summarize_hop_times(self.hop_times_ms)
+
+
+def summarize_hop_times(hop_times_ms):
+    """Returns latency statistics for a list of per-hop times, or None if it's empty."""
+    if len(hop_times_ms) == 0:
+        return None
+    times = np.asarray(hop_times_ms)
+    return {
+        'hops': len(times),
+        'mean_ms': float(np.mean(times)),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'p99_ms': float(np.percentile(times, 99)),
+        'max_ms': float(np.max(times)),
+        'budget_ms': HOP_BUDGET_MS,
+        'over_budget': int(np.sum(times > HOP_BUDGET_MS)),
+    }
+
+
+def log_latency_stats(stats, label):
+    """Logs latency statistics against the real-time hop budget."""
+    if stats is None:
+        logging.info(f"{label}: no hops processed.")
+        return
+    logging.info(
+        f"{label}: {stats['hops']} hops, mean {stats['mean_ms']:.3f} ms, p50 {stats['p50_ms']:.3f} ms, "
+        f"p95 {stats['p95_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms "
+        f"(budget {stats['budget_ms']:.1f} ms, {stats['over_budget']} hop(s) over budget)"
+    )
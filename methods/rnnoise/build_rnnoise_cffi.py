@@ -23,6 +23,9 @@ cdef_source = r"""
     RNNModel *rnnoise_model_from_file(FILE *f);
     RNNModel *rnnoise_model_from_filename(const char *filename);
     void rnnoise_model_free(RNNModel *model);
+
+    // Whole-buffer helper defined in the set_source() code below
+    int rnnoise_process_buffer(DenoiseState *st, float *out, const float *in, int num_frames, float *vad);
 """
 
 # Create an FFI builder instance
@@ -59,6 +62,19 @@ relative_lib_path = os.path.relpath(rnnoise_compiled_libs_dir, output_dir)
 ffibuilder.set_source(cffi_module_name,
     r"""
         #include <rnnoise.h> // Include the actual header
+
+        /* Denoises num_frames consecutive frames in one foreign call.
+           in and out hold num_frames * rnnoise_get_frame_size() samples (out may alias in),
+           vad receives one voice activity probability per frame. Returns the frame count. */
+        static int rnnoise_process_buffer(DenoiseState *st, float *out, const float *in, int num_frames, float *vad)
+        {
+            const int frame_size = rnnoise_get_frame_size();
+            int i;
+            for (i = 0; i < num_frames; i++) {
+                vad[i] = rnnoise_process_frame(st, out + (size_t)i * frame_size, in + (size_t)i * frame_size);
+            }
+            return num_frames;
+        }
     """,
     # rnnoise.h is usually in the root of the source dir after configure
     # UPDATE: Found it in the include/ subdirectory
@@ -1,6 +1,7 @@
 import numpy as np
 from _rnnoise_cffi import ffi, lib
 import os
+import logging
 from typing import Union, Tuple
 
 # Constants based on RNNoise
@@ -8,17 +9,33 @@ FRAME_SIZE_MS = 10
 # RNNoise C lib operates at 48kHz internally
 RNNOISE_SAMPLE_RATE = 48000
 SAMPLES_PER_FRAME = (RNNOISE_SAMPLE_RATE // 1000) * FRAME_SIZE_MS # Should be 480
+# Modules built before build_rnnoise_cffi.py defined the C loop don't have it;
+# process_buffer() then calls rnnoise_process_frame once per frame instead, and
+# warns once per process that the module needs rebuilding
+HAS_PROCESS_BUFFER = hasattr(lib, 'rnnoise_process_buffer')
+_fallback_warned = False
 
 class RNNoiseCFFIError(Exception):
     pass
 
 class RNNoiseCFFI:
-    def __init__(self, model_path: Union[str, None] = None):
+    def __init__(self, model_path: Union[str, None] = None, model_buffer=None):
+        """
+        Args:
+            model_path: Optional path of a weights file (e.g. weights_blob.bin).
+            model_buffer: Optional buffer holding the weights (bytes, or an mmap of
+                          weights_blob.bin so that processes share the pages). The
+                          model points into the buffer, so a reference is kept.
+        """
         self._model = None
         self._state = None
         self._destroyed = False
         self._state_created_internally = False # Flag to track how state was created
+        self._model_buffer = None
         
+        if model_path and model_buffer is not None:
+            raise RNNoiseCFFIError("Pass either model_path or model_buffer, not both.")
+
         if model_path:
             if not os.path.exists(model_path):
                  raise RNNoiseCFFIError(f"Model file not found: {model_path}")
@@ -30,20 +47,15 @@ class RNNoiseCFFI:
             self._model = lib.rnnoise_model_from_filename(c_model_path)
             if not self._model:
                 raise RNNoiseCFFIError(f"Failed to load RNNoise model from {model_path}")
-            
-            # Use rnnoise_init with the loaded model
-            # Get the size needed for the state
-            state_size = lib.rnnoise_get_size()
-            # Allocate memory for the state
-            # Keep the buffer around to prevent GC
-            self._state_buffer = ffi.new(f"char[{state_size}]") 
-            self._state = ffi.cast("DenoiseState *", self._state_buffer)
-            
-            ret = lib.rnnoise_init(self._state, self._model)
-            if ret != 0:
-                 if self._model: lib.rnnoise_model_free(self._model) # Clean up model if init fails
-                 raise RNNoiseCFFIError(f"Failed to initialize RNNoise state with model {model_path}")
-            self._state_created_internally = False # State initialized in buffer, not created by lib
+            self._init_state_with_model(model_path)
+        elif model_buffer is not None:
+            # The C model references the weights in place instead of copying them
+            self._model_buffer = model_buffer
+            self._model_buffer_ptr = ffi.from_buffer(model_buffer)
+            self._model = lib.rnnoise_model_from_buffer(self._model_buffer_ptr, len(self._model_buffer_ptr))
+            if not self._model:
+                raise RNNoiseCFFIError("Failed to load RNNoise model from buffer")
+            self._init_state_with_model("buffer")
         else:
             # Create RNNoise state using the default built-in model
             self._state = lib.rnnoise_create(ffi.NULL) 
@@ -51,6 +63,22 @@ class RNNoiseCFFI:
                 raise RNNoiseCFFIError("Failed to create RNNoise state with default model.")
             self._state_created_internally = True # State created (and allocated) by lib
 
+    def _init_state_with_model(self, model_source):
+        # Use rnnoise_init with the loaded model
+        # Get the size needed for the state
+        state_size = lib.rnnoise_get_size()
+        # Allocate memory for the state
+        # Keep the buffer around to prevent GC
+        self._state_buffer = ffi.new(f"char[{state_size}]") 
+        self._state = ffi.cast("DenoiseState *", self._state_buffer)
+        
+        ret = lib.rnnoise_init(self._state, self._model)
+        if ret != 0:
+             if self._model: lib.rnnoise_model_free(self._model) # Clean up model if init fails
+             self._model = None
+             raise RNNoiseCFFIError(f"Failed to initialize RNNoise state with model {model_source}")
+        self._state_created_internally = False # State initialized in buffer, not created by lib
+
     def _check_destroyed(self):
         if self._destroyed:
             raise RNNoiseCFFIError("RNNoise state has already been destroyed.")
@@ -86,6 +114,68 @@ class RNNoiseCFFI:
         vad_prob = lib.rnnoise_process_frame(self._state, out_ptr, in_ptr)
 
         return vad_prob, out_frame_float32
+
+    def process_buffer(self, audio_float32, out=None, vad=None):
+        """Processes a whole buffer of consecutive frames in one call into the C library.
+
+        Args:
+            audio_float32: A contiguous 1-D numpy float32 array whose length is a
+                           multiple of SAMPLES_PER_FRAME.
+            out: Optional contiguous float32 array of the same shape that receives the
+                 denoised audio. May be audio_float32 itself to denoise in place.
+                 A new array is allocated if omitted.
+            vad: Optional contiguous float32 array with room for one value per frame
+                 that receives the voice activity probabilities.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: A tuple containing:
+                - vad_probabilities (np.ndarray): One float32 probability per frame.
+                - denoised (np.ndarray): The denoised audio (out, if given).
+        """
+        self._check_destroyed()
+
+        if not isinstance(audio_float32, np.ndarray) or audio_float32.dtype != np.float32:
+            raise TypeError(f"Input buffer must be a numpy array of float32, got {type(audio_float32)} with dtype {getattr(audio_float32, 'dtype', None)}")
+        if audio_float32.ndim != 1 or not audio_float32.flags['C_CONTIGUOUS']:
+            raise ValueError("Input buffer must be a contiguous 1-D array")
+        if audio_float32.shape[0] % SAMPLES_PER_FRAME != 0:
+            raise ValueError(f"Input buffer length must be a multiple of {SAMPLES_PER_FRAME}, got {audio_float32.shape[0]}")
+        num_frames = audio_float32.shape[0] // SAMPLES_PER_FRAME
+
+        if out is None:
+            out = np.empty_like(audio_float32)
+        elif (not isinstance(out, np.ndarray) or out.dtype != np.float32 or out.shape != audio_float32.shape
+              or not out.flags['C_CONTIGUOUS'] or not out.flags['WRITEABLE']):
+            raise ValueError(f"Output buffer must be a writeable contiguous float32 array of shape {audio_float32.shape}")
+
+        if vad is None:
+            vad = np.empty(num_frames, dtype=np.float32)
+        elif (not isinstance(vad, np.ndarray) or vad.dtype != np.float32 or vad.ndim != 1
+              or vad.shape[0] < num_frames or not vad.flags['C_CONTIGUOUS']):
+            raise ValueError(f"VAD buffer must be a contiguous 1-D float32 array with at least {num_frames} elements")
+
+        if num_frames == 0:
+            return vad[:0], out
+
+        in_ptr = ffi.cast("const float *", ffi.from_buffer(audio_float32))
+        out_ptr = ffi.cast("float *", ffi.from_buffer(out))
+        vad_ptr = ffi.cast("float *", ffi.from_buffer(vad))
+
+        if HAS_PROCESS_BUFFER:
+            # Call the C loop once for all frames
+            lib.rnnoise_process_buffer(self._state, out_ptr, in_ptr, num_frames, vad_ptr)
+        else:
+            # Same loop with one foreign call per frame; rebuild the module for the fast path
+            global _fallback_warned
+            if not _fallback_warned:
+                logging.warning("The _rnnoise_cffi module has no rnnoise_process_buffer, so every frame is a separate "
+                                "call from Python (much slower). Re-run build_rnnoise_cffi.py to rebuild it.")
+                _fallback_warned = True
+            for i in range(num_frames):
+                offset = i * SAMPLES_PER_FRAME
+                vad[i] = lib.rnnoise_process_frame(self._state, out_ptr + offset, in_ptr + offset)
+
+        return vad[:num_frames], out
         
     def destroy(self):
         if self._destroyed:
@@ -103,6 +193,9 @@ class RNNoiseCFFI:
         if hasattr(self, '_model') and self._model:
             lib.rnnoise_model_free(self._model)
             self._model = None 
+        # The weights buffer can only be released once the model is gone
+        self._model_buffer_ptr = None
+        self._model_buffer = None
             
         self._destroyed = True
 
@@ -0,0 +1,125 @@
+import numpy as np
+
+# Same frame as rnnoise_cffi_wrapper (10 ms at 48 kHz); not imported from there, so the
+# buffering works with any denoiser that has process_buffer() and without the CFFI module
+RNNOISE_SAMPLE_RATE = 48000
+SAMPLES_PER_FRAME = 480
+
+
+class RNNoiseStream:
+    """Streaming front end for RNNoiseCFFI that accepts chunks of any size.
+
+    Samples that don't complete a frame are kept in a preallocated frame buffer
+    until the next chunk arrives, and denoised audio is emitted as soon as frames
+    complete. Complete frames inside a chunk are denoised straight from the
+    caller's array with RNNoiseCFFI.process_buffer, so nothing is allocated per call.
+
+    The arrays returned by process() and flush() are views into internal buffers
+    and are only valid until the next call.
+    """
+
+    def __init__(self, denoiser, max_chunk_size):
+        """
+        Args:
+            denoiser: An RNNoiseCFFI instance; its state is carried across chunks.
+            max_chunk_size: Largest chunk (in samples) that will be passed to process().
+        """
+        self.denoiser = denoiser
+        self.max_chunk_size = max_chunk_size
+        # Pending samples of the current, incomplete frame
+        self._pending = np.zeros(SAMPLES_PER_FRAME, dtype=np.float32)
+        self._fill = 0
+        # Room for the pending samples plus the largest chunk, rounded down to whole frames
+        max_frames = (SAMPLES_PER_FRAME - 1 + max_chunk_size) // SAMPLES_PER_FRAME
+        self._out = np.zeros(max(max_frames, 1) * SAMPLES_PER_FRAME, dtype=np.float32)
+        self._vad = np.zeros(max(max_frames, 1), dtype=np.float32)
+
+    @property
+    def latency_samples(self):
+        """Worst-case algorithmic latency in samples.
+
+        Up to SAMPLES_PER_FRAME - 1 samples wait for their frame to complete, and
+        RNNoise itself delays its output by one frame (overlap-add synthesis).
+        """
+        return 2 * SAMPLES_PER_FRAME - 1
+
+    @property
+    def latency_ms(self):
+        """Worst-case algorithmic latency in milliseconds at the RNNoise sample rate."""
+        return 1000.0 * self.latency_samples / RNNOISE_SAMPLE_RATE
+
+    @property
+    def pending_samples(self):
+        """Number of buffered samples waiting for their frame to complete."""
+        return self._fill
+
+    def reset(self):
+        """Drops any pending samples (the denoiser state itself is kept)."""
+        self._fill = 0
+
+    def process(self, chunk):
+        """Feeds a chunk of float32 samples and returns the audio of all frames it completed.
+
+        Args:
+            chunk: A contiguous 1-D numpy float32 array of at most max_chunk_size samples.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: A tuple containing:
+                - denoised (np.ndarray): Denoised samples, a multiple of SAMPLES_PER_FRAME (may be empty).
+                - vad_probabilities (np.ndarray): One probability per emitted frame.
+        """
+        num_samples = chunk.shape[0]
+        if num_samples > self.max_chunk_size:
+            raise ValueError(f"Chunk of {num_samples} samples exceeds max_chunk_size {self.max_chunk_size}")
+
+        out_pos = 0
+        frame_pos = 0
+        consumed = 0
+
+        # Complete the pending frame first
+        if self._fill > 0:
+            take = min(SAMPLES_PER_FRAME - self._fill, num_samples)
+            self._pending[self._fill:self._fill + take] = chunk[:take]
+            self._fill += take
+            consumed = take
+            if self._fill == SAMPLES_PER_FRAME:
+                self.denoiser.process_buffer(self._pending, out=self._out[:SAMPLES_PER_FRAME], vad=self._vad[:1])
+                out_pos = SAMPLES_PER_FRAME
+                frame_pos = 1
+                self._fill = 0
+
+        # Whole frames straight from the chunk, in one call
+        num_frames = (num_samples - consumed) // SAMPLES_PER_FRAME
+        if num_frames > 0:
+            end = consumed + num_frames * SAMPLES_PER_FRAME
+            self.denoiser.process_buffer(
+                chunk[consumed:end],
+                out=self._out[out_pos:out_pos + num_frames * SAMPLES_PER_FRAME],
+                vad=self._vad[frame_pos:frame_pos + num_frames],
+            )
+            out_pos += num_frames * SAMPLES_PER_FRAME
+            frame_pos += num_frames
+            consumed = end
+
+        # Keep the leftover samples for the next call
+        leftover = num_samples - consumed
+        if leftover > 0:
+            self._pending[self._fill:self._fill + leftover] = chunk[consumed:]
+            self._fill += leftover
+
+        return self._out[:out_pos], self._vad[:frame_pos]
+
+    def flush(self):
+        """Zero-pads and denoises the pending partial frame.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The denoised pending samples (trimmed to
+            their original count) and the VAD probability of the padded frame.
+        """
+        if self._fill == 0:
+            return self._out[:0], self._vad[:0]
+        num_samples = self._fill
+        self._pending[num_samples:] = 0.0
+        self.denoiser.process_buffer(self._pending, out=self._out[:SAMPLES_PER_FRAME], vad=self._vad[:1])
+        self._fill = 0
+        return self._out[:num_samples], self._vad[:1]
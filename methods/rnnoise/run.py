@@ -1,14 +1,29 @@
 import os
 import glob
+import mmap
+import time
 import argparse
 import logging
+import multiprocessing
 import numpy as np
 import soundfile as sf
 import sys
 
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils.resampling import StreamingResampler
+from utils.method_registry import method_sample_rate, method_rate_suffix, rate_suffix
+from preparation import ensure_prepared
+from utils.corpus_store import list_inputs, input_filename, input_num_samples, read_input
+from utils.output_spectrograms import SPECTROGRAM_MODES, OutputSpectrograms
+
 # Import the wrapper (assuming it's in the same directory)
 try:
     from rnnoise_cffi_wrapper import RNNoiseCFFI as RNNoise
+    from rnnoise_stream import RNNoiseStream
 except ImportError as e:
     logging.error(f"Failed to import RNNoise wrapper: {e}")
     logging.error("Ensure rnnoise_cffi_wrapper.py is in the same directory and the CFFI module is built (run build_rnnoise_cffi.py).")
@@ -18,81 +33,130 @@ except ImportError as e:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants
-SAMPLE_RATE = 48000 # RNNoise *internally* processes at 48kHz, though it expects 16-bit PCM frames.
-                    # The wrapper handles the sample rate expectation based on its internal frame size.
+SAMPLE_RATE = method_sample_rate("rnnoise") # RNNoise processes 48kHz audio, with float samples in the 16-bit PCM range.
 RNNOISE_FRAME_SIZE = 480 # RNNoise process frames of 480 samples (10 ms at 48kHz).
-EXPECTED_INPUT_SR = 16000 # We expect 16k input files from preparation.py
-SAMPLE_RATE_KEY = "_16k"
+INT16_SCALE = 32768.0 # Scales [-1, 1] float audio to the int16 range RNNoise expects
+STREAM_CHUNK_SIZE = 16000 # Input samples per step of the resample -> denoise -> resample pipeline
+SAMPLE_RATE_KEY = method_rate_suffix("rnnoise") # Prepared at the native rate, so no resampling is needed
+EXPECTED_INPUT_SR = 16000 # The legacy frame mode reads the 16k files
+LEGACY_SAMPLE_RATE_KEY = rate_suffix(EXPECTED_INPUT_SR)
 DEFAULT_INPUT_DIR = "../../assets/prepared"
 DEFAULT_OUTPUT_DIR = "./output"
 
 def process_audio_rnnoise(denoiser, audio_data_float32):
-    """Processes float32 audio data through RNNoise frame by frame."""
+    """Processes float32 audio data through RNNoise in a single whole-buffer call."""
     # Ensure input is float32
     if audio_data_float32.dtype != np.float32:
         raise TypeError(f"process_audio_rnnoise expects float32 input, got {audio_data_float32.dtype}")
 
     # RNNoise operates on frames of a specific size (e.g., 480 samples for 10ms at 48kHz)
-    # The CFFI wrapper expects frames of this size.
+    # The CFFI wrapper expects whole frames.
     # Use the constant defined in this script
     frame_size = RNNOISE_FRAME_SIZE
 
     num_samples = len(audio_data_float32)
-    num_frames = num_samples // frame_size
-    output_audio_float32 = np.zeros_like(audio_data_float32)
+    num_frames = -(-num_samples // frame_size) # Round up to include the last partial frame
+
+    # Pad the last partial frame to frame_size with zeros
+    if num_frames * frame_size != num_samples:
+        logging.debug(f"Padding last partial frame of {num_samples % frame_size} samples.")
+        in_buffer = np.zeros(num_frames * frame_size, dtype=np.float32)
+        in_buffer[:num_samples] = audio_data_float32
+    else:
+        in_buffer = np.ascontiguousarray(audio_data_float32)
 
     logging.debug(f"Processing {num_frames} frames of size {frame_size}...")
-    for i in range(num_frames):
-        frame_start = i * frame_size
-        frame_end = frame_start + frame_size
-        frame = audio_data_float32[frame_start:frame_end]
+    try:
+        vad_probs, out_buffer = denoiser.process_buffer(in_buffer)
+    except Exception as e:
+        logging.error(f"Error processing audio buffer: {e}")
+        # For now, just copy original data to output
+        return audio_data_float32.copy()
 
-        # Process the float32 frame using the wrapper
-        # The wrapper now returns (vad_prob, denoised_frame_float32)
-        try:
-            vad_prob, denoised_frame = denoiser.process_frame(frame)
-            output_audio_float32[frame_start:frame_end] = denoised_frame
-        except Exception as e:
-            logging.error(f"Error processing frame {i}: {e}")
-            # Decide how to handle frame errors: skip frame? fill with silence? stop?
-            # For now, just copy original frame data to output
-            output_audio_float32[frame_start:frame_end] = frame
-
-    # Handle the last partial frame if any
-    remaining_samples = num_samples % frame_size
-    if remaining_samples > 0:
-        logging.debug(f"Handling last partial frame of {remaining_samples} samples.")
-        last_frame_start = num_frames * frame_size
-        # Pad the last frame to frame_size with zeros
-        last_frame = np.zeros(frame_size, dtype=np.float32)
-        last_frame[:remaining_samples] = audio_data_float32[last_frame_start:]
-        try:
-            vad_prob, denoised_last_frame = denoiser.process_frame(last_frame)
-            # Copy back only the original number of samples
-            output_audio_float32[last_frame_start:] = denoised_last_frame[:remaining_samples]
-        except Exception as e:
-             logging.error(f"Error processing final partial frame: {e}")
-             # Copy original partial frame data to output
-             output_audio_float32[last_frame_start:] = last_frame[:remaining_samples]
+    logging.debug("Frame processing complete.")
+    # Copy back only the original number of samples; no need to convert back to float32, it already is
+    return out_buffer[:num_samples]
 
+def process_audio_rnnoise_native(denoiser, audio_data_float32, sr, chunk_size=STREAM_CHUNK_SIZE, return_vad=False):
+    """Processes float32 audio at any sample rate through RNNoise at its native 48kHz.
+
+    The input is upsampled to 48kHz, scaled to the int16 range, denoised and brought
+    back to sr chunk by chunk (streaming polyphase resamplers fused with the frame
+    loop, no intermediate files). RNNoise's one-frame output delay is compensated,
+    so the result is aligned with the input and has the same length.
+
+    With return_vad, also returns the per-frame (10 ms) voice activity probabilities
+    of the signal as a float32 array.
+    """
+    num_samples = len(audio_data_float32)
+    resample = sr != SAMPLE_RATE
+    to_48k = StreamingResampler(sr, SAMPLE_RATE) if resample else None
+    from_48k = StreamingResampler(SAMPLE_RATE, sr) if resample else None
+    num_samples_48k = -(-num_samples * SAMPLE_RATE // sr)
+
+    max_chunk_48k = -(-chunk_size * SAMPLE_RATE // sr) + 4 * RNNOISE_FRAME_SIZE
+    stream = RNNoiseStream(denoiser, max_chunk_48k)
+
+    output_audio_float32 = np.zeros(num_samples, dtype=np.float32)
+    progress = {'skip': RNNOISE_FRAME_SIZE, 'denoised': 0, 'written': 0}
+    vad_chunks = []
+
+    def write(out):
+        end = min(progress['written'] + len(out), num_samples)
+        output_audio_float32[progress['written']:end] = out[:end - progress['written']]
+        progress['written'] = end
+
+    def emit(denoised_48k):
+        # Drop RNNoise's one-frame delay and anything past the end of the signal
+        skip = min(progress['skip'], len(denoised_48k))
+        progress['skip'] -= skip
+        denoised_48k = denoised_48k[skip:num_samples_48k - progress['denoised'] + skip]
+        progress['denoised'] += len(denoised_48k)
+        out = denoised_48k / INT16_SCALE
+        write(from_48k.process(out) if resample else out)
+
+    def denoise(audio_48k):
+        for start in range(0, len(audio_48k), max_chunk_48k):
+            scaled = (audio_48k[start:start + max_chunk_48k] * INT16_SCALE).astype(np.float32)
+            denoised_48k, vad_probs = stream.process(scaled)
+            if return_vad:
+                vad_chunks.append(vad_probs.copy()) # Views are only valid until the next call
+            emit(denoised_48k)
+
+    logging.debug(f"Processing {num_samples} samples at {sr} Hz through RNNoise at {SAMPLE_RATE} Hz...")
+    for start in range(0, num_samples, chunk_size):
+        chunk = audio_data_float32[start:start + chunk_size]
+        denoise(to_48k.process(chunk) if resample else np.ascontiguousarray(chunk))
+    if resample:
+        denoise(to_48k.flush())
+    # Push the delayed frame (and any pending partial frame) out with silence
+    denoise(np.zeros(2 * RNNOISE_FRAME_SIZE, dtype=np.float32))
+    if resample:
+        write(from_48k.flush())
 
     logging.debug("Frame processing complete.")
-    # No need to convert back to float32, it already is
+    if return_vad:
+        # VAD is reported per input frame (no delay); drop the frames of the trailing silence
+        num_frames = -(-num_samples_48k // RNNOISE_FRAME_SIZE)
+        vad_probs = np.concatenate(vad_chunks)[:num_frames] if vad_chunks else np.zeros(0, dtype=np.float32)
+        return output_audio_float32, vad_probs
     return output_audio_float32
 
-def process_file(denoiser, input_path, output_path):
-    """Loads a 16k audio file, processes it with RNNoise, and saves the result."""
+def process_file(denoiser, input_path, output_path, legacy_frames=False, spectrograms=None):
+    """Loads an audio file, processes it with RNNoise, and saves the result.
+
+    By default RNNoise runs at its native 48kHz on int16-scaled samples. legacy_frames
+    keeps the original behaviour of feeding 16k samples directly as 480-sample frames.
+    The saved audio is handed to spectrograms (an OutputSpectrograms), if given.
+    """
     try:
         logging.info(f"Processing {input_path}...")
-        # Load audio file, ensure it's float32 for potential conversion later
-        audio, sr = sf.read(input_path, dtype='float32')
+        # Load audio file (or map the corpus store clip), ensure it's float32 for potential conversion later
+        audio, sr = read_input(input_path)
 
-        if sr != EXPECTED_INPUT_SR:
+        if legacy_frames and sr != EXPECTED_INPUT_SR:
             logging.warning(f"Input sample rate {sr} doesn't match expected {EXPECTED_INPUT_SR}. Skipping file.")
-            # NOTE: RNNoise C lib *expects* 48k internally, but the wrapper might abstract this.
-            # However, for consistency with preparation, we check for 16k input.
-            # If the wrapper needs 48k, resampling should happen here or in the wrapper.
-            # Assuming the wrapper handles the conversion or the C lib is flexible.
+            # NOTE: the legacy path feeds the samples to RNNoise as if they were 48k.
             return
 
         if len(audio.shape) > 1:
@@ -100,32 +164,83 @@ def process_file(denoiser, input_path, output_path):
             audio = np.mean(audio, axis=1)
 
         # Process the audio data
-        enhanced_audio = process_audio_rnnoise(denoiser, audio)
+        if legacy_frames:
+            enhanced_audio = process_audio_rnnoise(denoiser, audio)
+        else:
+            enhanced_audio = process_audio_rnnoise_native(denoiser, audio, sr)
 
         # Save the enhanced audio file (as float32, common format)
         # RNNoise output is technically 16-bit, but saving as float avoids potential scaling issues
-        sf.write(output_path, enhanced_audio, EXPECTED_INPUT_SR) # Save with original input sample rate
+        sf.write(output_path, enhanced_audio, sr) # Save with original input sample rate
         logging.info(f"Saved enhanced audio to {output_path}")
+        if spectrograms is not None:
+            spectrograms.add(output_path, enhanced_audio, sr)
 
     except Exception as e:
         logging.error(f"Error processing {input_path}: {e}")
         # import traceback
         # logging.error(traceback.format_exc())
 
-def main(input_dir, output_dir):
-    """Finds prepared 16k audio files and processes them with RNNoise."""
+def create_denoiser(model_path=None):
+    """Creates an RNNoise denoiser; a model file is memory-mapped so processes share its pages."""
+    if model_path is None:
+        return RNNoise()
+    with open(model_path, 'rb') as f:
+        # The mapping stays valid after the file is closed
+        weights = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return RNNoise(model_buffer=weights)
+
+# Per-process state of the --workers pool, set up by init_worker()
+_worker_denoiser = None
+_worker_legacy_frames = False
+_worker_spectrograms = None
+
+def init_worker(model_path, legacy_frames, spectrograms=None):
+    """Pool initializer: gives each worker process its own DenoiseState."""
+    global _worker_denoiser, _worker_legacy_frames, _worker_spectrograms
+    _worker_denoiser = create_denoiser(model_path)
+    _worker_legacy_frames = legacy_frames
+    # Workers render inline: the pool already keeps the CPUs busy, and a worker has no point to wait for a queue
+    _worker_spectrograms = OutputSpectrograms('inline' if spectrograms else None)
+
+def worker_process_file(job):
+    """Processes one (input_path, output_path) job in a worker; returns (input_path, seconds)."""
+    input_path, output_path = job
+    start = time.perf_counter()
+    process_file(_worker_denoiser, input_path, output_path, _worker_legacy_frames, _worker_spectrograms)
+    return input_path, time.perf_counter() - start
+
+def run_workers(jobs, model_path, legacy_frames, workers, spectrograms=None):
+    """Processes the jobs on a pool of worker processes, largest files first."""
+    # Hand out the longest files first so a big file doesn't start last and hold up the run
+    jobs = sorted(jobs, key=lambda job: input_num_samples(job[0]), reverse=True)
+    logging.info(f"Processing {len(jobs)} file(s) with {workers} worker process(es)...")
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(model_path, legacy_frames, spectrograms)) as pool:
+        # chunksize=1 makes the pool a work queue: each idle worker takes the next file
+        for done, (input_path, seconds) in enumerate(pool.imap_unordered(worker_process_file, jobs, chunksize=1), 1):
+            logging.info(f"[{done}/{len(jobs)}] {input_filename(input_path)} done in {seconds:.2f}s")
+    logging.info(f"Processed {len(jobs)} file(s) in {time.perf_counter() - start:.2f}s")
+
+def main(input_dir, output_dir, legacy_frames=False, workers=1, corpus_store=None, spectrograms=None):
+    """Finds the prepared files at RNNoise's native rate (16k in legacy mode) and processes them."""
     logging.info(f"Starting RNNoise processing...")
     logging.info(f"Input directory: {input_dir}")
     logging.info(f"Output directory: {output_dir}")
+    if legacy_frames:
+        logging.info("Processing mode: legacy (16k samples fed directly as 480-sample frames)")
+    else:
+        logging.info(f"Processing mode: native {SAMPLE_RATE} Hz (inputs at other rates are resampled on the fly)")
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # Find only the 16k prepared files
-    search_pattern = os.path.join(input_dir, f"*{SAMPLE_RATE_KEY}.wav")
-    audio_files = glob.glob(search_pattern)
+    # Find only the prepared files at the rate this mode reads
+    input_rate_key = LEGACY_SAMPLE_RATE_KEY if legacy_frames else SAMPLE_RATE_KEY
+    # With a corpus store, workers map the same packed file instead of each decoding WAVs
+    audio_files = list_inputs(input_dir, EXPECTED_INPUT_SR if legacy_frames else SAMPLE_RATE, corpus_store)
 
     if not audio_files:
-        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {input_dir}. Did you run preparation.py?")
+        logging.warning(f"No *{input_rate_key}.wav files found in {corpus_store or input_dir}. Did you run preparation.py?")
         return
 
     logging.info(f"Found {len(audio_files)} audio file(s) to process.")
@@ -141,27 +256,49 @@ def main(input_dir, output_dir):
     else:
         logging.warning(f"Model file not found at {model_path}. Using default built-in model.")
 
-    # Initialize RNNoise denoiser from the wrapper
-    try:
-        logging.info(f"Initializing RNNoise denoiser (Model: {'Loaded from file' if model_to_use else 'Default built-in'})...")
-        denoiser = RNNoise(model_path=model_to_use)
-        logging.info("RNNoise denoiser initialized.")
-    except Exception as e:
-        logging.error(f"Error initializing RNNoise: {e}. Have you built the CFFI module and set library paths? (See README)")
-        return # Exit if denoiser cannot be created
-
+    jobs = []
     for input_file in audio_files:
-        filename = os.path.basename(input_file)
+        filename = input_filename(input_file)
         # Construct output path
         model_tag = "_model" if model_to_use else "_default"
-        output_filename = filename.replace(SAMPLE_RATE_KEY, f"_rnnoise{model_tag}_enhanced")
+        # Native outputs carry the rate they were denoised at (_rnnoise48k_model_enhanced), so
+        # they are neither skipped because of nor mistaken for legacy 16k-frame outputs
+        mode_tag = "" if legacy_frames else SAMPLE_RATE_KEY[1:]
+        output_filename = filename.replace(input_rate_key, f"_rnnoise{mode_tag}{model_tag}_enhanced")
         output_path = os.path.join(output_dir, output_filename)
 
         if os.path.exists(output_path):
             logging.info(f"Skipping {output_path}, file already exists.")
             continue
 
-        process_file(denoiser, input_file, output_path)
+        jobs.append((input_file, output_path))
+
+    if not jobs:
+        logging.info("RNNoise processing finished.")
+        return
+
+    if workers > 1:
+        try:
+            run_workers(jobs, model_to_use, legacy_frames, workers, spectrograms)
+        except Exception as e:
+            logging.error(f"Error in RNNoise worker pool: {e}. Have you built the CFFI module and set library paths? (See README)")
+            return
+        logging.info("RNNoise processing finished.")
+        return
+
+    # Initialize RNNoise denoiser from the wrapper
+    try:
+        logging.info(f"Initializing RNNoise denoiser (Model: {'Loaded from file' if model_to_use else 'Default built-in'})...")
+        denoiser = create_denoiser(model_to_use)
+        logging.info("RNNoise denoiser initialized.")
+    except Exception as e:
+        logging.error(f"Error initializing RNNoise: {e}. Have you built the CFFI module and set library paths? (See README)")
+        return # Exit if denoiser cannot be created
+
+    # Spectrograms of the outputs, rendered from memory (spectrograms: None, 'inline' or 'background')
+    with OutputSpectrograms(spectrograms) as output_spectrograms:
+        for input_file, output_path in jobs:
+            process_file(denoiser, input_file, output_path, legacy_frames, output_spectrograms)
 
     # Clean up RNNoise instance (if the wrapper has a cleanup method)
     if hasattr(denoiser, 'destroy') and callable(denoiser.destroy):
@@ -171,12 +308,28 @@ def main(input_dir, output_dir):
     logging.info("RNNoise processing finished.")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run RNNoise enhancement on prepared audio files using CFFI wrapper.")
+    parser = argparse.ArgumentParser(description="Run RNNoise enhancement on prepared audio files using CFFI wrapper.",
+                                     epilog="Needs the _rnnoise_cffi module, which isn't in the repository: build it with "
+                                            "'python build_rnnoise_cffi.py' after building lib/rnnoise, and re-run that after updating (see README.md).")
     parser.add_argument("--input-dir", type=str, default=DEFAULT_INPUT_DIR,
-                        help=f"Directory containing prepared 16k audio files (default: {DEFAULT_INPUT_DIR})")
+                        help=f"Directory containing prepared {SAMPLE_RATE_KEY[1:]} audio files (default: {DEFAULT_INPUT_DIR})")
     parser.add_argument("--output-dir", type=str, default=DEFAULT_OUTPUT_DIR,
                         help=f"Directory to save enhanced audio files (default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--legacy-frames", action="store_true",
+                        help="Feed 16k samples directly as 480-sample frames without int16 scaling (the original, incorrect configuration)")
+
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes, each with its own RNNoise state (default: 1)")
+    parser.add_argument("--corpus-store", type=str, default=None, metavar="DIR",
+                        help="Read the clips from this memory-mapped corpus store (preparation.py --corpus-store) instead of --input-dir")
+    parser.add_argument("--spectrograms", choices=SPECTROGRAM_MODES, default=None,
+                        help="Also render each output's spectrogram for summary.py from memory, in this process (inline) or on a background thread; --workers render inline")
+    parser.add_argument("--no-prepare", action="store_true",
+                        help="Don't build missing or stale inputs in assets/prepared (preparation.py) before processing")
 
     args = parser.parse_args()
 
-    main(args.input_dir, args.output_dir)
+    if not args.corpus_store and not args.no_prepare:
+        ensure_prepared(args.input_dir, EXPECTED_INPUT_SR if args.legacy_frames else SAMPLE_RATE)
+
+    main(args.input_dir, args.output_dir, args.legacy_frames, max(1, args.workers), args.corpus_store, args.spectrograms)
@@ -0,0 +1,72 @@
+import os
+import glob
+import argparse
+import logging
+import numpy as np
+
+# run.py sets up sys.path for the shared utils package and imports the wrapper
+from run import create_denoiser, process_audio_rnnoise_native, SAMPLE_RATE, SAMPLE_RATE_KEY, DEFAULT_INPUT_DIR
+from preparation import ensure_prepared
+from utils import wavio
+from utils.vad import VAD_FRAME_MS, DEFAULT_VAD_DIR, vad_track_path, save_vad_track
+
+def analyze_file(input_path, output_path, model_path=None):
+    """Runs RNNoise over a file and saves its per-frame speech probabilities."""
+    try:
+        logging.info(f"Analyzing {input_path}...")
+        audio, sr = wavio.read(input_path, dtype='float32', mono=True)
+
+        # Fresh state per file, so every track starts from the same conditions
+        denoiser = create_denoiser(model_path)
+        _, vad_probs = process_audio_rnnoise_native(denoiser, audio, sr, return_vad=True)
+        denoiser.destroy()
+
+        save_vad_track(output_path, vad_probs, VAD_FRAME_MS, os.path.basename(input_path))
+        speech = float(np.mean(vad_probs >= 0.5)) if len(vad_probs) > 0 else 0.0
+        logging.info(f"Saved VAD track to {output_path} ({len(vad_probs)} frames, {100.0 * speech:.1f}% speech at 0.5)")
+    except Exception as e:
+        logging.error(f"Error analyzing {input_path}: {e}")
+
+def main(input_dir, output_dir, overwrite=False):
+    """Writes a VAD track for every prepared file at RNNoise's native rate."""
+    logging.info(f"Starting RNNoise VAD analysis...")
+    logging.info(f"Input directory: {input_dir}")
+    logging.info(f"Output directory: {output_dir}")
+
+    audio_files = sorted(glob.glob(os.path.join(input_dir, f"*{SAMPLE_RATE_KEY}.wav")))
+    if not audio_files:
+        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {input_dir}. Did you run preparation.py?")
+        return
+
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    model_path = os.path.join(script_dir, "lib", "rnnoise", "weights_blob.bin")
+    if not os.path.exists(model_path):
+        logging.warning(f"Model file not found at {model_path}. Using default built-in model.")
+        model_path = None
+
+    for input_file in audio_files:
+        output_path = vad_track_path(output_dir, input_file)
+        if os.path.exists(output_path) and not overwrite:
+            logging.info(f"Skipping {output_path}, file already exists.")
+            continue
+        analyze_file(input_file, output_path, model_path)
+
+    logging.info("VAD analysis finished.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Save per-frame RNNoise speech probabilities for the prepared audio files.")
+    parser.add_argument("--input-dir", type=str, default=DEFAULT_INPUT_DIR,
+                        help=f"Directory containing prepared {SAMPLE_RATE_KEY[1:]} audio files (default: {DEFAULT_INPUT_DIR})")
+    parser.add_argument("--output-dir", type=str, default=DEFAULT_VAD_DIR,
+                        help=f"Directory to save the VAD tracks (default: {DEFAULT_VAD_DIR})")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Recompute tracks that already exist")
+    parser.add_argument("--no-prepare", action="store_true",
+                        help=f"Don't build missing or stale {SAMPLE_RATE_KEY[1:]} inputs in assets/prepared (preparation.py) before processing")
+
+    args = parser.parse_args()
+
+    if not args.no_prepare:
+        ensure_prepared(args.input_dir, SAMPLE_RATE)
+
+    main(args.input_dir, args.output_dir, args.overwrite)
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Chunked enhancement for long inputs: the model sees windows of a fixed length that
+# overlap by a little, and the enhanced windows are joined with an equal-power
+# crossfade over the overlap. Windows are cut from a stream of input blocks and
+# written out as soon as they are joined, so memory depends on the window length
+# and not on the length of the file.
+#
+#   input    |---- window 0 ----|
+#                          |---- window 1 ----|
+#                                        |-- window 2 --|
+#   output   |-------------X------------X---------------|   X: crossfades
+DEFAULT_OVERLAP_SECONDS = 0.5
+READ_BLOCK_SIZE = 1 << 16 # Samples decoded per read while streaming an input
+
+
+def equal_power_fades(length):
+    """Returns (fade_in, fade_out) ramps of length samples with fade_in**2 + fade_out**2 == 1."""
+    t = (np.arange(length, dtype=np.float64) + 0.5) / max(length, 1)
+    return np.sin(0.5 * np.pi * t).astype(np.float32), np.cos(0.5 * np.pi * t).astype(np.float32)
+
+
+def resample_blocks(blocks, stream):
+    """Passes a stream of blocks through a stateful resampler (utils.resampling.create_stream)."""
+    for block in blocks:
+        yield stream.process(block)
+    yield stream.flush()
+
+
+def iter_windows(blocks, window, overlap):
+    """
+    Regroups a stream of mono blocks into windows of window samples that overlap by overlap samples.
+
+    Every window but the first starts with the last overlap samples of the one before.
+    The last window may be shorter but always has new samples past the overlap; an
+    input shorter than one window comes out as a single window.
+    """
+    if not 0 <= overlap < window:
+        raise ValueError(f"Overlap ({overlap} samples) must be shorter than the window ({window} samples)")
+    hop = window - overlap
+    buffer = np.zeros(0, dtype=np.float32)
+    emitted = False
+    for block in blocks:
+        buffer = np.concatenate((buffer, np.asarray(block, dtype=np.float32)))
+        while len(buffer) >= window:
+            yield buffer[:window]
+            buffer = buffer[hop:]
+            emitted = True
+    if len(buffer) > (overlap if emitted else 0):
+        yield buffer
+
+
+class CrossfadeWriter:
+    """
+    Joins the enhanced windows of iter_windows() and hands the result to write() as it goes.
+
+    The last overlap samples of each window are held back until the next window
+    arrives and is faded in over them; close() writes the tail of the last one.
+    """
+
+    def __init__(self, write, overlap):
+        self.write = write
+        self.overlap = overlap
+        self.fade_in, self.fade_out = equal_power_fades(overlap)
+        self.tail = None
+        self.frames = 0 # Samples written so far
+
+    def add(self, chunk):
+        """Adds the enhanced version of the next window; it must have the window's length."""
+        chunk = np.array(chunk, dtype=np.float32).reshape(-1)
+        if self.tail is not None:
+            head = chunk[:self.overlap]
+            chunk[:self.overlap] = self.tail * self.fade_out + head * self.fade_in
+        split = max(0, len(chunk) - self.overlap)
+        self._write(chunk[:split])
+        self.tail = chunk[split:]
+
+    def close(self):
+        """Writes the held-back tail of the last window."""
+        if self.tail is not None:
+            self._write(self.tail)
+            self.tail = None
+
+    def _write(self, samples):
+        if len(samples):
+            self.write(samples)
+            self.frames += len(samples)
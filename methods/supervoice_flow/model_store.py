@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import logging
+from contextlib import contextmanager
+
+import torch
+
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils.hashing import file_sha256
+
+# Offline model store for SuperVoice Enhance. torch.hub.load() resolves the hub repo,
+# imports its code and loads the enhancer and vocoder weights on every run, and may go
+# to the network to do it. An export (done once, with network access) saves the loaded
+# module with torch.save() next to a copy of the hub code its classes come from:
+#
+#   <store>/CURRENT                 name of the entry the loader uses
+#   <store>/<entry>/model.pt        the whole module (enhancer + vocoder), pickled
+#   <store>/<entry>/code/<repo>/    hub repo code, put on sys.path to unpickle it
+#   <store>/<entry>/metadata.json   hub source, torch version, sample rate, hash
+#
+# The loader reads only from the store; torch.hub's download functions are disabled
+# while it runs.
+STORE_FORMAT_VERSION = 1 # Bump when the layout of an entry changes
+HUB_REPO = 'ex3ndr/supervoice-enhance'
+HUB_MODEL = 'enhance'
+HUB_KWARGS = {'vocoder': True}
+DEFAULT_MODEL_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_store")
+CURRENT_FILENAME = "CURRENT"
+MODEL_FILENAME = "model.pt"
+METADATA_FILENAME = "metadata.json"
+CODE_DIRNAME = "code"
+
+
+def load_from_hub():
+    """Loads the model through torch.hub (may download code and weights)."""
+    return torch.hub.load(repo_or_dir=HUB_REPO, model=HUB_MODEL, **HUB_KWARGS)
+
+
+def hub_code_dirs():
+    """The torch.hub repo directories that imported modules were loaded from (enhancer, vocoder, ...)."""
+    hub_dir = os.path.realpath(torch.hub.get_dir())
+    repos = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if not path:
+            continue
+        rel = os.path.relpath(os.path.realpath(path), hub_dir)
+        if not rel.startswith('..') and os.sep in rel and not rel.startswith('checkpoints'):
+            repos.add(os.path.join(hub_dir, rel.split(os.sep)[0]))
+    return sorted(repos)
+
+
+def export_model(model, store_dir=DEFAULT_MODEL_STORE):
+    """
+    Saves a model loaded by load_from_hub() as a new store entry and makes it current.
+
+    The entry is written to a temporary directory and renamed into place, and CURRENT
+    is replaced atomically, so a loader never sees a partial entry.
+
+    Returns:
+        str: The entry directory
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_dir = os.path.join(store_dir, f".export-tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        os.makedirs(os.path.join(tmp_dir, CODE_DIRNAME))
+        code_dirs = hub_code_dirs()
+        for repo_dir in code_dirs:
+            shutil.copytree(repo_dir, os.path.join(tmp_dir, CODE_DIRNAME, os.path.basename(repo_dir)),
+                            ignore=shutil.ignore_patterns('.git', '__pycache__', '*.pyc'))
+        model_path = os.path.join(tmp_dir, MODEL_FILENAME)
+        torch.save(model.cpu(), model_path)
+        sha256 = file_sha256(model_path)
+
+        metadata = {
+            'format': STORE_FORMAT_VERSION,
+            'hub_repo': HUB_REPO,
+            'hub_model': HUB_MODEL,
+            'hub_kwargs': HUB_KWARGS,
+            'code': [os.path.basename(d) for d in code_dirs], # sys.path order for unpickling
+            'model_sha256': sha256,
+            'model_bytes': os.path.getsize(model_path),
+            'sample_rate': getattr(model, 'sample_rate', None),
+            'torch': torch.__version__,
+            'python': sys.version.split()[0],
+            'exported_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        with open(os.path.join(tmp_dir, METADATA_FILENAME), 'w') as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+
+        entry = f"{HUB_MODEL}-v{STORE_FORMAT_VERSION}-{sha256[:12]}"
+        entry_dir = os.path.join(store_dir, entry)
+        if os.path.isdir(entry_dir):
+            logging.info(f"Model store entry {entry_dir} already exists.")
+        else:
+            os.rename(tmp_dir, entry_dir)
+        current_tmp = os.path.join(store_dir, f"{CURRENT_FILENAME}.tmp-{os.getpid()}")
+        with open(current_tmp, 'w') as f:
+            f.write(entry + "\n")
+        os.replace(current_tmp, os.path.join(store_dir, CURRENT_FILENAME))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logging.info(f"Exported {HUB_REPO}:{HUB_MODEL} to {entry_dir} ({metadata['model_bytes'] / 1e6:.1f} MB)")
+    return entry_dir
+
+
+def current_entry(store_dir=DEFAULT_MODEL_STORE):
+    """The directory of the store's current entry, or None if nothing was exported there."""
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILENAME), 'r') as f:
+            entry = f.read().strip()
+    except OSError:
+        return None
+    entry_dir = os.path.join(store_dir, entry)
+    return entry_dir if entry and os.path.isdir(entry_dir) else None
+
+
+@contextmanager
+def _no_hub():
+    """Makes any torch.hub fetch raise instead of going to the network or the hub cache."""
+    def refuse(*args, **kwargs):
+        raise RuntimeError("the offline model store loader must not use torch.hub")
+    names = ['load', 'load_state_dict_from_url', 'download_url_to_file']
+    saved = {name: getattr(torch.hub, name) for name in names}
+    for name in names:
+        setattr(torch.hub, name, refuse)
+    try:
+        yield
+    finally:
+        for name, fn in saved.items():
+            setattr(torch.hub, name, fn)
+
+
+def _torch_load(path, device):
+    kwargs = {'map_location': device}
+    params = inspect.signature(torch.load).parameters
+    if 'weights_only' in params:
+        kwargs['weights_only'] = False # A whole module, not just tensors
+    if 'mmap' in params:
+        kwargs['mmap'] = True # Map the tensor data instead of reading it into memory first
+    return torch.load(path, **kwargs)
+
+
+def load_from_store(store_dir=DEFAULT_MODEL_STORE, device='cpu'):
+    """
+    Loads the current entry of a model store, without torch.hub.
+
+    Returns:
+        tuple: (model, metadata)
+
+    Raises:
+        FileNotFoundError: If nothing was exported to store_dir
+    """
+    entry_dir = current_entry(store_dir)
+    if entry_dir is None:
+        raise FileNotFoundError(f"No model store at {store_dir}. Export one with "
+                                f"'python model_store.py --store {store_dir}' on a machine with network access.")
+    with open(os.path.join(entry_dir, METADATA_FILENAME), 'r') as f:
+        metadata = json.load(f)
+    if metadata.get('format') != STORE_FORMAT_VERSION:
+        raise ValueError(f"Model store entry {entry_dir} has format {metadata.get('format')}, "
+                         f"this loader reads {STORE_FORMAT_VERSION}; export it again.")
+    if metadata.get('torch', '').split('.')[:2] != torch.__version__.split('.')[:2]:
+        logging.warning(f"Model store entry was exported with torch {metadata.get('torch')}, running {torch.__version__}.")
+
+    # The pickled classes live in the copied hub code
+    for name in reversed(metadata.get('code', [])):
+        code_dir = os.path.join(entry_dir, CODE_DIRNAME, name)
+        if code_dir not in sys.path:
+            sys.path.insert(0, code_dir)
+    with _no_hub():
+        model = _torch_load(os.path.join(entry_dir, MODEL_FILENAME), device)
+    return model, metadata
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export SuperVoice Enhance from torch.hub into an offline model store (needs network access once).")
+    parser.add_argument("--store", default=DEFAULT_MODEL_STORE, help=f"Model store directory (default: {DEFAULT_MODEL_STORE})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    hub_model = load_from_hub()
+    hub_seconds = time.perf_counter() - start
+    hub_model.eval()
+    export_model(hub_model, args.store)
+
+    start = time.perf_counter()
+    stored_model, _ = load_from_store(args.store)
+    store_seconds = time.perf_counter() - start
+    if getattr(stored_model, 'sample_rate', None) != getattr(hub_model, 'sample_rate', None):
+        logging.error("The stored model doesn't report the same sample rate as the hub model.")
+        sys.exit(1)
+    # Both loads ran in this process, so imports were warm for the second one;
+    # run.py logs the real cold start
+    logging.info(f"torch.hub load took {hub_seconds:.2f}s, model store load {store_seconds:.2f}s.")
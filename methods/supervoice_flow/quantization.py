@@ -0,0 +1,49 @@
+import copy
+import numpy as np
+import torch
+
+# Opt-in reduced precision for the Linear layers, which do most of the work of the
+# flow-matching network on CPU:
+#   int8: dynamic quantization (int8 weights, activations quantized on the fly)
+#   bf16: bfloat16 weights; inputs are cast to bfloat16 and outputs back to float32
+# Both change the output, so a quality check enhances the same input from the same
+# noise with the float32 model and the quantized one and reports the SNR between them.
+QUANTIZE_MODES = ['int8', 'bf16']
+QUALITY_CHECK_SEED = 0
+QUALITY_CHECK_SECONDS = 5.0 # Length of the excerpt the check enhances twice
+MIN_QUALITY_SNR_DB = 20.0 # Below this the check logs a warning
+
+
+def quantize_linear_layers(model, mode):
+    """
+    Returns a copy of a CPU model with its nn.Linear layers in reduced precision; the model itself is left as is.
+
+    Returns:
+        tuple: (quantized model, number of Linear layers converted)
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}', choose one of {QUANTIZE_MODES}")
+    count = sum(isinstance(module, torch.nn.Linear) for module in model.modules())
+    if mode == 'int8':
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=False), count
+
+    model = copy.deepcopy(model)
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.to(torch.bfloat16)
+            module.register_forward_pre_hook(
+                lambda _, args: tuple(a.to(torch.bfloat16) if torch.is_tensor(a) and a.is_floating_point() else a for a in args))
+            module.register_forward_hook(lambda _, args, output: output.float())
+    return model, count
+
+
+def snr_db(reference, test):
+    """SNR of test against reference in dB (inf if they are identical)."""
+    reference = np.asarray(reference, dtype=np.float64).reshape(-1)
+    test = np.asarray(test, dtype=np.float64).reshape(-1)
+    length = min(len(reference), len(test))
+    reference, test = reference[:length], test[:length]
+    noise = np.sum((reference - test) ** 2)
+    if noise == 0:
+        return float('inf')
+    return float(10 * np.log10(np.sum(reference ** 2) / noise))
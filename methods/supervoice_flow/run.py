@@ -1,44 +1,166 @@
+import time
+STARTUP_T0 = time.perf_counter() # Startup time is logged once the model is ready
 import argparse
 import os
+import sys
 import torch
-import torchaudio
-import soundfile as sf # Using soundfile for saving, torchaudio for loading/resampling
+import numpy as np
+import soundfile as sf # Using soundfile for saving, utils.corpus_store for loading
 import logging
+TORCH_IMPORTED_T = time.perf_counter()
+
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils.vad import VadGate, add_vad_gate_arguments
+from utils.resampling import BACKENDS, create_stream, resample
+from utils.method_registry import method_sample_rate, method_rate_suffix
+from preparation import ensure_prepared
+from utils.corpus_store import list_inputs, input_filename, read_input, read_input_blocks
+from utils.output_spectrograms import SPECTROGRAM_MODES, OutputSpectrograms
+from model_store import DEFAULT_MODEL_STORE, load_from_hub, load_from_store
+from chunked import DEFAULT_OVERLAP_SECONDS, READ_BLOCK_SIZE, CrossfadeWriter, iter_windows, resample_blocks
+from quantization import (QUANTIZE_MODES, QUALITY_CHECK_SEED, QUALITY_CHECK_SECONDS, MIN_QUALITY_SNR_DB,
+                          quantize_linear_layers, snr_db)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+SAMPLE_RATE = method_sample_rate("supervoice_flow") # Must match model.sample_rate
+SAMPLE_RATE_KEY = method_rate_suffix("supervoice_flow") # Prepared files at the model rate
+
 # Global variable for the model to avoid reloading it for every file
 model = None
 device = None
 
-def load_model():
-    """Loads the Supervoice Enhance model using torch.hub."""
+def load_model(model_store=DEFAULT_MODEL_STORE, use_hub=False):
+    """
+    Loads the Supervoice Enhance model from the offline model store (model_store.py).
+
+    Never touches the network unless use_hub is set, which loads through torch.hub as before.
+    """
     global model, device
     if model is None:
-        logging.info("Loading Supervoice Enhance model...")
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         try:
-            # Force reload might be needed if cache is stale or testing changes
-            # model = torch.hub.load(repo_or_dir='ex3ndr/supervoice-enhance', model='enhance', vocoder=True, force_reload=True)
-            model = torch.hub.load(repo_or_dir='ex3ndr/supervoice-enhance', model='enhance', vocoder=True)
+            if use_hub:
+                logging.info("Loading Supervoice Enhance model via torch.hub...")
+                model = load_from_hub()
+                source = "torch.hub"
+            else:
+                logging.info(f"Loading Supervoice Enhance model from {model_store}...")
+                model, metadata = load_from_store(model_store, device)
+                source = f"model store, exported {metadata.get('exported_at')}"
             model.to(device)
             model.eval()
-            logging.info(f"Model loaded successfully on {device}.")
+            logging.info(f"Model loaded successfully on {device} ({source}).")
             logging.info(f"Model expected sample rate: {model.sample_rate}")
+            if model.sample_rate != SAMPLE_RATE:
+                logging.warning(f"Model rate {model.sample_rate} differs from the registered {SAMPLE_RATE} in utils/method_registry.py; inputs will be resampled.")
         except Exception as e:
             logging.error(f"Failed to load model: {e}")
             raise
+        ready_t = time.perf_counter()
+        logging.info(f"Startup took {ready_t - STARTUP_T0:.2f} s "
+                     f"(torch import {TORCH_IMPORTED_T - STARTUP_T0:.2f} s, model ready after {ready_t - TORCH_IMPORTED_T:.2f} s).")
     return model, device
 
-def enhance_audio(input_path, output_path, enhancement_steps=8):
+def load_waveform(input_path, resampler='torchaudio'):
+    """Reads an input (file path or StoreClip) as a 1-D waveform tensor at the model rate, on the model's device."""
+    # Memory-mapped WAV reader (or corpus store clip), downmixed to mono before
+    # resampling so only one channel is resampled
+    audio, sr = read_input(input_path, mono=True)
+    logging.info(f"Loaded audio with sample rate: {sr}")
+    # Torch needs writable memory; only zero-copy (read-only) views are copied here
+    audio = torch.from_numpy(np.require(audio, requirements='W')).unsqueeze(0)
+
+    # Resample if necessary
+    if sr != model.sample_rate:
+        logging.info(f"Resampling audio from {sr} Hz to {model.sample_rate} Hz ({resampler})")
+        audio = torch.from_numpy(resample(audio.squeeze(0).numpy(), sr, model.sample_rate, resampler)).unsqueeze(0)
+    audio = audio.to(device)
+
+    # Remove the channel dimension (model expects single waveform tensor)
+    if audio.dim() > 1 and audio.shape[0] == 1:
+        audio = audio.squeeze(0)
+    return audio
+
+def save_enhanced_audio(enhanced_audio, output_path, spectrograms=None):
+    """Writes an enhanced waveform tensor at the model rate and hands it to spectrograms, if given."""
+    # Move back to CPU for saving
+    enhanced_audio_cpu = enhanced_audio.cpu()
+
+    # Save the enhanced audio using soundfile
+    # Ensure output is 1D or 2D [frames, channels]
+    if enhanced_audio_cpu.dim() == 1:
+        enhanced_audio_cpu = enhanced_audio_cpu.unsqueeze(-1) # Add channel dim if mono
+
+    # Soundfile expects [frames, channels]
+    sf.write(output_path, enhanced_audio_cpu.numpy(), model.sample_rate)
+    logging.info(f"Saved enhanced audio to: {output_path} with sample rate {model.sample_rate}")
+    if spectrograms is not None:
+        spectrograms.add(output_path, enhanced_audio_cpu.numpy(), model.sample_rate)
+
+def configure_threads(threads=None, interop_threads=None):
+    """Sets torch's intra-op and inter-op thread pools (None keeps torch's default) and logs the result.
+
+    Must run before any inference, since the inter-op pool can't be resized once it has started.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        torch.set_num_interop_threads(interop_threads)
+    logging.info(f"Torch threads: {torch.get_num_threads()} intra-op, {torch.get_num_interop_threads()} inter-op.")
+
+def check_quantized_quality(reference_model, input_path, enhancement_steps=8, resampler='torchaudio',
+                            seconds=QUALITY_CHECK_SECONDS, seed=QUALITY_CHECK_SEED):
+    """
+    Enhances the start of an input with the float32 reference model and the quantized model from the
+    same seed, and logs the SNR of the quantized output against the reference.
+
+    Returns:
+        float: The SNR in dB, or None if the check failed
+    """
+    try:
+        waveform = load_waveform(input_path, resampler)[:int(seconds * model.sample_rate)]
+        outputs = []
+        for candidate in (reference_model, model):
+            torch.manual_seed(seed) # Same noise for both, so only the precision differs
+            with torch.inference_mode():
+                outputs.append(candidate.enhance(waveform=waveform, steps=enhancement_steps).cpu().numpy())
+    except Exception as e:
+        logging.error(f"Quantization quality check on {input_path} failed: {e}")
+        return None
+    snr = snr_db(outputs[0], outputs[1])
+    message = f"Quantized vs float32 output on the first {len(waveform) / model.sample_rate:.1f} s of {input_filename(input_path)}: SNR {snr:.1f} dB"
+    if snr < MIN_QUALITY_SNR_DB:
+        logging.warning(f"{message}, below {MIN_QUALITY_SNR_DB:g} dB.")
+    else:
+        logging.info(f"{message}.")
+    return snr
+
+def enhance_audio(input_path, output_path, enhancement_steps=8, vad_gate=None, resampler='torchaudio', spectrograms=None,
+                  chunk_seconds=None, overlap_seconds=DEFAULT_OVERLAP_SECONDS):
     """
     Loads audio, runs Supervoice Enhance enhancement, and saves the output.
+
+    input_path may also be a corpus store clip (utils.corpus_store.StoreClip).
+
+    With a VadGate, only the speech regions from the file's VAD track are enhanced.
+    With chunk_seconds, the file is enhanced in overlapping windows instead (see
+    enhance_audio_chunked()). The saved audio is handed to spectrograms (an
+    OutputSpectrograms), if given.
     """
     global model, device
     if model is None:
         load_model() # Ensure model is loaded
 
+    if chunk_seconds:
+        return enhance_audio_chunked(input_path, output_path, enhancement_steps, chunk_seconds, overlap_seconds,
+                                     resampler, spectrograms)
+
     if model is None: # Check again if loading failed
         logging.error("Model not loaded. Skipping enhancement.")
         return
@@ -46,44 +168,23 @@ def enhance_audio(input_path, output_path, enhancement_steps=8):
     logging.info(f"Processing file: {input_path}")
 
     try:
-        # Load audio using torchaudio
-        audio, sr = torchaudio.load(input_path)
-        audio = audio.to(device)
-        logging.info(f"Loaded audio with sample rate: {sr}")
-
-        # Resample if necessary
-        if sr != model.sample_rate:
-            logging.info(f"Resampling audio from {sr} Hz to {model.sample_rate} Hz")
-            resampler = torchaudio.transforms.Resample(sr, model.sample_rate).to(device)
-            audio = resampler(audio)
-            sr = model.sample_rate
-
-        # Convert to mono if necessary
-        if audio.shape[0] > 1:
-            logging.info("Converting audio to mono")
-            audio = audio.mean(dim=0, keepdim=True)
-
-        # Remove batch dimension if added by torchaudio (model expects single waveform tensor)
-        if audio.dim() > 1 and audio.shape[0] == 1:
-            audio = audio.squeeze(0)
+        audio = load_waveform(input_path, resampler)
+        sr = model.sample_rate
 
         # Perform enhancement
         logging.info(f"Starting enhancement with {enhancement_steps} steps...")
-        with torch.no_grad(): # Inference doesn't need gradients
-            enhanced_audio = model.enhance(waveform=audio, steps=enhancement_steps)
+        regions = vad_gate.regions_for(input_filename(input_path), sr, audio.shape[-1]) if vad_gate else None
+        if regions is not None:
+            def enhance_segment(segment):
+                with torch.inference_mode():
+                    return model.enhance(waveform=torch.from_numpy(segment).to(device), steps=enhancement_steps).cpu().numpy()
+            enhanced_audio = torch.from_numpy(vad_gate.apply(audio.cpu().numpy(), sr, regions, enhance_segment))
+        else:
+            with torch.inference_mode(): # No autograd bookkeeping at all, cheaper than no_grad
+                enhanced_audio = model.enhance(waveform=audio, steps=enhancement_steps)
         logging.info("Enhancement complete.")
 
-        # Move back to CPU for saving
-        enhanced_audio_cpu = enhanced_audio.cpu()
-
-        # Save the enhanced audio using soundfile
-        # Ensure output is 1D or 2D [frames, channels]
-        if enhanced_audio_cpu.dim() == 1:
-            enhanced_audio_cpu = enhanced_audio_cpu.unsqueeze(-1) # Add channel dim if mono
-
-        # Soundfile expects [frames, channels]
-        sf.write(output_path, enhanced_audio_cpu.numpy(), model.sample_rate)
-        logging.info(f"Saved enhanced audio to: {output_path} with sample rate {model.sample_rate}")
+        save_enhanced_audio(enhanced_audio, output_path, spectrograms)
 
     except Exception as e:
         logging.error(f"Failed during enhancement for {input_path}: {e}")
@@ -91,57 +192,204 @@ def enhance_audio(input_path, output_path, enhancement_steps=8):
         # raise e
 
 
+def enhance_audio_chunked(input_path, output_path, enhancement_steps=8, chunk_seconds=30.0,
+                          overlap_seconds=DEFAULT_OVERLAP_SECONDS, resampler='torchaudio', spectrograms=None):
+    """
+    Enhances an input window by window and streams the result to output_path.
+
+    The input is read (and resampled) in blocks, cut into windows of chunk_seconds
+    that overlap by overlap_seconds, and each enhanced window is crossfaded into the
+    output file as soon as it's done, so neither the input nor the output is ever
+    held in memory as a whole (see chunked.py).
+    """
+    global model, device
+    if model is None:
+        load_model() # Ensure model is loaded
+
+    if model is None: # Check again if loading failed
+        logging.error("Model not loaded. Skipping enhancement.")
+        return
+
+    window = int(round(chunk_seconds * model.sample_rate))
+    overlap = int(round(overlap_seconds * model.sample_rate))
+    logging.info(f"Processing file in {chunk_seconds:g} s chunks with {overlap_seconds:g} s overlap: {input_path}")
+
+    try:
+        sr, blocks = read_input_blocks(input_path, READ_BLOCK_SIZE)
+        logging.info(f"Streaming audio with sample rate: {sr}")
+        if sr != model.sample_rate:
+            try:
+                stream = create_stream(resampler, sr, model.sample_rate)
+            except ValueError:
+                logging.info(f"Resampler '{resampler}' can't stream; using numpy_poly for the chunked path")
+                stream = create_stream('numpy_poly', sr, model.sample_rate)
+            logging.info(f"Resampling audio from {sr} Hz to {model.sample_rate} Hz while streaming")
+            blocks = resample_blocks(blocks, stream)
+
+        chunks = 0
+        # Only the spectrogram needs the whole output at once; keep the blocks as they're written
+        written = [] if spectrograms is not None and spectrograms.enabled else None
+        # Same format sf.write() picks in enhance_audio()
+        with sf.SoundFile(output_path, 'w', samplerate=model.sample_rate, channels=1) as sink:
+            def write(samples):
+                sink.write(samples)
+                if written is not None:
+                    written.append(samples)
+            writer = CrossfadeWriter(write, overlap)
+            for chunk in iter_windows(blocks, window, overlap):
+                with torch.inference_mode(): # Inference doesn't need gradients
+                    enhanced = model.enhance(waveform=torch.from_numpy(chunk).to(device), steps=enhancement_steps)
+                # The crossfade needs every window back at its input length
+                enhanced = enhanced.cpu().numpy().reshape(-1)[:len(chunk)]
+                writer.add(np.pad(enhanced, (0, len(chunk) - len(enhanced))))
+                chunks += 1
+            writer.close()
+        logging.info(f"Saved enhanced audio to: {output_path} ({chunks} chunk(s), {writer.frames / model.sample_rate:.1f} s)")
+        if written is not None:
+            # add() quantizes the samples as the file stores them
+            spectrograms.add(output_path, np.concatenate(written) if written else np.zeros(0, dtype=np.float32),
+                             model.sample_rate)
+
+    except Exception as e:
+        logging.error(f"Failed during chunked enhancement for {input_path}: {e}")
+        # Don't leave a truncated output behind
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run Supervoice Flow/Enhance Speech Enhancement")
-    parser.add_argument("--input", required=True, help="Path to the input audio file or directory.")
+    parser.add_argument("--input", default=None, help="Path to the input audio file or directory (required unless --corpus-store is given).")
     parser.add_argument("--output_dir", default="output", help="Directory to save enhanced audio files.")
     parser.add_argument("--steps", type=int, default=8, help="Number of enhancement steps (default: 8, try 32 for potentially higher quality).")
+    add_vad_gate_arguments(parser)
+    parser.add_argument("--resampler", choices=BACKENDS, default='torchaudio',
+                        help="Resampler backend for inputs not at the model rate (default: torchaudio)")
+    parser.add_argument("--corpus-store", default=None, metavar="DIR",
+                        help="Process every 24k clip of this memory-mapped corpus store (preparation.py --corpus-store); --input is ignored.")
+    parser.add_argument("--spectrograms", choices=SPECTROGRAM_MODES, default=None,
+                        help="Also render each output's spectrogram for summary.py from memory, in this process (inline) or on a background thread")
+    parser.add_argument("--chunk-seconds", type=float, default=None, metavar="SECONDS",
+                        help="Enhance in overlapping windows of this length, streaming the input and output (bounded memory for long files); default: whole file")
+    parser.add_argument("--chunk-overlap-seconds", type=float, default=DEFAULT_OVERLAP_SECONDS, metavar="SECONDS",
+                        help=f"Overlap between chunks, joined with an equal-power crossfade (default: {DEFAULT_OVERLAP_SECONDS})")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Intra-op threads for torch (default: torch's choice, usually one per core)")
+    parser.add_argument("--interop-threads", type=int, default=None,
+                        help="Inter-op threads for torch (default: torch's choice)")
+    parser.add_argument("--quantize", choices=QUANTIZE_MODES, default=None,
+                        help="CPU only: run the Linear layers as dynamic int8 or bfloat16 (default: float32)")
+    parser.add_argument("--quantize-check", action="store_true",
+                        help="With --quantize, first compare the output on the first input against float32 (same seed) and log the SNR")
+    parser.add_argument("--model-store", default=DEFAULT_MODEL_STORE, metavar="DIR",
+                        help=f"Offline model store written by model_store.py (default: {DEFAULT_MODEL_STORE})")
+    parser.add_argument("--hub", action="store_true",
+                        help="Load the model through torch.hub instead of the model store (may use the network)")
+    parser.add_argument("--no-prepare", action="store_true",
+                        help=f"Don't build missing or stale {SAMPLE_RATE_KEY[1:]} inputs in assets/prepared (preparation.py) before processing")
 
     args = parser.parse_args()
+    if not args.input and not args.corpus_store:
+        parser.error("one of --input or --corpus-store is required")
+    if args.chunk_seconds is not None:
+        if args.vad_gate:
+            parser.error("--chunk-seconds can't be combined with --vad-gate")
+        if not 0 <= args.chunk_overlap_seconds < args.chunk_seconds:
+            parser.error("--chunk-overlap-seconds must be at least 0 and shorter than --chunk-seconds")
+    if args.quantize_check and not args.quantize:
+        parser.error("--quantize-check needs --quantize")
+
+    # Thread pools are fixed once torch runs anything in parallel, so set them first
+    configure_threads(args.threads, args.interop_threads)
 
     # Load the model once before processing files
     try:
-        load_model()
+        # A relative --model-store is resolved against the script directory, like the other paths
+        load_model(os.path.join(os.path.dirname(os.path.abspath(__file__)), args.model_store), args.hub)
     except Exception as e:
         logging.error(f"Exiting due to model loading failure: {e}")
         exit(1)
 
+    reference_model = None
+    if args.quantize:
+        if device.type != 'cpu':
+            logging.error(f"--quantize is for CPU inference; the model is on {device}.")
+            exit(1)
+        reference_model = model
+        model, converted = quantize_linear_layers(reference_model, args.quantize)
+        logging.info(f"Running {converted} Linear layer(s) in {args.quantize}.")
+        if not args.quantize_check:
+            reference_model = None # Only the quality check needs the float32 model
+
     # Construct absolute paths based on the current working directory
     # Get the directory where the script is located
     script_dir = os.path.dirname(os.path.abspath(__file__))
     # Resolve input path relative to the script directory
-    input_path_abs = os.path.abspath(os.path.join(script_dir, args.input))
+    input_path_abs = os.path.abspath(os.path.join(script_dir, args.input)) if args.input else None
     # Resolve output directory relative to the script directory
     output_dir_abs = os.path.abspath(os.path.join(script_dir, args.output_dir))
+    # Resolve the VAD track directory the same way
+    args.vad_dir = os.path.abspath(os.path.join(script_dir, args.vad_dir))
+    vad_gate = VadGate.from_args(args)
 
+    if input_path_abs and not args.corpus_store and not args.no_prepare:
+        ensure_prepared(input_path_abs, SAMPLE_RATE) # Only if --input is the prepared directory
 
     # Create output directory if it doesn't exist
     logging.info(f"Ensuring output directory exists: {output_dir_abs}")
     os.makedirs(output_dir_abs, exist_ok=True)
 
-    if os.path.isdir(input_path_abs):
-        logging.info(f"Processing all .wav files in directory: {input_path_abs}")
-        wav_files = [f for f in os.listdir(input_path_abs) if f.lower().endswith(".wav")]
-        if not wav_files:
-            logging.warning(f"No .wav files found in {input_path_abs}")
+    # Spectrograms of the outputs, rendered from memory (--spectrograms inline or background)
+    with OutputSpectrograms(args.spectrograms) as output_spectrograms:
+        if args.corpus_store:
+            corpus_store_abs = os.path.abspath(os.path.join(script_dir, args.corpus_store))
+            clips = list_inputs(None, SAMPLE_RATE, corpus_store_abs)
+            if not clips:
+                logging.warning(f"No {SAMPLE_RATE_KEY[1:]} clips in corpus store {corpus_store_abs}. Did you run preparation.py --corpus-store?")
+            logging.info(f"Processing {len(clips)} clip(s) from corpus store {corpus_store_abs}")
+            jobs = [(clip, os.path.join(output_dir_abs, f"{os.path.splitext(clip.filename)[0]}_supervoiceenhance.wav"))
+                    for clip in clips]
+            if reference_model is not None and jobs:
+                check_quantized_quality(reference_model, jobs[0][0], args.steps, args.resampler)
+                reference_model = None # Free the float32 model
+            for clip, output_file_path in jobs:
+                enhance_audio(clip, output_file_path, args.steps, vad_gate, args.resampler, output_spectrograms,
+                              args.chunk_seconds, args.chunk_overlap_seconds)
+
+        elif os.path.isdir(input_path_abs):
+            # Only the files prepared at the model rate, so nothing is resampled again
+            logging.info(f"Processing all *{SAMPLE_RATE_KEY}.wav files in directory: {input_path_abs}")
+            wav_files = sorted(f for f in os.listdir(input_path_abs) if f.lower().endswith(f"{SAMPLE_RATE_KEY}.wav"))
+            if not wav_files:
+                logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {input_path_abs}. Did you run preparation.py?")
+            else:
+                logging.info(f"Found {len(wav_files)} .wav files to process.")
+                jobs = []
+                for filename in wav_files:
+                    input_file_path = os.path.join(input_path_abs, filename)
+                    # Use the resolved absolute output directory
+                    output_filename = f"{os.path.splitext(filename)[0]}_supervoiceenhance.wav" # Changed suffix
+                    jobs.append((input_file_path, os.path.join(output_dir_abs, output_filename)))
+                if reference_model is not None and jobs:
+                    check_quantized_quality(reference_model, jobs[0][0], args.steps, args.resampler)
+                    reference_model = None # Free the float32 model
+                for input_file_path, output_file_path in jobs:
+                    enhance_audio(input_file_path, output_file_path, args.steps, vad_gate, args.resampler, output_spectrograms,
+                                  args.chunk_seconds, args.chunk_overlap_seconds)
+
+        elif input_path_abs and os.path.isfile(input_path_abs) and input_path_abs.lower().endswith(".wav"):
+            logging.info(f"Processing single file: {input_path_abs}")
+            filename = os.path.basename(input_path_abs)
+            # Use the resolved absolute output directory
+            output_filename = f"{os.path.splitext(filename)[0]}_supervoiceenhance.wav" # Changed suffix
+            output_file_path = os.path.join(output_dir_abs, output_filename)
+            if reference_model is not None:
+                check_quantized_quality(reference_model, input_path_abs, args.steps, args.resampler)
+                reference_model = None # Free the float32 model
+            enhance_audio(input_path_abs, output_file_path, args.steps, vad_gate, args.resampler, output_spectrograms,
+                          args.chunk_seconds, args.chunk_overlap_seconds)
         else:
-            logging.info(f"Found {len(wav_files)} .wav files to process.")
-            for filename in wav_files:
-                input_file_path = os.path.join(input_path_abs, filename)
-                # Use the resolved absolute output directory
-                output_filename = f"{os.path.splitext(filename)[0]}_supervoiceenhance.wav" # Changed suffix
-                output_file_path = os.path.join(output_dir_abs, output_filename)
-                enhance_audio(input_file_path, output_file_path, args.steps)
-
-    elif os.path.isfile(input_path_abs) and input_path_abs.lower().endswith(".wav"):
-        logging.info(f"Processing single file: {input_path_abs}")
-        filename = os.path.basename(input_path_abs)
-        # Use the resolved absolute output directory
-        output_filename = f"{os.path.splitext(filename)[0]}_supervoiceenhance.wav" # Changed suffix
-        output_file_path = os.path.join(output_dir_abs, output_filename)
-        enhance_audio(input_path_abs, output_file_path, args.steps)
-    else:
-        # Use the originally provided input argument in the error message for clarity
-        logging.error(f"Invalid input: {args.input}. Must be an existing .wav file or a directory containing .wav files.")
+            # Use the originally provided input argument in the error message for clarity
+            logging.error(f"Invalid input: {args.input}. Must be an existing .wav file or a directory containing .wav files.")
 
     logging.info("Processing complete.") 
\ No newline at end of file
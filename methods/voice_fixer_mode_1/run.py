@@ -1,34 +1,33 @@
 import os
+import sys
 import glob
 import argparse
 import logging
-import soundfile as sf
 from voicefixer import VoiceFixer
 
+# Make the shared utils package importable when running from this directory
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils.vad import VadGate, add_vad_gate_arguments
+from utils.method_registry import method_sample_rate, method_rate_suffix
+from preparation import ensure_prepared
+from utils.corpus_store import list_inputs, input_filename
+from utils.voicefixer_common import process_file
+from utils.output_spectrograms import SPECTROGRAM_MODES, OutputSpectrograms
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Constants
-SAMPLE_RATE_KEY = "_44k"
-EXPECTED_SAMPLE_RATE = 44100
+SAMPLE_RATE_KEY = method_rate_suffix("voice_fixer_mode_1")
+EXPECTED_SAMPLE_RATE = method_sample_rate("voice_fixer_mode_1") # 44.1 kHz, the rate VoiceFixer works at
 DEFAULT_INPUT_DIR = "../../assets/prepared"
 DEFAULT_OUTPUT_DIR = "./output"
 DEFAULT_MODE = 1 # Hardcode mode 1
 DEFAULT_SUFFIX_TAG = "mode1" # Hardcode suffix for mode 1
 
-def process_file(vf, input_path, output_path, mode):
-    """Processes a single audio file using VoiceFixer with a specific mode."""
-    try:
-        logging.info(f"Processing {input_path} with mode {mode}...")
-        # VoiceFixer processes the file directly
-        # mode=0: original model
-        # mode=1: Add microphone noise suppression
-        # mode=2: Add speech restoration
-        vf.restore(input=input_path, output=output_path, mode=mode) # Use the specified mode
-        logging.info(f"Saved enhanced audio to {output_path}")
-    except Exception as e:
-        logging.error(f"Error processing {input_path}: {e}")
-
-def main(input_dir, output_dir, mode, suffix_tag):
+def main(input_dir, output_dir, mode, suffix_tag, vad_gate=None, corpus_store=None, spectrograms=None):
     """Finds prepared 44k audio files and processes them with VoiceFixer."""
     logging.info(f"Starting VoiceFixer processing (Mode: {mode}, Suffix Tag: '{suffix_tag}')...")
     logging.info(f"Input directory: {input_dir}")
@@ -37,11 +36,10 @@ def main(input_dir, output_dir, mode, suffix_tag):
     os.makedirs(output_dir, exist_ok=True)
 
     # Find only the 44k prepared files
-    search_pattern = os.path.join(input_dir, f"*{SAMPLE_RATE_KEY}.wav")
-    audio_files = glob.glob(search_pattern)
+    audio_files = list_inputs(input_dir, EXPECTED_SAMPLE_RATE, corpus_store)
 
     if not audio_files:
-        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {input_dir}. Did you run preparation.py?")
+        logging.warning(f"No *{SAMPLE_RATE_KEY}.wav files found in {corpus_store or input_dir}. Did you run preparation.py?")
         return
 
     logging.info(f"Found {len(audio_files)} audio file(s) to process.")
@@ -52,19 +50,21 @@ def main(input_dir, output_dir, mode, suffix_tag):
     vf = VoiceFixer() # cuda=True can be added if GPU is available and configured
     logging.info("VoiceFixer model initialized.")
 
-    for input_file in audio_files:
-        filename = os.path.basename(input_file)
-        # Construct output path using the suffix tag
-        # If tag is empty (default mode 0), uses original suffix
-        tag_part = f"_{suffix_tag}" if suffix_tag else ""
-        output_filename = filename.replace(SAMPLE_RATE_KEY, f"_vf{tag_part}_enhanced")
-        output_path = os.path.join(output_dir, output_filename)
+    # Spectrograms of the outputs, rendered from memory (spectrograms: None, 'inline' or 'background')
+    with OutputSpectrograms(spectrograms) as output_spectrograms:
+        for input_file in audio_files:
+            filename = input_filename(input_file)
+            # Construct output path using the suffix tag
+            # If tag is empty (default mode 0), uses original suffix
+            tag_part = f"_{suffix_tag}" if suffix_tag else ""
+            output_filename = filename.replace(SAMPLE_RATE_KEY, f"_vf{tag_part}_enhanced")
+            output_path = os.path.join(output_dir, output_filename)
 
-        if os.path.exists(output_path):
-            logging.info(f"Skipping {output_path}, file already exists.")
-            continue
+            if os.path.exists(output_path):
+                logging.info(f"Skipping {output_path}, file already exists.")
+                continue
 
-        process_file(vf, input_file, output_path, mode) # Pass mode here
+            process_file(vf, input_file, output_path, mode, EXPECTED_SAMPLE_RATE, vad_gate, output_spectrograms) # Pass mode here
 
     logging.info(f"VoiceFixer processing finished for mode {mode}.")
 
@@ -74,6 +74,13 @@ if __name__ == "__main__":
                         help=f"Directory containing prepared audio files (default: {DEFAULT_INPUT_DIR})")
     parser.add_argument("--output-dir", type=str, default=DEFAULT_OUTPUT_DIR,
                         help=f"Directory to save enhanced audio files (default: {DEFAULT_OUTPUT_DIR})")
+    add_vad_gate_arguments(parser)
+    parser.add_argument("--corpus-store", type=str, default=None, metavar="DIR",
+                        help="Read the 44k clips from this memory-mapped corpus store (preparation.py --corpus-store) instead of --input-dir")
+    parser.add_argument("--spectrograms", choices=SPECTROGRAM_MODES, default=None,
+                        help="Also render each output's spectrogram for summary.py from memory, in this process (inline) or on a background thread")
+    parser.add_argument("--no-prepare", action="store_true",
+                        help="Don't build missing or stale 44.1k inputs in assets/prepared (preparation.py) before processing")
     # Remove mode and suffix_tag arguments
     # parser.add_argument("--mode", type=int, default=DEFAULT_MODE, choices=[0, 1, 2],
     #                     help=f"VoiceFixer processing mode (0: basic, 1: mic noise sup., 2: speech restore) (default: {DEFAULT_MODE})")
@@ -90,5 +97,8 @@ if __name__ == "__main__":
     # elif args.mode == DEFAULT_MODE and args.suffix_tag:
     #     logging.warning(f"Suffix tag '{args.suffix_tag}' provided for default mode {args.mode}. Filenames will include the tag.")
 
+    if not args.corpus_store and not args.no_prepare:
+        ensure_prepared(args.input_dir, EXPECTED_SAMPLE_RATE)
+
     # Call main with hardcoded mode and suffix
-    main(args.input_dir, args.output_dir, DEFAULT_MODE, DEFAULT_SUFFIX_TAG)
+    main(args.input_dir, args.output_dir, DEFAULT_MODE, DEFAULT_SUFFIX_TAG, VadGate.from_args(args), args.corpus_store, args.spectrograms)
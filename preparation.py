@@ -1,48 +1,301 @@
 import os
 import glob
-import librosa
+import json
+import time
+import fcntl
+import argparse
+import numpy as np
 import soundfile as sf
 import logging
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.resampling import BACKENDS, DEFAULT_BACKEND, SOXR_QUALITIES, resample, create_stream
+from utils.hashing import cached_file_sha256
+from utils import wavio
+from utils.method_registry import METHOD_SAMPLE_RATES, rate_key, required_sample_rates, split_rate_suffix
+from utils.corpus_store import DEFAULT_CORPUS_STORE, CorpusStore, write_rate
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-INPUT_DIR = "assets/audio_samples/original_rate"
-OUTPUT_DIR = "assets/prepared"
-TARGET_RATES = {
-    "16k": 16000,
-    "44k": 44100,
-}
+# Absolute, so runners in methods/<method>/ can prepare their inputs on demand (ensure_prepared)
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+INPUT_DIR = os.path.join(REPO_ROOT, "assets", "audio_samples", "original_rate")
+OUTPUT_DIR = os.path.join(REPO_ROOT, "assets", "prepared")
+METHODS_DIR = os.path.join(REPO_ROOT, "methods")
+MANIFEST_FILENAME = "prepare_manifest.json"
+STREAMING_BLOCK_SIZE = 65536 # Samples read per block in streaming mode
+STREAM_ABOVE_SECONDS = 600 # Sources longer than this are resampled in streaming mode
+MANIFEST_VERSION = 1
+
+def resampler_settings(backend=DEFAULT_BACKEND):
+    """Describes the resampler; outputs made with different settings are rebuilt."""
+    settings = {'backend': backend, 'dtype': 'float32'}
+    if backend in ('numpy_poly', 'scipy_poly'):
+        settings.update({'window': ['kaiser', 5.0], 'half_len_factor': 10})
+    elif backend in SOXR_QUALITIES:
+        settings['quality'] = SOXR_QUALITIES[backend]
+    return settings
 
-def resample_audio(input_path, output_path, target_sr):
-    """Resamples an audio file to the target sample rate."""
+def load_manifest(path):
+    """Loads the prepare manifest, or returns an empty one if it's missing or unreadable."""
+    empty = {'version': MANIFEST_VERSION, 'sources': {}, 'outputs': {}}
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return empty
+    if manifest.get('version') != MANIFEST_VERSION:
+        logging.info(f"Manifest {path} has an old format; all outputs will be rebuilt.")
+        return empty
+    return manifest
+
+def save_manifest(manifest, path):
+    """Writes the manifest atomically, so an interrupted run never leaves a truncated file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def output_is_current(output_path, entry, source_record, target_sr, settings):
+    """Checks an output against its manifest entry: same source content, settings and checksum."""
+    if entry is None or not os.path.exists(output_path):
+        return False
+    if (entry.get('source_sha256') != source_record['sha256'] or entry.get('target_sr') != target_sr
+            or entry.get('resampler') != settings):
+        return False
+    # The output itself must not have been modified since it was written
+    current = cached_file_sha256(output_path, entry)
+    return current['sha256'] == entry.get('sha256')
+
+def prepare_file(input_path, outputs, backend=DEFAULT_BACKEND, keep_audio=False):
+    """
+    Decodes a source file once and writes it at every requested sample rate.
+
+    Args:
+        input_path (str): Source audio file
+        outputs (list): (output_path, target_sr) pairs to produce
+        backend (str): Resampler backend (see utils.resampling.BACKENDS)
+        keep_audio (bool): Also return the 16-bit samples written, for the corpus store
+
+    Returns:
+        tuple: (input_path, {output filename: manifest entry} for the outputs written,
+            {output filename: int16 samples} if keep_audio else {})
+    """
+    written = {}
+    audio = {}
     try:
         logging.info(f"Loading {input_path}...")
-        # Load audio file using librosa, forcing mono and using original sample rate
-        y, sr = librosa.load(input_path, sr=None, mono=True)
-
-        if sr == target_sr:
-            logging.info(f"Audio already at target rate {target_sr} Hz. Copying directly.")
-            # If already at target rate, just copy to avoid potential quality loss
-            # Using soundfile for copy to ensure format consistency if needed
-            sf.write(output_path, y, sr)
-        else:
-            logging.info(f"Resampling from {sr} Hz to {target_sr} Hz...")
-            # Resample using librosa
-            y_resampled = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+        # Map the WAV data at the original sample rate and downmix to mono (as librosa.load does),
+        # converting block by block into a single float32 buffer
+        y, sr = wavio.read(input_path, dtype='float32', mono=True)
+
+        for output_path, target_sr in outputs:
+            if sr == target_sr:
+                logging.info(f"Audio already at target rate {target_sr} Hz. Copying directly.")
+            else:
+                logging.info(f"Resampling from {sr} Hz to {target_sr} Hz...")
+            # Save the resampled audio file using soundfile, converted to 16-bit here so the
+            # exact samples in the file can also go to the corpus store without reading it back
+            pcm = wavio.to_pcm16(resample(y, sr, target_sr, backend))
+            sf.write(output_path, pcm, target_sr)
+            logging.info(f"Successfully processed {input_path} -> {output_path}")
+            written[os.path.basename(output_path)] = dict(cached_file_sha256(output_path, None), target_sr=target_sr)
+            if keep_audio:
+                audio[os.path.basename(output_path)] = pcm
+
+    except Exception as e:
+        logging.error(f"Error processing {input_path}: {e}")
+    return input_path, written, audio
+
+def prepare_file_streaming(input_path, outputs, backend=DEFAULT_BACKEND, keep_audio=False, block_size=STREAMING_BLOCK_SIZE):
+    """
+    Like prepare_file(), but reads the source in blocks and writes every output as it goes.
 
-            # Save the resampled audio file using soundfile
-            logging.info(f"Saving resampled audio to {output_path}...")
-            sf.write(output_path, y_resampled, target_sr)
+    Each target rate has its own stateful resampler that carries its filter state
+    across block boundaries, so peak memory depends on block_size and not on the
+    length of the recording. The result matches the one-shot path within tolerance.
+    Nothing is kept in memory, whatever keep_audio says (the corpus store reads
+    these outputs back from the files).
+    """
+    written = {}
+    try:
+        logging.info(f"Streaming {input_path} in blocks of {block_size} samples...")
+        with ExitStack() as stack:
+            source = stack.enter_context(sf.SoundFile(input_path))
+            sr = source.samplerate
+            targets = []
+            for output_path, target_sr in outputs:
+                resampler = create_stream(backend, sr, target_sr) if sr != target_sr else None
+                # Same format sf.write() picks for the one-shot path
+                sink = stack.enter_context(sf.SoundFile(output_path, 'w', samplerate=target_sr, channels=1))
+                targets.append((resampler, sink))
+
+            for block in source.blocks(blocksize=block_size, dtype='float32'):
+                if block.ndim > 1:
+                    block = np.mean(block, axis=1)
+                for resampler, sink in targets:
+                    sink.write(resampler.process(block) if resampler else block)
+            for resampler, sink in targets:
+                if resampler:
+                    sink.write(resampler.flush())
 
-        logging.info(f"Successfully processed {input_path} -> {output_path}")
+        for output_path, target_sr in outputs:
+            logging.info(f"Successfully processed {input_path} -> {output_path}")
+            written[os.path.basename(output_path)] = dict(cached_file_sha256(output_path, None), target_sr=target_sr)
 
     except Exception as e:
         logging.error(f"Error processing {input_path}: {e}")
+        # Don't leave truncated outputs behind
+        for output_path, _ in outputs:
+            if os.path.basename(output_path) not in written and os.path.exists(output_path):
+                os.remove(output_path)
+    return input_path, written, {}
+
+def prune_outputs(manifest, source_names):
+    """Deletes the outputs recorded in the manifest whose source file is gone."""
+    for output_filename, entry in list(manifest['outputs'].items()):
+        if entry.get('source') in source_names:
+            continue
+        output_path = os.path.join(OUTPUT_DIR, output_filename)
+        if os.path.exists(output_path):
+            logging.info(f"Removing {output_path}, its source {entry.get('source')} is gone.")
+            os.remove(output_path)
+        del manifest['outputs'][output_filename]
+    for source_name in list(manifest['sources']):
+        if source_name not in source_names:
+            del manifest['sources'][source_name]
+
+def update_corpus_store(store_dir, manifest, target_rates, audio=None):
+    """
+    Packs the prepared outputs of every target rate into the corpus store.
+
+    The store holds exactly the samples a runner would decode from the prepared WAV
+    files. They're taken from memory for the outputs written in this run (audio, the
+    int16 samples prepare_file() returned), copied from the store's previous data
+    for unchanged clips, and only read back from the WAV file otherwise (streamed
+    outputs, or a new store). A rate is only rewritten when its set of outputs or
+    any of their checksums changed.
+    """
+    audio = audio or {}
+    previous = CorpusStore(store_dir) # Maps the current data files, which write_rate() may remove
+    index = previous.index
+    for key, target_sr in target_rates.items():
+        current = {}
+        for output_filename, entry in manifest['outputs'].items():
+            output_path = os.path.join(OUTPUT_DIR, output_filename)
+            if entry.get('target_sr') != target_sr or not os.path.exists(output_path):
+                continue
+            name, _ = split_rate_suffix(os.path.splitext(output_filename)[0])
+            current[name] = (output_filename, entry)
+
+        stored = index['rates'].get(key, {}).get('clips', {})
+        if {n: e['sha256'] for n, (_, e) in current.items()} == {n: c.get('sha256') for n, c in stored.items()}:
+            logging.info(f"Corpus store at {target_sr} Hz is up to date.")
+            continue
 
-def main():
-    """Finds audio files and prepares resampled versions."""
+        clips = []
+        sources = {'memory': 0, 'store': 0, 'file': 0}
+        for name, (output_filename, entry) in sorted(current.items()):
+            if output_filename in audio:
+                pcm = audio[output_filename]
+                length = len(pcm)
+                def fill(view, pcm=pcm):
+                    np.multiply(pcm, np.float32(1 / 32768), out=view) # What libsndfile decodes 16-bit PCM to
+                sources['memory'] += 1
+            elif stored.get(name, {}).get('sha256') == entry['sha256']:
+                length = stored[name]['length']
+                def fill(view, name=name):
+                    view[:] = previous.get(name, target_sr)
+                sources['store'] += 1
+            else:
+                output_path = os.path.join(OUTPUT_DIR, output_filename)
+                length = sf.info(output_path).frames
+                def fill(view, path=output_path):
+                    with sf.SoundFile(path) as f:
+                        f.read(out=view, dtype='float32')
+                sources['file'] += 1
+            clips.append({
+                'name': name,
+                'length': length,
+                'source_sha256': entry.get('source_sha256'),
+                'sha256': entry['sha256'],
+                'fill': fill,
+            })
+        logging.info(f"Corpus store at {target_sr} Hz: {sources['memory']} clip(s) from memory, "
+                     f"{sources['store']} from the previous store, {sources['file']} read from the prepared files.")
+        write_rate(store_dir, target_sr, clips)
+
+def enabled_methods(methods=None):
+    """Returns the methods to prepare for: the given ones, or every registered method with a directory."""
+    if methods:
+        return list(methods)
+    found = [m for m in METHOD_SAMPLE_RATES if os.path.isdir(os.path.join(METHODS_DIR, m))]
+    if not found:
+        logging.warning(f"No registered methods found in {METHODS_DIR}/; preparing the rates of all of them.")
+        return list(METHOD_SAMPLE_RATES)
+    return found
+
+@contextmanager
+def manifest_lock():
+    """Serializes preparation runs (the CLI and runners preparing on demand) around the manifest."""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, MANIFEST_FILENAME + ".lock"), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield # Released when the lock file is closed
+
+def ensure_prepared(input_dir, sample_rate, backend=DEFAULT_BACKEND):
+    """
+    On-demand preparation for a runner about to read input_dir at sample_rate.
+
+    If input_dir is the prepared directory, the files at that rate that are missing
+    or stale are built from the sources first (only that rate, nothing pruned).
+    Any other directory is left alone. Failures are logged, and the runner goes on
+    with the files that exist.
+    """
+    if os.path.realpath(input_dir) != os.path.realpath(OUTPUT_DIR):
+        return
+    try:
+        main(prune=False, backend=backend, rates=[sample_rate])
+    except Exception as e:
+        logging.error(f"Preparing the {rate_key(sample_rate)} inputs on demand failed: {e}")
+
+def main(jobs=1, prune=True, streaming=False, stream_above_seconds=STREAM_ABOVE_SECONDS, backend=DEFAULT_BACKEND, methods=None,
+         corpus_store=None, rates=None, rebuild=False):
+    """
+    Finds audio files and prepares the rates the enabled methods read, for new or changed sources.
+
+    rates (a list of sample rates) replaces the methods' rates, for ensure_prepared().
+    With the default backend, existing outputs the manifest doesn't know yet are recorded
+    as they are; rebuild rewrites every output.
+    """
+    with manifest_lock():
+        _prepare(jobs, prune, streaming, stream_above_seconds, backend, methods, corpus_store, rates, rebuild)
+
+def _prepare(jobs, prune, streaming, stream_above_seconds, backend, methods, corpus_store, rates, rebuild):
     logging.info("Starting audio preparation...")
+    if rates:
+        target_rates = {rate_key(sr): sr for sr in sorted(set(rates))}
+        logging.info(f"Preparing rates {list(target_rates.values())}")
+    else:
+        methods = enabled_methods(methods)
+        target_rates = required_sample_rates(methods)
+        logging.info(f"Preparing rates {list(target_rates.values())} for methods {methods}")
+    start = time.perf_counter()
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    manifest_path = os.path.join(OUTPUT_DIR, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+    settings = resampler_settings(backend)
+    logging.info(f"Resampler backend: {backend}")
+    can_stream = True
+    try:
+        create_stream(backend, 48000, 16000)
+    except ValueError:
+        can_stream = False
+        logging.warning(f"Backend {backend} can't stream; long files are resampled in one piece.")
 
     audio_files = glob.glob(os.path.join(INPUT_DIR, "*.wav")) # Adjust pattern if needed (e.g., include .mp3)
     if not audio_files:
@@ -51,22 +304,106 @@ def main():
 
     logging.info(f"Found {len(audio_files)} audio file(s) in {INPUT_DIR}.")
 
+    if prune:
+        prune_outputs(manifest, {os.path.basename(f) for f in audio_files})
+
+    # Collect the stale outputs per source, so each source is decoded at most once
+    work = []
+    up_to_date = 0
+    adopted = 0
     for input_file in audio_files:
         filename = os.path.basename(input_file)
         name, ext = os.path.splitext(filename)
+        # Content hash of the source; only re-read when its size or mtime changed
+        source_record = cached_file_sha256(input_file, manifest['sources'].get(filename))
+        manifest['sources'][filename] = source_record
 
-        for rate_key, target_sr in TARGET_RATES.items():
-            output_filename = f"{name}_{rate_key}{ext}"
+        outputs = []
+        for key, target_sr in target_rates.items():
+            output_filename = f"{name}_{key}{ext}"
             output_path = os.path.join(OUTPUT_DIR, output_filename)
 
-            # Check if the output file already exists to avoid reprocessing
-            if os.path.exists(output_path):
-                logging.info(f"Skipping {output_path}, file already exists.")
+            # Skip outputs made from the same source content with the same settings
+            entry = manifest['outputs'].get(output_filename)
+            if not rebuild and output_is_current(output_path, entry, source_record, target_sr, settings):
+                up_to_date += 1
+                continue
+            if (entry is None and not rebuild and backend == DEFAULT_BACKEND and os.path.exists(output_path)
+                    and sf.info(output_path).samplerate == target_sr):
+                # Written before there was a manifest (like the prepared files in the repository),
+                # with librosa.resample, which is the default backend; recorded instead of rewritten
+                manifest['outputs'][output_filename] = dict(cached_file_sha256(output_path, None), target_sr=target_sr,
+                                                            source=filename, source_sha256=source_record['sha256'],
+                                                            resampler=settings)
+                adopted += 1
                 continue
+            outputs.append((output_path, target_sr))
 
-            resample_audio(input_file, output_path, target_sr)
+        if outputs:
+            info = sf.info(input_file)
+            # Long recordings are streamed so memory stays bounded
+            stream = can_stream and (streaming or info.frames > stream_above_seconds * info.samplerate)
+            work.append((input_file, outputs, stream))
 
-    logging.info("Audio preparation finished.")
+    if adopted:
+        logging.info(f"Recorded {adopted} existing output(s) without a manifest entry as made by {backend} (--rebuild rewrites them).")
+    logging.info(f"{up_to_date} output(s) up to date, {sum(len(outputs) for _, outputs, _ in work)} to build.")
+
+    kept_audio = {} # Samples of the outputs written in this run, for the corpus store
+
+    def record(input_file, written, audio):
+        kept_audio.update(audio)
+        source_name = os.path.basename(input_file)
+        for output_filename, output_record in written.items():
+            manifest['outputs'][output_filename] = dict(
+                output_record,
+                source=source_name,
+                source_sha256=manifest['sources'][source_name]['sha256'],
+                resampler=settings,
+            )
+
+    try:
+        if jobs > 1 and len(work) > 1:
+            logging.info(f"Preparing {len(work)} file(s) with {jobs} worker processes...")
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(prepare_file_streaming if stream else prepare_file, input_file, outputs, backend,
+                                           bool(corpus_store))
+                           for input_file, outputs, stream in work]
+                for done, future in enumerate(as_completed(futures), 1):
+                    input_file, written, audio = future.result()
+                    record(input_file, written, audio)
+                    logging.info(f"[{done}/{len(work)}] {os.path.basename(input_file)}: {len(written)} output(s) written")
+        else:
+            for input_file, outputs, stream in work:
+                record(*(prepare_file_streaming if stream else prepare_file)(input_file, outputs, backend, bool(corpus_store)))
+    finally:
+        # Keep what was built even if the run is interrupted
+        save_manifest(manifest, manifest_path)
+
+    if corpus_store:
+        update_corpus_store(corpus_store, manifest, target_rates, kept_audio)
+
+    logging.info(f"Audio preparation finished in {time.perf_counter() - start:.2f}s.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Resample the source audio files to the rates the methods expect.")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes; each decodes a source once and writes all its rates (default: 1)")
+    parser.add_argument("--no-prune", action="store_true",
+                        help="Keep prepared outputs whose source file is gone")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Resample every file block by block with bounded memory")
+    parser.add_argument("--stream-above-seconds", type=float, default=STREAM_ABOVE_SECONDS,
+                        help=f"Stream sources longer than this many seconds (default: {STREAM_ABOVE_SECONDS})")
+    parser.add_argument("--resampler", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help=f"Resampler backend; compare them with python -m utils.resampling_benchmark (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rewrite every output, even the up-to-date ones and those from before the manifest")
+    parser.add_argument("--methods", nargs='+', choices=list(METHOD_SAMPLE_RATES), default=None,
+                        help="Only prepare the rates these methods read (default: every method in methods/)")
+    parser.add_argument("--corpus-store", nargs='?', const=DEFAULT_CORPUS_STORE, default=None, metavar="DIR",
+                        help=f"Also pack the prepared audio into a memory-mapped corpus store (default DIR: {DEFAULT_CORPUS_STORE})")
+    args = parser.parse_args()
+
+    main(max(1, args.jobs), not args.no_prune, args.streaming, args.stream_above_seconds, args.resampler, args.methods,
+         args.corpus_store, rebuild=args.rebuild)
@@ -1,3 +1,133 @@
+// Tiled spectrograms: long files also have a pyramid of zoom levels next to their
+// overview image (utils/spectrogram_tiles.py, described by the data-tile-* attributes).
+// Zooming in covers the overview with the tiles of the level that matches the zoom,
+// and only the tiles inside the visible time range are loaded.
+class TiledSpectrogram {
+    constructor(container, onChange) {
+        const data = container.dataset;
+        this.container = container;
+        this.onChange = onChange; // Called after every zoom or scroll
+        this.base = data.tiles;
+        this.duration = parseFloat(data.duration);
+        this.tileWidth = parseInt(data.tileWidth, 10);
+        this.columns = data.tileColumns.split(',').map(Number); // Columns per level, coarsest first
+        this.columnSeconds = parseFloat(data.tileColumnSeconds); // At the finest level
+        this.zoom = 1;
+        this.start = 0; // First visible second
+        this.tiles = new Map(); // "level/index" -> <img> in the layer
+
+        this.layer = document.createElement('div');
+        this.layer.className = 'spectrogram-tiles';
+        this.layer.style.display = 'none';
+        container.appendChild(this.layer);
+
+        const controls = document.createElement('div');
+        controls.className = 'tile-zoom-controls';
+        [['\u2212', 0.5, 'Zoom out'], ['+', 2, 'Zoom in']].forEach(([label, factor, title]) => {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.textContent = label;
+            button.title = title;
+            button.addEventListener('click', e => {
+                e.stopPropagation(); // Not a seek
+                this.setZoom(this.zoom * factor, this.start + this.span() / 2);
+            });
+            controls.appendChild(button);
+        });
+        container.appendChild(controls);
+
+        // Ctrl + wheel zooms around the pointer; the plain wheel keeps scrolling the page
+        container.addEventListener('wheel', e => {
+            if (!e.ctrlKey) return;
+            e.preventDefault();
+            const rect = container.getBoundingClientRect();
+            const anchor = this.start + (e.clientX - rect.left) / rect.width * this.span();
+            this.setZoom(this.zoom * (e.deltaY < 0 ? 1.5 : 1 / 1.5), anchor);
+        }, { passive: false });
+        window.addEventListener('resize', () => this.render());
+    }
+
+    span() {
+        return this.duration / this.zoom;
+    }
+
+    // Deepest useful zoom: one finest-level column per screen pixel
+    maxZoom() {
+        const pixels = this.container.offsetWidth * (window.devicePixelRatio || 1);
+        return Math.max(1, this.columns[this.columns.length - 1] / Math.max(pixels, 1));
+    }
+
+    // Zoom in or out, keeping the second at anchor under the same pixel
+    setZoom(zoom, anchor) {
+        const fraction = (anchor - this.start) / this.span();
+        this.zoom = Math.min(Math.max(zoom, 1), this.maxZoom());
+        this.scrollTo(anchor - fraction * this.span());
+    }
+
+    scrollTo(start) {
+        this.start = Math.min(Math.max(start, 0), this.duration - this.span());
+        this.render();
+    }
+
+    // Page along with playback, so the cursor stays in view
+    follow(time) {
+        if (this.zoom > 1 && (time < this.start || time > this.start + this.span())) {
+            this.scrollTo(time - this.span() * 0.1);
+        }
+    }
+
+    // Coarsest level with at least one column per screen pixel at this zoom
+    level() {
+        const pixels = this.container.offsetWidth * (window.devicePixelRatio || 1) * this.zoom;
+        const level = this.columns.findIndex(columns => columns >= pixels);
+        return level === -1 ? this.columns.length - 1 : level;
+    }
+
+    render() {
+        if (this.zoom <= 1) {
+            this.zoom = 1;
+            this.start = 0;
+            this.layer.style.display = 'none'; // The overview image shows the whole file
+            this.onChange();
+            return;
+        }
+        this.layer.style.display = '';
+        const level = this.level();
+        const columns = this.columns[level];
+        const columnSeconds = this.columnSeconds * 2 ** (this.columns.length - 1 - level);
+        const tileSeconds = columnSeconds * this.tileWidth;
+        const pixelsPerSecond = this.container.offsetWidth / this.span();
+        const first = Math.max(0, Math.floor(this.start / tileSeconds));
+        const last = Math.min(Math.ceil(columns / this.tileWidth), Math.ceil((this.start + this.span()) / tileSeconds)) - 1;
+
+        const visible = new Set();
+        for (let index = first; index <= last; index++) {
+            const key = `${level}/${index}`;
+            visible.add(key);
+            let tile = this.tiles.get(key);
+            if (!tile) {
+                tile = document.createElement('img');
+                tile.className = 'spectrogram-tile';
+                tile.alt = '';
+                tile.src = `${this.base}/${key}.png`;
+                this.layer.appendChild(tile);
+                this.tiles.set(key, tile);
+            }
+            const tileColumns = Math.min(this.tileWidth, columns - index * this.tileWidth);
+            tile.style.left = `${(index * tileSeconds - this.start) * pixelsPerSecond}px`;
+            tile.style.width = `${tileColumns * columnSeconds * pixelsPerSecond}px`;
+        }
+        // Drop tiles that scrolled out of view or belong to another level
+        this.tiles.forEach((tile, key) => {
+            if (!visible.has(key)) {
+                tile.remove();
+                this.tiles.delete(key);
+            }
+        });
+        this.onChange();
+    }
+}
+
 // Add playback cursor functionality
 document.querySelectorAll('.audio-container').forEach(container => {
     const audio = container.querySelector('audio');
@@ -6,6 +136,14 @@ document.querySelectorAll('.audio-container').forEach(container => {
     
     if (!audio || !cursor || !spectrogram) return;
     
+    // Keeps the cursor in place when the tiled view zooms or scrolls
+    const tiles = spectrogram.dataset.tiles ? new TiledSpectrogram(spectrogram, () => updateCursor()) : null;
+    
+    // Visible time range: the whole file, unless a tiled spectrogram is zoomed in
+    const viewStart = () => tiles ? tiles.start : 0;
+    const viewSpan = () => tiles ? tiles.span() : audio.duration;
+    const timeAt = x => viewStart() + x / spectrogram.offsetWidth * viewSpan();
+    
     // Initialize cursor position
     cursor.style.left = '0px';
     
@@ -13,9 +151,11 @@ document.querySelectorAll('.audio-container').forEach(container => {
     function updateCursor() {
         if (!audio.duration) return;  // Skip if duration is not available
         
-        const progress = audio.currentTime / audio.duration;
+        if (tiles) tiles.follow(audio.currentTime);
+        const progress = (audio.currentTime - viewStart()) / viewSpan();
         const position = progress * spectrogram.offsetWidth;
         cursor.style.left = `${position}px`;
+        cursor.style.display = progress < 0 || progress > 1 ? 'none' : '';
         
         // Request next frame if playing
         if (!audio.paused) {
@@ -41,7 +181,7 @@ document.querySelectorAll('.audio-container').forEach(container => {
         const progress = x / rect.width;
         
         if (progress >= 0 && progress <= 1) {  // Ensure valid range
-            audio.currentTime = progress * audio.duration;
+            audio.currentTime = timeAt(x);
             cursor.style.left = `${x}px`;
         }
     });
@@ -50,8 +190,7 @@ document.querySelectorAll('.audio-container').forEach(container => {
     spectrogram.addEventListener('mousemove', (e) => {
         const rect = spectrogram.getBoundingClientRect();
         const x = e.clientX - rect.left;
-        const progress = x / rect.width;
-        const timeInSeconds = progress * audio.duration;
+        const timeInSeconds = timeAt(x);
         
         if (timeInSeconds >= 0 && timeInSeconds <= audio.duration) {
             const minutes = Math.floor(timeInSeconds / 60);
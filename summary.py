@@ -4,7 +4,10 @@ import logging
 import argparse
 from collections import defaultdict
 import re # Import regex
-from utils.spectrogram import generate_spectrograms_for_directory
+from utils.spectrogram import RENDERERS, DEFAULT_RENDERER
+from utils.spectrogram_cache import CACHE_FILENAME, sync_spectrograms, prune_directory
+from utils.spectrogram_tiles import tiles_dir_for, load_manifest
+from utils.method_registry import METHOD_SAMPLE_RATES, rate_key, split_rate_suffix
 import shutil
 from jinja2 import Template
 
@@ -35,8 +38,14 @@ METHOD_CONFIG = {
         ) or "Model: DTLN_norm_500h.h5 (Default)"
     },
     "rnnoise": {
-        "expected_suffix": "_rnnoise_model_enhanced.wav", # Current expected suffix
-        "config_extraction": lambda fname: "Model: Default"
+        "expected_suffix": "_rnnoise48k_model_enhanced.wav", # Native 48 kHz path (run.py default)
+        "config_extraction": lambda fname: "Model: Default, native 48 kHz",
+        # Other names, in order of preference; an earlier suffix wins for the same base name
+        "alternative_suffixes": [
+            ("_rnnoise48k_default_enhanced.wav", "Model: Built-in, native 48 kHz"),
+            ("_rnnoise_model_enhanced.wav", "Model: Default, legacy 16k frames"), # run.py --legacy-frames
+            ("_rnnoise_default_enhanced.wav", "Model: Built-in, legacy 16k frames"),
+        ],
     },
     "supervoice_flow": { # Added for Supervoice Enhance
         "expected_suffix": "_supervoiceenhance.wav",
@@ -44,15 +53,7 @@ METHOD_CONFIG = {
     }     
 }
 
-# Define which original sample rate corresponds to which method's input
-METHOD_INPUT_RATE_KEY = {
-    "voice_fixer_0": "_44k",
-    "voice_fixer_1": "_44k",
-    "dtln": "_16k",
-    "rnnoise": "_16k", # Assuming rnnoise uses 16k input based on run.py
-    "supervoice_flow": "_44k", # Uses 24k internally, but prefers higher rate input for resampling
-    "rnnoise_default": "_16k", # If we split rnnoise methods
-}
+# The input rate of each method comes from utils/method_registry.py (METHOD_SAMPLE_RATES)
 
 # Updated Row Template without heading rows
 ROW_TEMPLATE = """
@@ -63,7 +64,7 @@ ROW_TEMPLATE = """
     <td class="method-cell" data-method="original">
         <div class="audio-container">
             <audio controls class="audio-player" src="{original_path}"></audio>
-            <div class="spectrogram-container">
+            <div class="spectrogram-container"{original_tiles}>
                 <div class="playback-cursor"></div>
                 <img 
                     src="{original_spectrogram}" 
@@ -89,7 +90,7 @@ CELL_TEMPLATE = """
 AUDIO_PLAYER_TEMPLATE = (
     '<div class="audio-container">'
     '<audio controls class="audio-player" src="{path}"></audio>'
-    '<div class="spectrogram-container">'
+    '<div class="spectrogram-container"{tile_attributes}>'
     '<div class="playback-cursor"></div>'
     '<img '
     'src="{spectrogram_path}" '
@@ -104,6 +105,21 @@ AUDIO_PLAYER_TEMPLATE = (
 # Updated placeholder for missing files
 NO_FILE_PLACEHOLDER = '<div class="text-gray-400 dark:text-gray-600 italic">File not found</div>'
 
+def tile_attributes(spectrogram_path):
+    """Data attributes that let static/summary.js zoom into a long file's tile pyramid ('' if it has none)."""
+    tiles_dir = tiles_dir_for(spectrogram_path)
+    manifest = load_manifest(tiles_dir)
+    if manifest is None:
+        return ""
+    attributes = {
+        'tiles': tiles_dir,
+        'duration': manifest['duration'],
+        'tile-width': manifest['tile_width'],
+        'tile-columns': ",".join(str(c) for c in manifest['columns']), # Coarsest level first
+        'tile-column-seconds': manifest['hop_seconds'], # At the finest level
+    }
+    return "".join(f' data-{name}="{value}"' for name, value in attributes.items())
+
 def ensure_directory_exists(directory):
     """Ensure that a directory exists, create if it doesn't."""
     if not os.path.exists(directory):
@@ -119,7 +135,7 @@ def copy_static_files():
 
 def find_files():
     """Finds original prepared files, corresponding enhanced files, and determines method configs."""
-    results = defaultdict(lambda: {'original_16k': None, 'original_44k': None, 'methods': {}})
+    results = defaultdict(lambda: {'originals': {}, 'methods': {}}) # originals: rate key -> path
     methods_present = [d for d in os.listdir(METHODS_DIR) if os.path.isdir(os.path.join(METHODS_DIR, d))]
     logging.info(f"Detected methods (directories): {methods_present}")
 
@@ -131,13 +147,9 @@ def find_files():
     # Find original prepared files
     prepared_files = glob.glob(os.path.join(PREPARED_DIR, "*.wav"))
     for prep_file in prepared_files:
-        basename = os.path.basename(prep_file)
-        if "_16k.wav" in basename:
-            base_name = basename.replace("_16k.wav", "")
-            results[base_name]['original_16k'] = prep_file
-        elif "_44k.wav" in basename:
-            base_name = basename.replace("_44k.wav", "")
-            results[base_name]['original_44k'] = prep_file
+        base_name, key = split_rate_suffix(os.path.splitext(os.path.basename(prep_file))[0])
+        if key:
+            results[base_name]['originals'][key] = prep_file
         else:
             logging.warning(f"Skipping unexpected file in prepared dir: {prep_file}")
 
@@ -145,98 +157,88 @@ def find_files():
     for method, config_details in active_method_configs.items():
         method_output_dir = os.path.join(METHODS_DIR, method, "output")
         enhanced_files = glob.glob(os.path.join(method_output_dir, "*.wav"))
-        suffix = config_details["expected_suffix"]
+        suffixes = [(config_details["expected_suffix"], None)] + config_details.get("alternative_suffixes", [])
         config_extractor = config_details["config_extraction"]
-        config_found_for_method = False # Flag to capture first config
+        matched_rank = {} # Base name -> index in suffixes of the file shown for it
+        config_rank = len(suffixes) # Config shown in the method header: from the most preferred suffix found
 
-        logging.debug(f"Searching for suffix '{suffix}' in {method_output_dir}")
+        logging.debug(f"Searching for suffixes {[s for s, _ in suffixes]} in {method_output_dir}")
 
-        for enh_file in enhanced_files:
+        for enh_file in sorted(enhanced_files):
             enh_basename_full = os.path.basename(enh_file)
 
-            is_match = False
-            config_text = ""
-            potential_base = ""
-            base_name_match = ""
-
-            # Check primary suffix
-            if enh_basename_full.endswith(suffix):
-                is_match = True
-                temp_base = enh_basename_full.replace(suffix, "")
-                if temp_base.endswith("_16k"):
-                    base_name_match = temp_base[:-4]
-                elif temp_base.endswith("_44k"):
-                    base_name_match = temp_base[:-4]
-                else:
-                    base_name_match = temp_base
-                    logging.debug(f"No rate suffix found for {enh_basename_full}, using {base_name_match} as base.")
-
-                config_text = config_extractor(enh_basename_full)
-            # Check alternative rnnoise suffix
-            elif method == "rnnoise" and enh_basename_full.endswith("_rnnoise_default_enhanced.wav"):
-                is_match = True
-                temp_base = enh_basename_full.replace("_rnnoise_default_enhanced.wav", "")
-                if temp_base.endswith("_16k"):
-                    base_name_match = temp_base[:-4]
-                elif temp_base.endswith("_44k"):
-                    base_name_match = temp_base[:-4]
-                else:
-                    base_name_match = temp_base
-                    logging.debug(f"No rate suffix found for {enh_basename_full}, using {base_name_match} as base.")
-
-                config_text = "Model: Default"
-
-            if is_match:
-                # Use the correctly extracted base_name_match for lookup
-                if base_name_match in results:
-                    relative_path = os.path.relpath(enh_file)
-                    # Store only the path now in the main results
-                    results[base_name_match]['methods'][method] = {
-                        'path': relative_path
-                    }
-                    logging.debug(f"Matched {enh_basename_full} to base {base_name_match} for method {method}")
-
-                    # Capture the config for the method header (only once)
-                    if not config_found_for_method and config_text:
-                        method_configs_summary[method] = config_text
-                        config_found_for_method = True
-                        logging.info(f"Captured config for method '{method}': {config_text}")
-
-                else:
-                    logging.warning(f"Found enhanced file '{enh_basename_full}' for method '{method}', but no matching original base name '{base_name_match}'.")
-            else:
-                logging.debug(f"Skipping file with non-matching suffix in {method} output: {enh_basename_full} (expected suffix: {suffix} or alt)")
+            rank = next((i for i, (s, _) in enumerate(suffixes) if enh_basename_full.endswith(s)), None)
+            if rank is None:
+                logging.debug(f"Skipping file with non-matching suffix in {method} output: {enh_basename_full} (expected one of {[s for s, _ in suffixes]})")
+                continue
+            suffix, config_text = suffixes[rank]
+            temp_base = enh_basename_full[:-len(suffix)]
+            base_name_match, key = split_rate_suffix(temp_base)
+            if not key:
+                logging.debug(f"No rate suffix found for {enh_basename_full}, using {base_name_match} as base.")
+            config_text = config_text or config_extractor(enh_basename_full)
+
+            # Use the correctly extracted base_name_match for lookup
+            if base_name_match not in results:
+                logging.warning(f"Found enhanced file '{enh_basename_full}' for method '{method}', but no matching original base name '{base_name_match}'.")
+                continue
+            if matched_rank.get(base_name_match, len(suffixes)) <= rank:
+                logging.debug(f"Skipping {enh_basename_full}, {method} already has a preferred output for {base_name_match}")
+                continue
+            matched_rank[base_name_match] = rank
+            relative_path = os.path.relpath(enh_file)
+            # Store only the path now in the main results
+            results[base_name_match]['methods'][method] = {
+                'path': relative_path
+            }
+            logging.debug(f"Matched {enh_basename_full} to base {base_name_match} for method {method}")
+
+            # Capture the config for the method header
+            if rank < config_rank and config_text:
+                method_configs_summary[method] = config_text
+                config_rank = rank
+                logging.info(f"Captured config for method '{method}': {config_text}")
 
     # Filter out entries with no original files found
-    valid_results = {k: v for k, v in results.items() if v['original_16k'] or v['original_44k']}
+    valid_results = {k: v for k, v in results.items() if v['originals']}
     logging.info(f"Found results for {len(valid_results)} base audio files.")
     processed_methods = list(active_method_configs.keys())
     processed_methods.sort() # Sort here for consistency
     return valid_results, processed_methods, method_configs_summary
 
-def generate_spectrograms(methods):
-    """Generate spectrograms for all audio files."""
-    logging.info("Generating spectrograms for all audio files...")
-    
-    # Generate spectrograms for prepared files
-    generate_spectrograms_for_directory(PREPARED_DIR, os.path.join(SPECTROGRAMS_DIR, "prepared"))
+def generate_spectrograms(methods, jobs=1, renderer=DEFAULT_RENDERER, force=False):
+    """Brings the spectrograms of all audio files up to date, rendering only new or changed ones."""
+    logging.info("Updating spectrograms for all audio files...")
     
-    # Generate spectrograms for each method's output
+    # Spectrograms for prepared files, then for each method's output
+    dir_pairs = [(PREPARED_DIR, os.path.join(SPECTROGRAMS_DIR, "prepared"))]
     for method in methods:
         method_output_dir = os.path.join(METHODS_DIR, method, "output")
         if os.path.exists(method_output_dir):
-            generate_spectrograms_for_directory(
-                method_output_dir,
-                os.path.join(SPECTROGRAMS_DIR, method)
-            )
+            dir_pairs.append((method_output_dir, os.path.join(SPECTROGRAMS_DIR, method)))
+    
+    # One pool for all directories, so workers stay busy across them
+    stats = sync_spectrograms(dir_pairs, jobs, renderer, force)
+    
+    # Directories of methods that have no output anymore
+    synced = {os.path.normpath(output_dir) for _, output_dir in dir_pairs}
+    for name in sorted(os.listdir(SPECTROGRAMS_DIR)):
+        output_dir = os.path.join(SPECTROGRAMS_DIR, name)
+        if os.path.normpath(output_dir) not in synced and os.path.exists(os.path.join(output_dir, CACHE_FILENAME)):
+            logging.info(f"Removing spectrograms of {name}, it has no audio anymore.")
+            stats['removed'] += prune_directory(output_dir)
+    
+    logging.info(f"Spectrograms: {stats['rendered']} rendered, {stats['current']} up to date, "
+                 f"{stats['removed']} removed, {stats['failed']} failed.")
 
-def generate_html(results, methods, method_configs, regenerate_spectrograms=False):
+def generate_html(results, methods, method_configs, update_spectrograms=True, regenerate_spectrograms=False, jobs=1,
+                  spectrogram_renderer=DEFAULT_RENDERER):
     """Generates the HTML summary page with config info in headers."""
-    # Generate spectrograms if requested
-    if regenerate_spectrograms:
-        generate_spectrograms(methods)
+    # Render the missing or stale spectrograms (all of them if regenerating)
+    if update_spectrograms or regenerate_spectrograms:
+        generate_spectrograms(methods, jobs, spectrogram_renderer, force=regenerate_spectrograms)
     else:
-        logging.info("Skipping spectrogram generation. Use --regenerate-spectrograms to regenerate.")
+        logging.info("Skipping spectrogram generation (--no-spectrograms).")
 
     # Read the template file first
     try:
@@ -286,18 +288,12 @@ def generate_html(results, methods, method_configs, regenerate_spectrograms=Fals
         data = results[base_name]
         method_cells = ""
 
-        # Determine which original to show (same logic as before)
-        original_to_display = data['original_16k'] # Default
-        original_rate_key = "16k"
-        if not original_to_display and data['original_44k']:
-             original_to_display = data['original_44k']
-             original_rate_key = "44k"
-        elif data['original_44k']:
-            # Prefer 44k if any active method expects it
-            active_methods_for_base = data['methods'].keys()
-            if any(METHOD_INPUT_RATE_KEY.get(m) == '_44k' for m in active_methods_for_base):
-                original_to_display = data['original_44k']
-                original_rate_key = "44k"
+        # Show the highest-rate original that one of the methods with output for this file read,
+        # falling back to the highest-rate original prepared
+        originals = data['originals']
+        rates_read = {rate_key(METHOD_SAMPLE_RATES[m]) for m in data['methods'] if m in METHOD_SAMPLE_RATES}
+        candidates = [k for k in originals if k in rates_read] or list(originals)
+        original_to_display = originals[max(candidates, key=lambda k: int(k[:-1]))] if candidates else None
 
         if not original_to_display:
             logging.warning(f"No prepared original found for base name '{base_name}'. Skipping row.")
@@ -321,7 +317,8 @@ def generate_html(results, methods, method_configs, regenerate_spectrograms=Fals
                 )
                 audio_player = AUDIO_PLAYER_TEMPLATE.format(
                     path=audio_path,
-                    spectrogram_path=spectrogram_path
+                    spectrogram_path=spectrogram_path,
+                    tile_attributes=tile_attributes(spectrogram_path)
                 )
                 method_label = method.replace('_', ' ').title()
                 if method == "supervoice_flow":
@@ -345,6 +342,7 @@ def generate_html(results, methods, method_configs, regenerate_spectrograms=Fals
             base_name=base_name,
             original_path=original_path_relative,
             original_spectrogram=original_spectrogram_path,
+            original_tiles=tile_attributes(original_spectrogram_path),
             method_cells=method_cells
         ))
 
@@ -367,7 +365,13 @@ def main():
     """Main function to find files and generate summary."""
     parser = argparse.ArgumentParser(description="Generate HTML summary of audio enhancement results.")
     parser.add_argument('--regenerate-spectrograms', action='store_true', 
-                      help='Regenerate spectrograms for all audio files')
+                      help='Regenerate spectrograms for all audio files, even those that are up to date')
+    parser.add_argument('--no-spectrograms', action='store_true',
+                      help='Leave the spectrograms as they are (by default only new or changed ones are rendered)')
+    parser.add_argument('--jobs', type=int, default=1,
+                      help='Number of worker processes for spectrogram generation (default: 1)')
+    parser.add_argument('--spectrogram-renderer', choices=RENDERERS, default=DEFAULT_RENDERER,
+                      help=f'Spectrogram renderer (default: {DEFAULT_RENDERER}; matplotlib is the original, slower path)')
     args = parser.parse_args()
 
     # Ensure directories exist and copy static files
@@ -384,7 +388,8 @@ def main():
         return
 
     # Generate HTML using the found results, methods, and configs
-    generate_html(results, methods_found, method_configs, args.regenerate_spectrograms)
+    generate_html(results, methods_found, method_configs, not args.no_spectrograms, args.regenerate_spectrograms, max(1, args.jobs),
+                  args.spectrogram_renderer)
 
 if __name__ == "__main__":
     main()
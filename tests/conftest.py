@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The tests import the shared utils package the way the runners do: by putting the
+# repository root on sys.path. Modules of a method are imported from its directory.
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
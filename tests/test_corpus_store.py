@@ -0,0 +1,135 @@
+import os
+import pickle
+
+import numpy as np
+import soundfile as sf
+
+from utils import corpus_store
+from utils.corpus_store import (CorpusStore, StoreClip, input_filename, input_num_samples, list_inputs, load_index,
+                                read_input, read_input_blocks, write_rate)
+
+
+def clip(name, audio, sha256=None):
+    audio = np.asarray(audio, dtype=np.float32)
+    def fill(view):
+        view[:] = audio
+    return {'name': name, 'length': len(audio), 'source_sha256': 'src-' + name, 'sha256': sha256 or name, 'fill': fill}
+
+
+def clips_of(rng, sizes):
+    return {f"clip{i}": rng.uniform(-1, 1, size).astype(np.float32) for i, size in enumerate(sizes)}
+
+
+def data_files(store_dir):
+    return sorted(f for f in os.listdir(store_dir) if f.endswith('.f32'))
+
+
+def test_round_trip(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    audio = clips_of(np.random.default_rng(0), [100, 0, 2500])
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in audio.items()])
+    store = CorpusStore(store_dir)
+    assert store.sample_rates() == [16000]
+    assert store.names(16000) == sorted(audio)
+    for name, a in audio.items():
+        view = store.get(name, 16000)
+        assert np.array_equal(view, a)
+        assert not view.flags.writeable or len(view) == 0
+        assert store.clip_info(name, 16000)['source_sha256'] == 'src-' + name
+
+
+def test_data_files_are_content_addressed(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    audio = clips_of(np.random.default_rng(1), [300, 400])
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in audio.items()])
+    first = data_files(store_dir)
+    # Same content, same file
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in audio.items()])
+    assert data_files(store_dir) == first
+    assert load_index(store_dir)['rates']['16k']['data_file'] == first[0]
+    # Other rates get their own file
+    write_rate(store_dir, 48000, [clip('x', np.zeros(10))])
+    assert len(data_files(store_dir)) == 2
+
+
+def test_rewrite_keeps_readers_consistent(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    rng = np.random.default_rng(2)
+    old = clips_of(rng, [500, 700])
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in old.items()])
+    reader = CorpusStore(store_dir) # Maps the data file as the index describes it now
+    old_file = data_files(store_dir)[0]
+
+    new = clips_of(rng, [900, 100, 50])
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in new.items()])
+    # The old data file is gone once the index no longer references it...
+    assert old_file not in data_files(store_dir)
+    # ...but a reader that opened the store before still reads the old clips in full
+    for name, a in old.items():
+        assert np.array_equal(reader.get(name, 16000), a)
+    # and a new reader sees only the new ones
+    fresh = CorpusStore(store_dir)
+    assert fresh.names(16000) == sorted(new)
+    for name, a in new.items():
+        assert np.array_equal(fresh.get(name, 16000), a)
+    assert not [f for f in os.listdir(store_dir) if '.tmp-' in f]
+
+
+def test_failed_write_leaves_the_store_unchanged(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    audio = clips_of(np.random.default_rng(3), [200])
+    write_rate(store_dir, 16000, [clip(name, a) for name, a in audio.items()])
+    index = load_index(store_dir)
+
+    def broken(view):
+        raise OSError("read failed")
+    try:
+        write_rate(store_dir, 16000, [dict(clip('other', np.zeros(10)), fill=broken)])
+    except OSError:
+        pass
+    assert load_index(store_dir) == index
+    assert np.array_equal(CorpusStore(store_dir).get('clip0', 16000), audio['clip0'])
+    assert not [f for f in os.listdir(store_dir) if '.tmp-' in f]
+
+
+def test_reader_retries_when_a_data_file_disappears(tmp_path, monkeypatch):
+    store_dir = str(tmp_path / 'store')
+    write_rate(store_dir, 16000, [clip('a', np.ones(10))])
+    stale = load_index(store_dir)
+    stale['rates']['16k'] = dict(stale['rates']['16k'], data_file='audio_16k-gone.f32')
+    real_load_index = corpus_store.load_index
+    calls = []
+    # The first index read describes a data file a writer has since removed
+    monkeypatch.setattr(corpus_store, 'load_index', lambda d: calls.append(d) or (stale if len(calls) == 1 else real_load_index(d)))
+    store = CorpusStore(store_dir)
+    assert len(calls) == 2
+    assert np.array_equal(store.get('a', 16000), np.ones(10))
+
+
+def test_store_clips_as_runner_inputs(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    audio = clips_of(np.random.default_rng(4), [1000, 2000])
+    write_rate(store_dir, 24000, [clip(name, a) for name, a in audio.items()])
+    clips = list_inputs(None, 24000, store_dir)
+    assert [c.filename for c in clips] == ['clip0_24k.wav', 'clip1_24k.wav']
+    assert list_inputs(None, 16000, store_dir) == []
+    clip0 = pickle.loads(pickle.dumps(clips[0])) # Sent to worker processes by reference
+    assert isinstance(clip0, StoreClip)
+    assert input_filename(clip0) == 'clip0_24k.wav'
+    assert input_num_samples(clip0) == 1000
+    samples, sr = read_input(clip0)
+    assert sr == 24000 and np.array_equal(samples, audio['clip0'])
+    sr, blocks = read_input_blocks(clip0, 300)
+    assert sr == 24000 and np.array_equal(np.concatenate(list(blocks)), audio['clip0'])
+
+
+def test_file_inputs(tmp_path):
+    stereo = np.random.default_rng(5).uniform(-0.5, 0.5, (1000, 2)).astype(np.float32)
+    path = str(tmp_path / 'x_16k.wav')
+    sf.write(path, stereo, 16000, subtype='FLOAT')
+    assert list_inputs(str(tmp_path), 16000) == [path]
+    assert read_input(path)[0].shape == (1000, 2)
+    mono, sr = read_input(path, mono=True)
+    assert sr == 16000 and mono.shape == (1000,)
+    sr, blocks = read_input_blocks(path, 256)
+    np.testing.assert_allclose(np.concatenate(list(blocks)), mono, atol=1e-7)
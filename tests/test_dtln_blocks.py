@@ -0,0 +1,112 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'methods', 'dtln'))
+
+from blocks import BLOCK_LEN, BLOCK_SHIFT, BlockPool, frame_audio, overlap_add, process_audio, process_audio_batched
+
+
+class ElementwiseModel:
+    """Stands in for the stateless Keras model: each sample of each block on its own."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict_on_batch(self, blocks):
+        assert blocks.dtype == np.float32 and blocks.ndim == 2 and blocks.shape[1] == BLOCK_LEN
+        self.calls.append(len(blocks))
+        return np.tanh(np.float32(2) * blocks) * np.float32(0.5)
+
+
+def padded_clip(num_samples, seed=0):
+    # As load_padded_audio() pads a prepared file
+    audio = np.random.default_rng(seed).uniform(-1, 1, num_samples)
+    zero_pad = np.zeros(BLOCK_LEN)
+    return np.concatenate((zero_pad, audio, zero_pad))
+
+
+@pytest.mark.parametrize('num_samples', [0, 1, 100, BLOCK_SHIFT, BLOCK_LEN, 5 * BLOCK_SHIFT + 17, 16000])
+@pytest.mark.parametrize('batch_size', [1, 7, 1024])
+def test_batched_matches_the_block_loop(num_samples, batch_size):
+    audio = padded_clip(num_samples)
+    expected = process_audio(ElementwiseModel(), audio)
+    out = process_audio_batched(ElementwiseModel(), audio, batch_size)
+    assert out.shape == expected.shape
+    # Only the order of the four overlapping float64 additions differs
+    np.testing.assert_allclose(out, expected, rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('num_samples', [0, 1, BLOCK_SHIFT - 1, BLOCK_LEN - BLOCK_SHIFT, BLOCK_LEN - 1, BLOCK_LEN])
+def test_signals_shorter_than_one_block(num_samples):
+    audio = np.ones(num_samples)
+    assert len(frame_audio(audio)) == (1 if num_samples == BLOCK_LEN else 0)
+    expected = process_audio(ElementwiseModel(), audio)
+    np.testing.assert_allclose(process_audio_batched(ElementwiseModel(), audio), expected, rtol=1e-12, atol=1e-15)
+
+
+def test_frames_are_the_loop_input_buffers():
+    audio = np.arange(3 * BLOCK_LEN, dtype=np.float64)
+    blocks = frame_audio(audio)
+    in_buffer = np.zeros(BLOCK_LEN)
+    for idx in range(len(blocks)):
+        in_buffer[:-BLOCK_SHIFT] = in_buffer[BLOCK_SHIFT:]
+        in_buffer[-BLOCK_SHIFT:] = audio[idx * BLOCK_SHIFT:(idx + 1) * BLOCK_SHIFT]
+        np.testing.assert_array_equal(blocks[idx], in_buffer)
+
+
+def test_batches_are_split_by_batch_size():
+    model = ElementwiseModel()
+    process_audio_batched(model, padded_clip(16000), batch_size=50)
+    num_blocks = len(frame_audio(padded_clip(16000)))
+    assert sum(model.calls) == num_blocks and max(model.calls) == 50
+
+
+def test_overlap_add_of_no_blocks():
+    np.testing.assert_array_equal(overlap_add(np.zeros((0, BLOCK_LEN), dtype=np.float32), 10), np.zeros(10))
+
+
+def run_pool(model, clips, batch_blocks):
+    finished = {}
+    def finish(key, enhanced):
+        assert key not in finished
+        finished[key] = enhanced
+    pool = BlockPool(model, batch_blocks, finish)
+    for key, audio in enumerate(clips):
+        pool.add(key, audio)
+    pool.close()
+    return finished
+
+
+@pytest.mark.parametrize('batch_blocks', [1, 3, 40, 10000])
+def test_corpus_pool_matches_per_file_processing(batch_blocks):
+    # Lengths from shorter than one block to several batches, in no particular order
+    lengths = [16000, 0, 37, 5 * BLOCK_SHIFT + 3, 3200, 1, BLOCK_LEN, 9000]
+    clips = [padded_clip(n, seed) for seed, n in enumerate(lengths)] + [np.zeros(50)]
+    model = ElementwiseModel()
+    finished = run_pool(model, clips, batch_blocks)
+    assert sorted(finished) == list(range(len(clips)))
+    for key, audio in enumerate(clips):
+        np.testing.assert_array_equal(finished[key], process_audio_batched(ElementwiseModel(), audio))
+        np.testing.assert_allclose(finished[key], process_audio(ElementwiseModel(), audio), rtol=1e-12, atol=1e-15)
+    assert max(model.calls) <= batch_blocks
+    assert sum(model.calls) == sum(len(frame_audio(audio)) for audio in clips)
+
+
+def test_corpus_pool_drops_the_files_of_a_failed_batch():
+    class FailingModel(ElementwiseModel):
+        def predict_on_batch(self, blocks):
+            if len(self.calls) == 1:
+                self.calls.append(len(blocks))
+                raise RuntimeError("out of memory")
+            return super().predict_on_batch(blocks)
+
+    lengths = [1000, 1000, 1000]
+    clips = [padded_clip(n, seed) for seed, n in enumerate(lengths)]
+    blocks_per_clip = len(frame_audio(clips[0]))
+    # Batch 2 holds the end of clip 0 and the start of clip 1
+    finished = run_pool(FailingModel(), clips, blocks_per_clip - 1)
+    assert sorted(finished) == [2]
+    np.testing.assert_array_equal(finished[2], process_audio_batched(ElementwiseModel(), clips[2]))
@@ -0,0 +1,145 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import preparation
+
+BACKEND = 'numpy_poly' # Needs nothing beyond NumPy
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    input_dir, output_dir = tmp_path / 'original_rate', tmp_path / 'prepared'
+    input_dir.mkdir()
+    monkeypatch.setattr(preparation, 'INPUT_DIR', str(input_dir))
+    monkeypatch.setattr(preparation, 'OUTPUT_DIR', str(output_dir))
+    built = [] # (source filename, output filename) per output written
+    prepare_file = preparation.prepare_file
+    def spy(input_path, outputs, *args, **kwargs):
+        built.extend((os.path.basename(input_path), os.path.basename(path)) for path, _ in outputs)
+        return prepare_file(input_path, outputs, *args, **kwargs)
+    monkeypatch.setattr(preparation, 'prepare_file', spy)
+    return input_dir, output_dir, built
+
+
+def write_source(input_dir, name, seed=0, sr=44100):
+    audio = 0.1 * np.random.default_rng(seed).standard_normal(sr // 4)
+    sf.write(str(input_dir / name), audio, sr)
+
+
+def run(built, **kwargs):
+    built.clear()
+    preparation.main(backend=kwargs.pop('backend', BACKEND), rates=kwargs.pop('rates', [16000, 24000]), **kwargs)
+    return sorted(built)
+
+
+def test_second_run_builds_nothing(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav', 0)
+    write_source(input_dir, 'b.wav', 1)
+    assert run(built) == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav'), ('b.wav', 'b_16k.wav'), ('b.wav', 'b_24k.wav')]
+    manifest = json.load(open(output_dir / preparation.MANIFEST_FILENAME))
+    assert set(manifest['sources']) == {'a.wav', 'b.wav'}
+    assert manifest['outputs']['a_16k.wav']['target_sr'] == 16000
+    assert manifest['outputs']['a_16k.wav']['resampler'] == preparation.resampler_settings(BACKEND)
+    assert run(built) == []
+
+
+def test_touched_source_with_the_same_content_is_not_rebuilt(dirs):
+    input_dir, _, built = dirs
+    write_source(input_dir, 'a.wav')
+    run(built)
+    os.utime(input_dir / 'a.wav', ns=(0, 10 ** 18)) # New mtime: hashed again, same sha256
+    assert run(built) == []
+
+
+def test_changed_source_is_rebuilt(dirs):
+    input_dir, _, built = dirs
+    write_source(input_dir, 'a.wav', 0)
+    write_source(input_dir, 'b.wav', 1)
+    run(built)
+    write_source(input_dir, 'a.wav', 2)
+    assert run(built) == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav')]
+
+
+def test_changed_resampler_settings_rebuild(dirs):
+    input_dir, _, built = dirs
+    write_source(input_dir, 'a.wav')
+    run(built)
+    assert run(built, backend='scipy_poly') == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav')]
+    assert run(built, backend='scipy_poly') == []
+
+
+def test_modified_or_deleted_outputs_are_rebuilt(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav')
+    run(built)
+    audio, sr = sf.read(str(output_dir / 'a_16k.wav'))
+    sf.write(str(output_dir / 'a_16k.wav'), audio * 0.5, sr)
+    os.remove(output_dir / 'a_24k.wav')
+    assert run(built) == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav')]
+
+
+def test_only_requested_rates_are_built(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav')
+    assert run(built, rates=[16000]) == [('a.wav', 'a_16k.wav')]
+    assert run(built, rates=[16000, 48000]) == [('a.wav', 'a_48k.wav')]
+    assert sorted(os.listdir(output_dir)) == ['a_16k.wav', 'a_48k.wav', preparation.MANIFEST_FILENAME,
+                                              preparation.MANIFEST_FILENAME + '.lock']
+
+
+def test_outputs_of_removed_sources_are_pruned(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav', 0)
+    write_source(input_dir, 'b.wav', 1)
+    run(built)
+    os.remove(input_dir / 'b.wav')
+    run(built, prune=False)
+    assert (output_dir / 'b_16k.wav').exists()
+    run(built)
+    assert not (output_dir / 'b_16k.wav').exists() and (output_dir / 'a_16k.wav').exists()
+    manifest = json.load(open(output_dir / preparation.MANIFEST_FILENAME))
+    assert set(manifest['sources']) == {'a.wav'} and set(manifest['outputs']) == {'a_16k.wav', 'a_24k.wav'}
+
+
+def test_unreadable_or_old_manifest_rebuilds_everything(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav')
+    run(built)
+    manifest_path = output_dir / preparation.MANIFEST_FILENAME
+    manifest_path.write_text(json.dumps({'version': 0, 'sources': {}, 'outputs': {}}))
+    assert len(run(built)) == 2
+    manifest_path.write_text('{ truncated')
+    assert len(run(built)) == 2
+
+
+
+def test_outputs_from_before_the_manifest_are_kept_with_the_default_backend(dirs):
+    pytest.importorskip('soxr')
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav')
+    output_dir.mkdir()
+    existing = 0.1 * np.ones(4000)
+    sf.write(str(output_dir / 'a_16k.wav'), existing, 16000)
+    sf.write(str(output_dir / 'a_24k.wav'), existing, 16000) # Wrong rate: rebuilt
+    before = (output_dir / 'a_16k.wav').read_bytes()
+    assert run(built, backend=preparation.DEFAULT_BACKEND) == [('a.wav', 'a_24k.wav')]
+    assert (output_dir / 'a_16k.wav').read_bytes() == before
+    manifest = json.load(open(output_dir / preparation.MANIFEST_FILENAME))
+    assert manifest['outputs']['a_16k.wav']['resampler'] == preparation.resampler_settings(preparation.DEFAULT_BACKEND)
+    assert run(built, backend=preparation.DEFAULT_BACKEND) == []
+    # Rebuilding, or another backend, rewrites it
+    assert run(built, backend=preparation.DEFAULT_BACKEND, rebuild=True) == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav')]
+    assert (output_dir / 'a_16k.wav').read_bytes() != before
+
+
+def test_outputs_from_before_the_manifest_are_rebuilt_with_another_backend(dirs):
+    input_dir, output_dir, built = dirs
+    write_source(input_dir, 'a.wav')
+    output_dir.mkdir()
+    sf.write(str(output_dir / 'a_16k.wav'), 0.1 * np.ones(4000), 16000)
+    assert run(built) == [('a.wav', 'a_16k.wav'), ('a.wav', 'a_24k.wav')]
@@ -0,0 +1,71 @@
+import io
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import preparation
+from utils import wavio
+from utils.voicefixer_common import save_output
+
+
+def write_source(path, seconds=1.5, sr=44100, channels=2):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    audio = 0.4 * np.sin(2 * np.pi * 440 * t)[:, None] + 0.05 * rng.standard_normal((len(t), channels))
+    sf.write(str(path), audio, sr)
+
+
+@pytest.mark.parametrize('block_size', [1000, 4096, 65536])
+def test_streaming_preparation_matches_one_shot(tmp_path, block_size):
+    source = tmp_path / 'a.wav'
+    write_source(source)
+    outputs = {rate: (str(tmp_path / f'one_{rate}.wav'), str(tmp_path / f'stream_{rate}.wav')) for rate in (16000, 24000, 44100, 48000)}
+    _, written, _ = preparation.prepare_file(str(source), [(one, rate) for rate, (one, _) in outputs.items()], 'numpy_poly')
+    _, streamed, _ = preparation.prepare_file_streaming(str(source), [(stream, rate) for rate, (_, stream) in outputs.items()],
+                                                        'numpy_poly', block_size=block_size)
+    assert len(written) == len(streamed) == len(outputs)
+    for rate, (one, stream) in outputs.items():
+        a, sr_a = sf.read(one, dtype='int16')
+        b, sr_b = sf.read(stream, dtype='int16')
+        assert sr_a == sr_b == rate and a.shape == b.shape
+        # Same samples up to float rounding, which can move a sample across a 16-bit step
+        assert np.max(np.abs(a.astype(np.int32) - b)) <= 1
+        if rate == 44100:
+            np.testing.assert_array_equal(a, b) # Copied, not resampled
+
+
+def test_failed_streaming_preparation_leaves_no_output(tmp_path):
+    source = tmp_path / 'a.wav'
+    source.write_bytes(b'not a wav file')
+    output = tmp_path / 'a_16k.wav'
+    _, written, _ = preparation.prepare_file_streaming(str(source), [(str(output), 16000)], 'numpy_poly')
+    assert written == {} and not output.exists()
+
+
+def written_pcm16(audio):
+    buffer = io.BytesIO()
+    sf.write(buffer, audio, 16000, format='WAV', subtype='PCM_16')
+    buffer.seek(0)
+    return sf.read(buffer, dtype='int16')[0]
+
+
+def test_to_pcm16_is_what_sf_write_stores():
+    rng = np.random.default_rng(1)
+    edges = np.array([-1.5, -1, -1 / 32768, -0.5 / 32768, -1e-9, 0, 1e-9, 0.5 / 32768, 32767.5 / 32768, 1, 1.5])
+    audio = np.concatenate((rng.uniform(-1.2, 1.2, 100000), edges)).astype(np.float32)
+    np.testing.assert_array_equal(wavio.to_pcm16(audio), written_pcm16(audio))
+
+
+def test_voicefixer_outputs_use_the_same_quantization(tmp_path):
+    enhanced = np.random.default_rng(2).uniform(-1.1, 1.1, (1, 5000)) # float64, (1, N) like restore_inmem()
+    received = []
+    class Spectrograms:
+        def add(self, path, audio, sr):
+            received.append(audio)
+    path = str(tmp_path / 'out.wav')
+    save_output(path, enhanced, 44100, Spectrograms())
+    np.testing.assert_array_equal(sf.read(path, dtype='int16')[0], wavio.to_pcm16(enhanced.reshape(-1)))
+    np.testing.assert_array_equal(received[0], wavio.to_pcm16(enhanced.reshape(-1)))
+    assert enhanced.dtype == np.float64 and np.abs(enhanced).max() > 1 # Caller's buffer untouched
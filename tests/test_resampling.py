@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from scipy.signal import resample_poly
+
+from utils.resampling import DEFAULT_BACKEND, StreamingResampler, create_stream, polyphase_filter, resample
+
+RATE_PAIRS = [(48000, 16000), (48000, 44100), (44100, 24000), (16000, 48000), (24000, 44100)]
+
+
+def reference(x, orig_sr, target_sr):
+    up, down, kernel = polyphase_filter(orig_sr, target_sr)
+    return resample_poly(np.asarray(x, dtype=np.float64), up, down, window=kernel)
+
+
+def stream_in_chunks(stream, x, rng, max_chunk=3000):
+    out = []
+    pos = 0
+    while pos < len(x):
+        size = int(rng.integers(1, max_chunk))
+        out.append(stream.process(x[pos:pos + size]))
+        pos += size
+    out.append(stream.flush())
+    return np.concatenate(out)
+
+
+@pytest.mark.parametrize('orig_sr, target_sr', RATE_PAIRS)
+def test_streaming_matches_resample_poly(orig_sr, target_sr):
+    rng = np.random.default_rng(orig_sr + target_sr)
+    x = rng.uniform(-1, 1, 20011).astype(np.float32)
+    expected = reference(x, orig_sr, target_sr)
+    out = stream_in_chunks(StreamingResampler(orig_sr, target_sr), x, rng)
+    assert len(out) == len(expected) == -(-len(x) * target_sr // orig_sr)
+    np.testing.assert_allclose(out, expected, rtol=0, atol=1e-7)
+
+
+def test_chunking_does_not_change_the_output():
+    rng = np.random.default_rng(1)
+    x = rng.uniform(-1, 1, 9000).astype(np.float32)
+    stream = StreamingResampler(48000, 16000)
+    whole = np.concatenate((stream.process(x), stream.flush()))
+    stream.reset()
+    chunked = stream_in_chunks(stream, x, rng, max_chunk=50)
+    assert np.array_equal(whole, chunked)
+
+
+@pytest.mark.parametrize('length', [0, 1, 2, 7])
+def test_short_inputs(length):
+    x = np.ones(length, dtype=np.float32)
+    stream = StreamingResampler(44100, 24000)
+    out = np.concatenate((stream.process(x), stream.flush()))
+    expected = reference(x, 44100, 24000) if length else np.zeros(0)
+    assert len(out) == len(expected)
+    np.testing.assert_allclose(out, expected, rtol=0, atol=1e-7)
+
+
+
+def test_default_backend_is_librosas_resampler():
+    assert DEFAULT_BACKEND == 'soxr_hq'
+    soxr = pytest.importorskip('soxr')
+    x = np.random.default_rng(3).uniform(-1, 1, 10000).astype(np.float32)
+    expected = soxr.resample(x, 48000, 16000, quality='HQ')
+    np.testing.assert_array_equal(resample(x, 48000, 16000), expected)
+
+
+def test_one_shot_backends_agree():
+    x = np.random.default_rng(2).uniform(-1, 1, 10000).astype(np.float32)
+    numpy_poly = resample(x, 48000, 16000, 'numpy_poly')
+    scipy_poly = resample(x, 48000, 16000, 'scipy_poly')
+    assert numpy_poly.dtype == scipy_poly.dtype == np.float32
+    np.testing.assert_allclose(numpy_poly, scipy_poly, rtol=0, atol=1e-7)
+    assert np.array_equal(resample(x, 16000, 16000), x)
+
+
+def test_backends_without_streaming_are_refused():
+    with pytest.raises(ValueError):
+        create_stream('torchaudio', 48000, 16000)
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'methods', 'rnnoise'))
+
+# Needs the CFFI module built by methods/rnnoise/build_rnnoise_cffi.py and the RNNoise library
+pytest.importorskip('_rnnoise_cffi')
+
+import rnnoise_cffi_wrapper
+from rnnoise_cffi_wrapper import SAMPLES_PER_FRAME, RNNoiseCFFI
+from run import INT16_SCALE, process_audio_rnnoise, process_audio_rnnoise_native
+
+
+def noisy_signal(num_samples, sr, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / sr
+    return (0.3 * np.sin(2 * np.pi * 220 * t) * (t % 0.5 < 0.25) + 0.05 * rng.standard_normal(num_samples)).astype(np.float32)
+
+
+def test_process_buffer_matches_frame_by_frame():
+    frames = (noisy_signal(10 * SAMPLES_PER_FRAME, 48000) * INT16_SCALE).astype(np.float32)
+    vad, out = RNNoiseCFFI().process_buffer(frames.copy())
+    denoiser = RNNoiseCFFI()
+    for i in range(10):
+        frame_vad, frame_out = denoiser.process_frame(frames[i * SAMPLES_PER_FRAME:(i + 1) * SAMPLES_PER_FRAME])
+        assert vad[i] == np.float32(frame_vad)
+        np.testing.assert_array_equal(out[i * SAMPLES_PER_FRAME:(i + 1) * SAMPLES_PER_FRAME], frame_out)
+    # In place
+    buffer = frames.copy()
+    _, in_place = RNNoiseCFFI().process_buffer(buffer, out=buffer)
+    assert in_place is buffer
+    np.testing.assert_array_equal(in_place, out)
+
+
+def test_process_buffer_fallback_matches_and_warns_once(monkeypatch, caplog):
+    frames = (noisy_signal(10 * SAMPLES_PER_FRAME, 48000) * INT16_SCALE).astype(np.float32)
+    vad, out = RNNoiseCFFI().process_buffer(frames.copy())
+    monkeypatch.setattr(rnnoise_cffi_wrapper, 'HAS_PROCESS_BUFFER', False)
+    monkeypatch.setattr(rnnoise_cffi_wrapper, '_fallback_warned', False)
+    with caplog.at_level('WARNING'):
+        frame_vad, frame_out = RNNoiseCFFI().process_buffer(frames.copy())
+        RNNoiseCFFI().process_buffer(frames.copy())
+    np.testing.assert_array_equal(out, frame_out)
+    np.testing.assert_array_equal(vad, frame_vad)
+    warnings = [r for r in caplog.records if 'build_rnnoise_cffi.py' in r.getMessage()]
+    assert len(warnings) == 1
+
+
+def test_process_buffer_rejects_partial_frames():
+    with pytest.raises(ValueError):
+        RNNoiseCFFI().process_buffer(np.zeros(SAMPLES_PER_FRAME + 1, dtype=np.float32))
+
+
+def test_native_path_is_aligned_with_the_input():
+    # At 48k nothing is resampled: the native path must be the whole-buffer output
+    # (on int16-scaled samples) moved one frame earlier, RNNoise's delay
+    x = noisy_signal(48000 + 123, 48000)
+    out = process_audio_rnnoise_native(RNNoiseCFFI(), x, 48000, chunk_size=4000)
+    scaled = (np.concatenate((x, np.zeros(2 * SAMPLES_PER_FRAME, dtype=np.float32))) * INT16_SCALE).astype(np.float32)
+    reference = process_audio_rnnoise(RNNoiseCFFI(), scaled)[SAMPLES_PER_FRAME:SAMPLES_PER_FRAME + len(x)] / INT16_SCALE
+    assert out.shape == x.shape
+    np.testing.assert_array_equal(out, reference.astype(np.float32))
+
+
+@pytest.mark.parametrize('sr', [16000, 24000, 44100])
+def test_native_path_keeps_the_length_at_other_rates(sr):
+    x = noisy_signal(sr + 77, sr)
+    out, vad = process_audio_rnnoise_native(RNNoiseCFFI(), x, sr, chunk_size=3000, return_vad=True)
+    assert out.shape == x.shape and out.dtype == np.float32
+    # One VAD value per 48k frame of the upsampled input
+    assert len(vad) == -(-(-(-len(x) * 48000 // sr)) // SAMPLES_PER_FRAME)
+    assert np.all((vad >= 0) & (vad <= 1))
+
+
+def test_chunk_size_does_not_change_the_output():
+    x = noisy_signal(30000, 16000)
+    a = process_audio_rnnoise_native(RNNoiseCFFI(), x, 16000, chunk_size=1000)
+    b = process_audio_rnnoise_native(RNNoiseCFFI(), x, 16000, chunk_size=7777)
+    np.testing.assert_array_equal(a, b)
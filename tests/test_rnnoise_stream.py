@@ -0,0 +1,95 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'methods', 'rnnoise'))
+
+from rnnoise_stream import SAMPLES_PER_FRAME, RNNoiseStream
+
+
+class FrameDenoiser:
+    """Stands in for RNNoiseCFFI: reverses each 480-sample frame and numbers the frames in its VAD output.
+
+    Reversing shows where the frame boundaries fell, the numbering that frames
+    reached the denoiser in order, once each.
+    """
+
+    def __init__(self):
+        self.frames = 0
+
+    def process_buffer(self, audio, out=None, vad=None):
+        assert audio.dtype == np.float32 and len(audio) % SAMPLES_PER_FRAME == 0
+        num_frames = len(audio) // SAMPLES_PER_FRAME
+        if out is None:
+            out = np.empty_like(audio)
+        if vad is None:
+            vad = np.empty(num_frames, dtype=np.float32)
+        out[:] = audio.reshape(num_frames, SAMPLES_PER_FRAME)[:, ::-1].reshape(-1)
+        vad[:num_frames] = self.frames + np.arange(num_frames)
+        self.frames += num_frames
+        return vad[:num_frames], out
+
+
+def whole_buffer(audio):
+    # One call on the zero-padded input, trimmed back: what the stream must reproduce
+    padded = np.zeros(-(-len(audio) // SAMPLES_PER_FRAME) * SAMPLES_PER_FRAME, dtype=np.float32)
+    padded[:len(audio)] = audio
+    vad, out = FrameDenoiser().process_buffer(padded)
+    return out[:len(audio)], vad
+
+
+def stream_chunks(stream, audio, sizes):
+    outputs, vads, pos, i = [], [], 0, 0
+    while pos < len(audio):
+        chunk = audio[pos:pos + sizes[i % len(sizes)]]
+        out, vad = stream.process(chunk)
+        assert len(out) % SAMPLES_PER_FRAME == 0 and len(vad) == len(out) // SAMPLES_PER_FRAME
+        outputs.append(out.copy()) # Views, valid until the next call
+        vads.append(vad.copy())
+        pos += len(chunk)
+        i += 1
+    out, vad = stream.flush()
+    outputs.append(out.copy())
+    vads.append(vad.copy())
+    return np.concatenate(outputs), np.concatenate(vads)
+
+
+@pytest.mark.parametrize('sizes', [[1], [479], [480], [481], [10000], [1, 479, 481, 10000], [10000, 3, 960, 1]])
+def test_any_chunk_sizes_match_one_whole_buffer_call(sizes):
+    audio = np.random.default_rng(0).standard_normal(20000).astype(np.float32)
+    expected_out, expected_vad = whole_buffer(audio)
+    out, vad = stream_chunks(RNNoiseStream(FrameDenoiser(), max(sizes)), audio, sizes)
+    np.testing.assert_array_equal(out, expected_out)
+    np.testing.assert_array_equal(vad, expected_vad)
+
+
+@pytest.mark.parametrize('num_samples', [0, 1, SAMPLES_PER_FRAME - 1, SAMPLES_PER_FRAME, 3 * SAMPLES_PER_FRAME])
+def test_lengths_around_a_frame(num_samples):
+    audio = np.arange(1, num_samples + 1, dtype=np.float32)
+    expected_out, expected_vad = whole_buffer(audio)
+    out, vad = stream_chunks(RNNoiseStream(FrameDenoiser(), 7), audio, [7])
+    np.testing.assert_array_equal(out, expected_out)
+    np.testing.assert_array_equal(vad, expected_vad)
+
+
+def test_pending_samples_and_reset():
+    stream = RNNoiseStream(FrameDenoiser(), 1000)
+    out, _ = stream.process(np.ones(700, dtype=np.float32))
+    assert len(out) == SAMPLES_PER_FRAME and stream.pending_samples == 220
+    stream.reset()
+    assert stream.pending_samples == 0
+    out, vad = stream.flush()
+    assert len(out) == 0 and len(vad) == 0
+
+
+def test_rejects_oversized_chunks():
+    with pytest.raises(ValueError):
+        RNNoiseStream(FrameDenoiser(), 100).process(np.zeros(101, dtype=np.float32))
+
+
+def test_latency():
+    stream = RNNoiseStream(FrameDenoiser(), 480)
+    assert stream.latency_samples == 2 * SAMPLES_PER_FRAME - 1
+    assert stream.latency_ms == pytest.approx(1000 * (2 * SAMPLES_PER_FRAME - 1) / 48000)
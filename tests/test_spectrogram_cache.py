@@ -0,0 +1,124 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from utils import spectrogram_cache
+from utils.spectrogram_tiles import TILED_MIN_SECONDS, tiles_dir_for
+
+SR = 8000
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    audio_dir, output_dir = tmp_path / 'audio', tmp_path / 'spectrograms'
+    audio_dir.mkdir()
+    rendered = [] # Audio filenames per render
+    run_spectrogram_tasks = spectrogram_cache.run_spectrogram_tasks
+    def spy(tasks, *args, **kwargs):
+        rendered.extend(os.path.basename(audio_path) for audio_path, _ in tasks)
+        return run_spectrogram_tasks(tasks, *args, **kwargs)
+    monkeypatch.setattr(spectrogram_cache, 'run_spectrogram_tasks', spy)
+    return audio_dir, output_dir, rendered
+
+
+def write_audio(audio_dir, name, seed=0, seconds=0.5):
+    audio = 0.1 * np.random.default_rng(seed).standard_normal(int(seconds * SR))
+    sf.write(str(audio_dir / name), audio, SR)
+
+
+def sync(dirs, **kwargs):
+    audio_dir, output_dir, rendered = dirs
+    rendered.clear()
+    stats = spectrogram_cache.sync_spectrograms([(str(audio_dir), str(output_dir))], **kwargs)
+    return sorted(rendered), stats
+
+
+def test_current_images_are_skipped(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'a.wav', 0)
+    write_audio(audio_dir, 'b.wav', 1)
+    assert sync(dirs)[0] == ['a.wav', 'b.wav']
+    cache = spectrogram_cache.load_cache(str(output_dir))
+    assert set(cache['images']) == {'a_spectrogram.png', 'b_spectrogram.png'}
+    assert cache['images']['a_spectrogram.png']['params'] == spectrogram_cache.render_params()
+    rendered, stats = sync(dirs)
+    assert rendered == [] and stats['current'] == 2
+
+
+def test_touched_audio_with_the_same_content_is_skipped(dirs):
+    audio_dir, _, _ = dirs
+    write_audio(audio_dir, 'a.wav')
+    sync(dirs)
+    os.utime(audio_dir / 'a.wav', ns=(0, 10 ** 18)) # New mtime: hashed again, same sha256
+    assert sync(dirs)[0] == []
+
+
+def test_changed_audio_is_rendered_again(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'a.wav', 0)
+    write_audio(audio_dir, 'b.wav', 1)
+    sync(dirs)
+    before = (output_dir / 'a_spectrogram.png').read_bytes()
+    write_audio(audio_dir, 'a.wav', 2)
+    assert sync(dirs)[0] == ['a.wav']
+    assert (output_dir / 'a_spectrogram.png').read_bytes() != before
+
+
+def test_changed_params_render_everything_again(dirs, monkeypatch):
+    audio_dir, _, _ = dirs
+    write_audio(audio_dir, 'a.wav')
+    sync(dirs)
+    render_params = spectrogram_cache.render_params
+    monkeypatch.setattr(spectrogram_cache, 'render_params', lambda *args: dict(render_params(*args), colormap='magma'))
+    assert sync(dirs)[0] == ['a.wav']
+    assert sync(dirs)[0] == []
+
+
+def test_missing_or_forced_images_are_rendered_again(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'a.wav')
+    sync(dirs)
+    os.remove(output_dir / 'a_spectrogram.png')
+    assert sync(dirs)[0] == ['a.wav']
+    assert sync(dirs, force=True)[0] == ['a.wav']
+
+
+def test_missing_tiles_are_rebuilt(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'long.wav', seconds=TILED_MIN_SECONDS)
+    write_audio(audio_dir, 'short.wav')
+    sync(dirs)
+    image_path = str(output_dir / 'long_spectrogram.png')
+    cache = spectrogram_cache.load_cache(str(output_dir))
+    assert cache['images']['long_spectrogram.png']['tiles'] and not cache['images']['short_spectrogram.png']['tiles']
+    assert spectrogram_cache.has_tiles(image_path)
+    shutil.rmtree(tiles_dir_for(image_path))
+    assert sync(dirs)[0] == ['long.wav']
+    assert spectrogram_cache.has_tiles(image_path)
+
+
+def test_images_of_removed_audio_are_deleted(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'long.wav', seconds=TILED_MIN_SECONDS)
+    write_audio(audio_dir, 'short.wav')
+    sync(dirs)
+    os.remove(audio_dir / 'long.wav')
+    rendered, stats = sync(dirs)
+    assert rendered == [] and stats['removed'] == 1
+    assert not (output_dir / 'long_spectrogram.png').exists()
+    assert not os.path.exists(tiles_dir_for(str(output_dir / 'long_spectrogram.png')))
+    assert set(spectrogram_cache.load_cache(str(output_dir))['images']) == {'short_spectrogram.png'}
+
+
+def test_old_or_unreadable_cache_renders_everything(dirs):
+    audio_dir, output_dir, _ = dirs
+    write_audio(audio_dir, 'a.wav')
+    sync(dirs)
+    cache_path = output_dir / spectrogram_cache.CACHE_FILENAME
+    cache_path.write_text('{"version": 0, "images": {}}')
+    assert sync(dirs)[0] == ['a.wav']
+    cache_path.write_text('{not json')
+    assert sync(dirs)[0] == ['a.wav']
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils import spectrogram_engine as engine
+from utils.spectrogram_tiles import (TILE_HEIGHT, TILE_WIDTH, TILED_MIN_SECONDS, level_columns, load_manifest,
+                                     wants_tiles, write_tiles)
+
+SR = 8000
+
+
+@pytest.mark.parametrize('frames, columns', [
+    (1, [1]),
+    (TILE_WIDTH, [TILE_WIDTH]),
+    (TILE_WIDTH + 1, [129, 257]),
+    (2 * TILE_WIDTH, [256, 512]),
+    (2 * TILE_WIDTH + 1, [129, 257, 513]),
+    (1249, [157, 313, 625, 1249]),
+])
+def test_level_columns(frames, columns):
+    assert level_columns(frames) == columns
+
+
+def test_only_long_files_are_tiled():
+    assert not wants_tiles(int(TILED_MIN_SECONDS * SR) - 1, SR)
+    assert wants_tiles(int(TILED_MIN_SECONDS * SR), SR)
+
+
+@pytest.mark.parametrize('seconds', [20.0, 33.3, 65.0])
+def test_pyramid_levels_and_tiles(tmp_path, seconds):
+    audio = 0.1 * np.random.default_rng(0).standard_normal(int(seconds * SR)).astype(np.float32)
+    tiles_dir = str(tmp_path / 'a_spectrogram_tiles')
+    write_tiles(audio, SR, tiles_dir)
+    manifest = load_manifest(tiles_dir)
+
+    frames = engine.num_frames(len(audio))
+    columns = level_columns(frames)
+    assert manifest['columns'] == columns and columns[-1] == frames
+    assert columns[0] <= TILE_WIDTH
+    # Each level has its columns cut into full tiles plus one partial tile
+    tiles = [-(-c // TILE_WIDTH) for c in columns]
+    assert manifest['tiles'] == tiles and tiles[0] == 1
+    for level, count in enumerate(tiles):
+        names = sorted(os.listdir(os.path.join(tiles_dir, str(level))), key=lambda name: int(name.split('.')[0]))
+        assert names == [f"{i}.png" for i in range(count)]
+    assert manifest['duration'] == len(audio) / SR
+    assert manifest['hop_seconds'] == (engine.NFFT - engine.NOVERLAP) / SR
+    assert manifest['tile_height'] == TILE_HEIGHT
+    assert not [name for name in os.listdir(tmp_path) if '.tmp-' in name]
+
+
+def test_rewriting_replaces_the_pyramid(tmp_path):
+    tiles_dir = str(tmp_path / 'a_spectrogram_tiles')
+    write_tiles(np.zeros(70 * SR, dtype=np.float32), SR, tiles_dir)
+    write_tiles(np.zeros(20 * SR, dtype=np.float32), SR, tiles_dir)
+    manifest = load_manifest(tiles_dir)
+    assert sorted(os.listdir(tiles_dir)) == sorted([str(level) for level in range(len(manifest['columns']))] + ['tiles.json'])
+    assert len(os.listdir(os.path.join(tiles_dir, '0'))) == 1
+
+
+def test_overview_has_the_requested_size(tmp_path):
+    audio = 0.1 * np.random.default_rng(1).standard_normal(20 * SR).astype(np.float32)
+    overview = write_tiles(audio, SR, str(tmp_path / 'a_spectrogram_tiles'), overview_size=(300, 200))
+    assert overview.shape == (200, 300, 4) and overview.dtype == np.uint8
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+pytest.importorskip('jinja2')
+
+import summary
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    prepared = tmp_path / 'assets' / 'prepared'
+    for name in ('a', 'b', 'c'):
+        for rate in ('16k', '48k'):
+            touch(str(prepared / f'{name}_{rate}.wav'))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(summary, 'PREPARED_DIR', str(prepared))
+    monkeypatch.setattr(summary, 'METHODS_DIR', str(tmp_path / 'methods'))
+    return tmp_path
+
+
+def rnnoise_output(tree, filename):
+    touch(str(tree / 'methods' / 'rnnoise' / 'output' / filename))
+
+
+def test_rnnoise_native_output_is_preferred_over_legacy(tree):
+    rnnoise_output(tree, 'a_rnnoise_model_enhanced.wav') # Legacy 16k frames only
+    rnnoise_output(tree, 'b_rnnoise_model_enhanced.wav')
+    rnnoise_output(tree, 'b_rnnoise48k_model_enhanced.wav')
+    rnnoise_output(tree, 'c_rnnoise48k_default_enhanced.wav')
+    results, methods, configs = summary.find_files()
+    assert methods == ['rnnoise']
+    paths = {name: os.path.basename(results[name]['methods']['rnnoise']['path']) for name in 'abc'}
+    assert paths == {'a': 'a_rnnoise_model_enhanced.wav', 'b': 'b_rnnoise48k_model_enhanced.wav',
+                     'c': 'c_rnnoise48k_default_enhanced.wav'}
+    assert configs['rnnoise'] == "Model: Default, native 48 kHz"
+
+
+def test_rnnoise_legacy_outputs_alone(tree):
+    rnnoise_output(tree, 'a_rnnoise_default_enhanced.wav')
+    results, _, configs = summary.find_files()
+    assert 'rnnoise' in results['a']['methods'] and not results['b']['methods']
+    assert configs['rnnoise'] == "Model: Built-in, legacy 16k frames"
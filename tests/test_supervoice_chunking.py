@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'methods', 'supervoice_flow'))
+
+from chunked import CrossfadeWriter, equal_power_fades, iter_windows
+
+
+def blocks_of(x, rng, max_block=700):
+    pos = 0
+    while pos < len(x):
+        size = int(rng.integers(1, max_block))
+        yield x[pos:pos + size]
+        pos += size
+
+
+@pytest.mark.parametrize('length', [1, 16, 255])
+def test_equal_power_fades(length):
+    fade_in, fade_out = equal_power_fades(length)
+    assert len(fade_in) == len(fade_out) == length
+    np.testing.assert_allclose(fade_in.astype(np.float64) ** 2 + fade_out.astype(np.float64) ** 2, 1.0, atol=1e-6)
+    assert np.all(np.diff(fade_in) > 0) or length == 1
+    assert np.allclose(fade_in, fade_out[::-1])
+
+
+@pytest.mark.parametrize('length', [0, 50, 1000, 1001, 1800, 4321])
+def test_windows_cover_the_input(length):
+    window, overlap = 1000, 200
+    x = np.arange(length, dtype=np.float32)
+    windows = list(iter_windows(blocks_of(x, np.random.default_rng(length)), window, overlap))
+    assert all(len(w) <= window for w in windows)
+    # Every window but the first starts with the last overlap samples of the previous one
+    for previous, current in zip(windows, windows[1:]):
+        assert np.array_equal(current[:overlap], previous[-overlap:])
+        assert len(current) > overlap
+    rebuilt = np.concatenate([windows[0]] + [w[overlap:] for w in windows[1:]]) if windows else np.zeros(0)
+    assert np.array_equal(rebuilt, x)
+
+
+def test_overlap_must_be_shorter_than_the_window():
+    with pytest.raises(ValueError):
+        list(iter_windows([np.zeros(10)], 100, 100))
+
+
+@pytest.mark.parametrize('length', [50, 1000, 1800, 4321])
+def test_crossfade_of_an_identity_model(length):
+    # With an identity model the output has the input's length and is the input, except
+    # in the crossfades, which scale it by fade_in + fade_out (equal power, not equal gain)
+    window, overlap = 1000, 200
+    x = np.random.default_rng(0).uniform(-1, 1, length).astype(np.float32)
+    written = []
+    writer = CrossfadeWriter(written.append, overlap)
+    for w in iter_windows(blocks_of(x, np.random.default_rng(1)), window, overlap):
+        writer.add(w)
+    writer.close()
+    out = np.concatenate(written)
+    assert len(out) == writer.frames == length
+    fade_in, fade_out = equal_power_fades(overlap)
+    gain = np.ones(length, dtype=np.float32)
+    for start in range(window - overlap, length - overlap, window - overlap):
+        gain[start:start + overlap] = fade_in + fade_out
+    np.testing.assert_allclose(out, x * gain, atol=1e-6)
+
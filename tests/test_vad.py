@@ -0,0 +1,74 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from utils.vad import (VadGate, add_vad_gate_arguments, load_vad_track, save_vad_track, speech_regions,
+                       vad_track_path)
+
+SR = 16000
+FRAME_MS = 10
+FRAME = SR * FRAME_MS // 1000
+
+
+def test_track_round_trip(tmp_path):
+    probabilities = np.linspace(0, 1, 50, dtype=np.float32)
+    path = vad_track_path(str(tmp_path), 'clip_48k.wav')
+    save_vad_track(path, probabilities, FRAME_MS, source='clip_48k.wav')
+    loaded, frame_ms = load_vad_track(path)
+    assert frame_ms == FRAME_MS
+    np.testing.assert_allclose(loaded, probabilities, atol=1 / 255)
+
+
+def test_speech_regions_padding_and_merging():
+    probabilities = np.zeros(100)
+    probabilities[10:20] = 0.9
+    probabilities[22:30] = 0.9 # Two frames after the first region: merged by the padding
+    probabilities[80:90] = 0.9
+    regions = speech_regions(probabilities, FRAME_MS, SR, 100 * FRAME, threshold=0.5, padding_ms=30)
+    padding = 30 * SR // 1000
+    assert regions == [(10 * FRAME - padding, 30 * FRAME + padding), (80 * FRAME - padding, 90 * FRAME + padding)]
+
+
+def test_speech_regions_are_clipped_to_the_signal():
+    probabilities = np.ones(10)
+    assert speech_regions(probabilities, FRAME_MS, SR, 10 * FRAME - 5, padding_ms=100) == [(0, 10 * FRAME - 5)]
+    assert speech_regions(np.zeros(10), FRAME_MS, SR, 10 * FRAME) == []
+
+
+@pytest.mark.parametrize('non_speech', ['passthrough', 'attenuate'])
+def test_gate_only_processes_speech(non_speech):
+    audio = np.random.default_rng(0).uniform(-1, 1, 100 * FRAME).astype(np.float32)
+    gate = VadGate(non_speech=non_speech, non_speech_gain_db=-20.0, fade_ms=5)
+    regions = [(20 * FRAME, 40 * FRAME), (70 * FRAME, 100 * FRAME)]
+    seen = []
+    out = gate.apply(audio, SR, regions, lambda segment: seen.append(len(segment)) or np.zeros_like(segment))
+    assert seen == [20 * FRAME, 30 * FRAME]
+    assert out.shape == audio.shape and out.dtype == np.float32
+    gain = 1.0 if non_speech == 'passthrough' else 10 ** (-20 / 20)
+    np.testing.assert_allclose(out[:20 * FRAME], audio[:20 * FRAME] * gain, rtol=1e-6)
+    fade = 5 * SR // 1000
+    # Inside a region, past the fades, only the model output is left
+    assert np.all(out[20 * FRAME + fade:40 * FRAME - fade] == 0)
+    # No fade out at the end of the signal
+    assert np.all(out[70 * FRAME + fade:] == 0)
+    # The fade in blends linearly from the gated input to the model output
+    middle = 20 * FRAME + fade // 2
+    np.testing.assert_allclose(out[middle], 0.5 * audio[middle] * gain, rtol=1e-6)
+
+
+def test_gate_fits_model_output_length():
+    audio = np.ones(1000, dtype=np.float32)
+    gate = VadGate(fade_ms=0)
+    out = gate.apply(audio, SR, [(100, 600)], lambda segment: np.full(len(segment) + 37, 2.0))
+    assert len(out) == 1000 and np.all(out[100:600] == 2.0)
+    out = gate.apply(audio, SR, [(100, 600)], lambda segment: np.full(len(segment) - 37, 2.0))
+    assert np.all(out[563:600] == 0.0)
+
+
+def test_gate_options():
+    parser = argparse.ArgumentParser()
+    add_vad_gate_arguments(parser)
+    assert VadGate.from_args(parser.parse_args([])) is None
+    gate = VadGate.from_args(parser.parse_args(['--vad-gate', '--vad-fade-ms', '25', '--vad-threshold', '0.3']))
+    assert gate.fade_ms == 25 and gate.threshold == 0.3
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from utils import wavio
+
+SUBTYPES = ['PCM_U8', 'PCM_16', 'PCM_24', 'PCM_32', 'FLOAT', 'DOUBLE']
+
+
+def write_wav(path, channels, subtype, frames=5000, sr=16000):
+    rng = np.random.default_rng(channels)
+    audio = rng.uniform(-1, 1, (frames, channels))
+    audio[:4] = [[1.0], [-1.0], [0.5], [0.0]] # Full scale and exact values
+    sf.write(path, audio if channels > 1 else audio[:, 0], sr, subtype=subtype)
+    return path
+
+
+@pytest.mark.parametrize('subtype', SUBTYPES)
+@pytest.mark.parametrize('channels', [1, 2])
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+def test_read_matches_soundfile(tmp_path, subtype, channels, dtype):
+    path = write_wav(str(tmp_path / 'a.wav'), channels, subtype)
+    expected, expected_sr = sf.read(path, dtype=dtype)
+    # Small chunks, so the block-by-block conversion crosses chunk boundaries
+    audio, sr = wavio.read(path, dtype=dtype, chunk_frames=1000)
+    assert sr == expected_sr
+    assert audio.dtype == np.dtype(dtype)
+    assert audio.shape == expected.shape
+    assert np.array_equal(audio, expected)
+
+
+@pytest.mark.parametrize('subtype', SUBTYPES)
+def test_mono_downmix_matches_mean(tmp_path, subtype):
+    path = write_wav(str(tmp_path / 'a.wav'), 3, subtype)
+    expected = np.mean(sf.read(path, dtype='float64')[0], axis=1)
+    audio, _ = wavio.read(path, dtype='float64', mono=True)
+    np.testing.assert_allclose(audio, expected, rtol=0, atol=1e-15)
+
+
+def test_read_info_matches_soundfile(tmp_path):
+    path = write_wav(str(tmp_path / 'a.wav'), 2, 'PCM_24', frames=1234, sr=44100)
+    info = wavio.read_info(path)
+    expected = sf.info(path)
+    assert (info.samplerate, info.channels, info.frames) == (expected.samplerate, expected.channels, expected.frames)
+    assert info.bits_per_sample == 24 and not info.is_float
+
+
+def test_native_dtype_is_a_zero_copy_view(tmp_path):
+    path = write_wav(str(tmp_path / 'a.wav'), 1, 'FLOAT')
+    audio, _ = wavio.read(path, dtype='float32')
+    assert isinstance(audio.base, np.memmap) or isinstance(audio, np.memmap)
+    assert not audio.flags.writeable
+    pcm_path = write_wav(str(tmp_path / 'b.wav'), 2, 'PCM_16')
+    assert np.array_equal(wavio.pcm_view(pcm_path), sf.read(pcm_path, dtype='int16')[0])
+
+
+@pytest.mark.parametrize('subtype', ['PCM_16', 'PCM_24', 'FLOAT'])
+def test_as_read_matches_reading_the_file(tmp_path, subtype):
+    rng = np.random.default_rng(0)
+    written = rng.uniform(-1.2, 1.2, 3000).astype(np.float32) # Includes clipped samples
+    path = str(tmp_path / 'a.wav')
+    sf.write(path, written, 24000, subtype=subtype)
+    from_memory = wavio.as_read(written, wavio.read_info(path))
+    assert np.array_equal(from_memory, wavio.read(path)[0])
+
+
+def test_non_wav_falls_back_to_soundfile(tmp_path):
+    path = str(tmp_path / 'a.flac')
+    sf.write(path, np.linspace(-0.5, 0.5, 1000), 16000)
+    audio, sr = wavio.read(path)
+    assert sr == 16000
+    assert np.array_equal(audio, sf.read(path, dtype='float32')[0])
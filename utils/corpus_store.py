@@ -0,0 +1,277 @@
+import os
+import glob
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+
+from utils import wavio
+from utils.method_registry import rate_key, rate_suffix
+
+# Packed corpus: one raw float32 file per sample rate holding every clip back to back,
+# plus index.json with (name, offset, length, sample_rate, source hash) per clip.
+# Readers get read-only np.memmap views, so processes on one host share a single
+# copy of the corpus through the page cache instead of each decoding its own.
+#
+# Data files are named after their content hash and never modified once written.
+# A writer adds a new data file, then replaces index.json (the commit point), then
+# deletes the data files the index no longer references; readers map every data
+# file when they load the index, so a reader never sees a half-written file or an
+# index that points at a file that doesn't exist yet.
+STORE_FORMAT_VERSION = 1
+INDEX_FILENAME = "index.json"
+DEFAULT_CORPUS_STORE = "assets/corpus_store"
+DATA_FILE_PATTERN = "audio_*.f32"
+OPEN_RETRIES = 3 # Times a reader reloads the index if a writer removed a data file in between
+
+
+def _data_filename(sample_rate, sha256):
+    return f"audio_{rate_key(sample_rate)}-{sha256[:16]}.f32"
+
+
+def load_index(store_dir):
+    """Loads a store's index, or returns an empty one if there's none."""
+    path = os.path.join(store_dir, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return {'version': STORE_FORMAT_VERSION, 'rates': {}}
+    with open(path, 'r') as f:
+        index = json.load(f)
+    if index.get('version') != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported corpus store version {index.get('version')} in {path}")
+    return index
+
+
+def _save_index(store_dir, index):
+    path = os.path.join(store_dir, INDEX_FILENAME)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def store_lock(store_dir):
+    """Serializes writers of a store (the index is read, changed and written back)."""
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, INDEX_FILENAME + ".lock"), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield # Released when the lock file is closed
+
+
+def _remove_unreferenced(store_dir, index):
+    """Deletes the data files the index doesn't reference (readers that mapped them keep their mappings)."""
+    referenced = {entry['data_file'] for entry in index['rates'].values()}
+    for path in glob.glob(os.path.join(store_dir, DATA_FILE_PATTERN)):
+        if os.path.basename(path) not in referenced:
+            logging.info(f"Removing unreferenced corpus store data file {path}")
+            os.remove(path)
+
+
+def write_rate(store_dir, sample_rate, clips):
+    """
+    (Re)writes the data file and index entry of one sample rate.
+
+    The data is written to a temporary file preallocated at its final size, with
+    every clip filled in place at its offset, and renamed to a name derived from its
+    content hash. The index is replaced last, and only then is the previous data
+    file of the rate removed.
+
+    Args:
+        store_dir (str): Store directory
+        sample_rate (int): Sample rate of the clips
+        clips (list): Dicts with 'name', 'length' (samples), 'source_sha256',
+            'sha256' (checksum of what the clip was read from) and 'fill', a
+            callable that writes the clip's samples into the float32 view it's given
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = os.path.join(store_dir, f"audio_{rate_key(sample_rate)}.f32.tmp-{os.getpid()}")
+    total = sum(clip['length'] for clip in clips)
+
+    entries = {}
+    offset = 0
+    digest = hashlib.sha256()
+    try:
+        if total > 0:
+            data = np.memmap(tmp_path, dtype=np.float32, mode='w+', shape=(total,))
+            for clip in clips:
+                clip['fill'](data[offset:offset + clip['length']])
+                entries[clip['name']] = {
+                    'offset': offset,
+                    'length': clip['length'],
+                    'source_sha256': clip.get('source_sha256'),
+                    'sha256': clip.get('sha256'),
+                }
+                offset += clip['length']
+            data.flush()
+            digest.update(data)
+            del data
+        else:
+            open(tmp_path, 'wb').close()
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        data_filename = _data_filename(sample_rate, digest.hexdigest())
+        data_path = os.path.join(store_dir, data_filename)
+
+        with store_lock(store_dir):
+            # Same content as an existing data file: os.replace() swaps in identical bytes
+            os.replace(tmp_path, data_path)
+            index = load_index(store_dir)
+            index['rates'][rate_key(sample_rate)] = {
+                'sample_rate': int(sample_rate),
+                'data_file': data_filename,
+                'num_samples': total,
+                'clips': entries,
+            }
+            _save_index(store_dir, index)
+            _remove_unreferenced(store_dir, index)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logging.info(f"Wrote {len(entries)} clip(s), {total} samples at {sample_rate} Hz to {data_path}")
+
+
+class CorpusStore:
+    """Read-only access to a packed corpus store."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        for attempt in range(OPEN_RETRIES):
+            self.index = load_index(store_dir)
+            try:
+                self._data = self._map_data_files()
+                break
+            except FileNotFoundError:
+                # A writer replaced the index and removed a data file after we read it
+                if attempt == OPEN_RETRIES - 1:
+                    raise
+
+    def _map_data_files(self):
+        """Maps the data file of every rate now, so the files stay readable if a writer removes them later."""
+        data = {}
+        for entry in self.index['rates'].values():
+            if entry['num_samples'] > 0:
+                data[entry['data_file']] = np.memmap(os.path.join(self.store_dir, entry['data_file']),
+                                                     dtype=np.float32, mode='r')
+        return data
+
+    def sample_rates(self):
+        return sorted(entry['sample_rate'] for entry in self.index['rates'].values())
+
+    def _rate_entry(self, sample_rate):
+        entry = self.index['rates'].get(rate_key(sample_rate))
+        if entry is None:
+            raise KeyError(f"Corpus store {self.store_dir} has no clips at {sample_rate} Hz")
+        return entry
+
+    def names(self, sample_rate):
+        """Returns the clip names stored at a sample rate, sorted."""
+        return sorted(self._rate_entry(sample_rate)['clips'])
+
+    def clip_info(self, name, sample_rate):
+        return self._rate_entry(sample_rate)['clips'][name]
+
+    def get(self, name, sample_rate):
+        """Returns a zero-copy, read-only float32 view of a clip."""
+        entry = self._rate_entry(sample_rate)
+        clip = entry['clips'][name]
+        if clip['length'] == 0:
+            return np.zeros(0, dtype=np.float32)
+        return self._data[entry['data_file']][clip['offset']:clip['offset'] + clip['length']]
+
+    def clips(self, sample_rate):
+        """Returns a StoreClip for every clip at a sample rate."""
+        return [StoreClip(self.store_dir, name, sample_rate) for name in self.names(sample_rate)]
+
+
+@lru_cache(maxsize=None)
+def open_store(store_dir):
+    """Opens a store once per process; its memory maps are shared by all clips."""
+    return CorpusStore(store_dir)
+
+
+class StoreClip:
+    """Reference to one clip of a corpus store, usable wherever a runner takes an input file.
+
+    Only the store path, name and rate are pickled, so clips can be sent to worker
+    processes, which map the store themselves.
+    """
+
+    def __init__(self, store_dir, name, sample_rate):
+        self.store_dir = store_dir
+        self.name = name
+        self.sample_rate = sample_rate
+
+    @property
+    def filename(self):
+        """The prepared file name this clip corresponds to, e.g. 'audio_long_16k.wav'."""
+        return f"{self.name}{rate_suffix(self.sample_rate)}.wav"
+
+    @property
+    def audio(self):
+        return open_store(self.store_dir).get(self.name, self.sample_rate)
+
+    @property
+    def num_samples(self):
+        return open_store(self.store_dir).clip_info(self.name, self.sample_rate)['length']
+
+    def __str__(self):
+        return f"{os.path.join(self.store_dir, self.filename)} (corpus store)"
+
+
+def list_inputs(input_dir, sample_rate, corpus_store=None):
+    """Returns the runner inputs at a sample rate: StoreClips from a store, or prepared file paths."""
+    if corpus_store:
+        store = open_store(corpus_store)
+        if rate_key(sample_rate) not in store.index['rates']:
+            return []
+        return store.clips(sample_rate)
+    return glob.glob(os.path.join(input_dir, f"*{rate_suffix(sample_rate)}.wav"))
+
+
+def input_filename(source):
+    """File name of an input: the base name of a path, or the prepared file name of a StoreClip."""
+    return source.filename if isinstance(source, StoreClip) else os.path.basename(source)
+
+
+def input_num_samples(source):
+    """Length of an input in samples (0 if it can't be read)."""
+    if isinstance(source, StoreClip):
+        return source.num_samples
+    try:
+        return wavio.read_info(source).frames
+    except Exception:
+        return 0
+
+
+def read_input(source, mono=False):
+    """Returns (float32 audio, sample_rate) for a file path or a StoreClip.
+
+    StoreClips are always mono; files are downmixed only with mono=True (the
+    prepared files are mono either way). Files go through utils.wavio, so both are
+    backed by memory maps rather than decoded copies.
+    """
+    if isinstance(source, StoreClip):
+        return source.audio, source.sample_rate
+    return wavio.read(source, dtype='float32', mono=mono)
+
+
+def read_input_blocks(source, block_size):
+    """Like read_input(source, mono=True), but streams the input: returns (sample_rate, iterator of float32 blocks).
+
+    At most block_size samples of a file are decoded at a time; a StoreClip yields slices of its memmap.
+    """
+    if isinstance(source, StoreClip):
+        audio = source.audio
+        return source.sample_rate, (audio[start:start + block_size] for start in range(0, len(audio), block_size))
+    import soundfile as sf
+
+    def blocks():
+        with sf.SoundFile(source) as f:
+            for block in f.blocks(blocksize=block_size, dtype='float32'):
+                yield np.mean(block, axis=1) if block.ndim > 1 else block
+    return sf.info(source).samplerate, blocks()
@@ -0,0 +1,51 @@
+import os
+import hashlib
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """Returns (size, mtime_ns) of a file, the cheap check used before re-hashing it."""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def cached_file_sha256(path, record):
+    """
+    Returns a file's SHA-256, reusing record['sha256'] if size and mtime are unchanged.
+
+    Args:
+        path (str): File to hash
+        record (dict): A previous record with 'size', 'mtime_ns' and 'sha256' keys, or None
+
+    Returns:
+        dict: A fresh record for the file ('size', 'mtime_ns', 'sha256')
+    """
+    size, mtime_ns = file_signature(path)
+    if record and record.get('size') == size and record.get('mtime_ns') == mtime_ns and record.get('sha256'):
+        return {'size': size, 'mtime_ns': mtime_ns, 'sha256': record['sha256']}
+    return {'size': size, 'mtime_ns': mtime_ns, 'sha256': file_sha256(path)}
+
+
+def buffer_record(signature, data):
+    """
+    A cached_file_sha256() record for a file just written from an in-memory buffer, without reading it back.
+
+    Args:
+        signature (tuple): file_signature() of the file, taken right after it was written
+        data: Bytes-like (e.g. a contiguous numpy array) the file was written from
+
+    Returns:
+        dict: 'size' and 'mtime_ns' of the file and the 'sha256' of data. While the file
+            keeps that size and mtime, cached_file_sha256() returns this hash as is; once
+            it changes, the file's own hash won't match it.
+    """
+    size, mtime_ns = signature
+    return {'size': size, 'mtime_ns': mtime_ns, 'sha256': hashlib.sha256(data).hexdigest()}
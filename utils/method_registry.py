@@ -0,0 +1,51 @@
+import re
+
+# Native input sample rate of every method, keyed by its directory under methods/.
+# Preparation writes <name>_<rate key>.wav for exactly these rates, and each runner
+# reads the files at its own rate, so no method resamples its input again.
+METHOD_SAMPLE_RATES = {
+    "dtln": 16000,
+    "rnnoise": 48000, # RNNoise's 480-sample frames are 10 ms at 48 kHz
+    "supervoice_flow": 24000, # supervoice-enhance's model.sample_rate
+    "voice_fixer_mode_0": 44100,
+    "voice_fixer_mode_1": 44100,
+}
+
+_RATE_SUFFIX_RE = re.compile(r'_(\d+)k$')
+
+
+def rate_key(sample_rate):
+    """Returns the file name key for a sample rate, e.g. 16000 -> '16k', 44100 -> '44k'."""
+    return f"{int(sample_rate) // 1000}k"
+
+
+def rate_suffix(sample_rate):
+    """Returns the file name suffix for a sample rate, e.g. '_16k'."""
+    return f"_{rate_key(sample_rate)}"
+
+
+def method_sample_rate(method):
+    """Returns a method's native input sample rate."""
+    if method not in METHOD_SAMPLE_RATES:
+        raise KeyError(f"Method '{method}' has no sample rate in utils/method_registry.py")
+    return METHOD_SAMPLE_RATES[method]
+
+
+def method_rate_suffix(method):
+    """Returns the suffix of the prepared files a method reads, e.g. '_16k' for dtln."""
+    return rate_suffix(method_sample_rate(method))
+
+
+def required_sample_rates(methods=None):
+    """Returns {rate key: sample rate} for the given methods (default: all registered methods)."""
+    methods = METHOD_SAMPLE_RATES if methods is None else methods
+    rates = sorted({method_sample_rate(m) for m in methods})
+    return {rate_key(sr): sr for sr in rates}
+
+
+def split_rate_suffix(stem):
+    """Splits 'name_16k' into ('name', '16k'); returns (stem, None) if there's no rate suffix."""
+    match = _RATE_SUFFIX_RE.search(stem)
+    if not match:
+        return stem, None
+    return stem[:match.start()], f"{match.group(1)}k"
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import wavio
+from utils.hashing import buffer_record, file_signature
+from utils.spectrogram import DEFAULT_RENDERER, save_spectrogram
+from utils.spectrogram_cache import IMAGE_SUFFIX, cache_entry, has_tiles, record_image, render_params
+
+# Method runners can render the spectrogram of each output file from the buffer they
+# just wrote, instead of summary.py decoding every file again later. The image goes
+# where summary.py puts it (spectrograms/<method>/<name>_spectrogram.png) and is
+# recorded in that directory's spectrogram cache, so summary.py finds it up to date.
+#   inline:     render in the runner's process right after the file is written
+#   background: render on a thread while the runner goes on with the next file
+SPECTROGRAM_MODES = ['inline', 'background']
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SPECTROGRAMS_DIR = os.path.join(REPO_ROOT, "spectrograms") # summary.py's SPECTROGRAMS_DIR
+MAX_PENDING = 8 # Outputs queued for the background renderer before add() waits
+
+
+def spectrogram_location(output_path, spectrograms_dir=SPECTROGRAMS_DIR):
+    """
+    Where summary.py keeps the image of a method output: (spectrogram directory, image name).
+
+    Returns None for files outside methods/<method>/output, which summary.py doesn't show.
+    """
+    output_dir = os.path.dirname(os.path.realpath(output_path))
+    method_dir, output_name = os.path.split(output_dir)
+    methods_dir, method = os.path.split(method_dir)
+    if output_name != "output" or methods_dir != os.path.join(os.path.realpath(REPO_ROOT), "methods"):
+        return None
+    image_name = os.path.basename(output_path).replace('.wav', IMAGE_SUFFIX)
+    return os.path.join(spectrograms_dir, method), image_name
+
+
+class OutputSpectrograms:
+    """
+    Renders the spectrograms of a runner's outputs from memory; a no-op without a mode.
+
+    Call add() right after writing each output file and close() (or leave the with
+    block) when done, which waits for the background renderer.
+    """
+
+    def __init__(self, mode=None, renderer=DEFAULT_RENDERER, spectrograms_dir=SPECTROGRAMS_DIR):
+        self.mode = mode
+        self.renderer = renderer
+        self.spectrograms_dir = spectrograms_dir
+        self.params = render_params(renderer)
+        self.rendered = 0
+        self.seconds = 0.0
+        self._warned = False
+        self._executor = None
+        if mode == 'background':
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spectrograms")
+            self._pending = threading.BoundedSemaphore(MAX_PENDING)
+        if mode:
+            logging.info(f"Rendering output spectrograms ({mode}) into {spectrograms_dir}")
+
+    @property
+    def enabled(self):
+        """Whether add() renders anything, for callers that must prepare the buffer first."""
+        return bool(self.mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, output_path, audio, sr):
+        """Renders (or queues) the spectrogram of output_path, which was just written from audio."""
+        if not self.mode:
+            return
+        location = spectrogram_location(output_path, self.spectrograms_dir)
+        if location is None:
+            if not self._warned:
+                logging.warning(f"Not rendering spectrograms for {os.path.dirname(output_path) or '.'}: "
+                                "summary.py only shows outputs in methods/<method>/output.")
+                self._warned = True
+            return
+        audio = np.asarray(audio)
+        if audio.ndim > 1 and 1 in audio.shape:
+            audio = audio.reshape(-1) # (1, samples) or (samples, 1)
+        try:
+            # The samples as summary.py would decode them from the file (e.g. quantized to 16 bits),
+            # so the image matches one rendered from the file. This is a new array; the runner may
+            # reuse its buffer.
+            audio = wavio.as_read(audio, wavio.read_info(output_path), mono=True)
+            # The cache keys the image on the file's size and mtime as written now, and a hash of
+            # these samples instead of the file's bytes, so the file isn't read back to hash it
+            signature = file_signature(output_path)
+        except Exception as e:
+            logging.error(f"Error rendering the spectrogram of {output_path}: {e}")
+            return
+        if self._executor is None:
+            self._render(output_path, audio, sr, location, signature)
+            return
+        self._pending.acquire()
+        future = self._executor.submit(self._render, output_path, audio, sr, location, signature)
+        future.add_done_callback(lambda _: self._pending.release())
+
+    def _render(self, output_path, audio, sr, location, signature):
+        spectrogram_dir, image_name = location
+        image_path = os.path.join(spectrogram_dir, image_name)
+        start = time.perf_counter()
+        try:
+            save_spectrogram(audio, sr, image_path, renderer=self.renderer)
+            entry = cache_entry(os.path.relpath(output_path, REPO_ROOT), buffer_record(signature, np.ascontiguousarray(audio)),
+                                self.params, has_tiles(image_path))
+            record_image(spectrogram_dir, image_name, entry)
+        except Exception as e:
+            logging.error(f"Error rendering the spectrogram of {output_path}: {e}")
+            return
+        self.rendered += 1
+        self.seconds += time.perf_counter() - start
+        logging.debug(f"Rendered {image_path} in {time.perf_counter() - start:.2f}s")
+
+    def close(self):
+        """Waits for the queued spectrograms."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self.mode and self.rendered:
+            logging.info(f"Rendered {self.rendered} output spectrogram(s) in {self.seconds:.2f}s")
@@ -0,0 +1,228 @@
+import math
+from functools import lru_cache
+import numpy as np
+
+# Selectable resampler backends. Only numpy_poly is always available; the others
+# import their library when first used, so each environment only needs what it uses.
+SOXR_QUALITIES = {
+    'soxr_qq': 'QQ', # Quick cubic interpolation
+    'soxr_lq': 'LQ',
+    'soxr_mq': 'MQ',
+    'soxr_hq': 'HQ', # librosa.resample's default
+    'soxr_vhq': 'VHQ',
+}
+BACKENDS = ['numpy_poly', 'scipy_poly'] + list(SOXR_QUALITIES) + ['torchaudio', 'torchaudio_kaiser_best']
+DEFAULT_BACKEND = 'soxr_hq' # What preparation.py used through librosa.resample before the backends were selectable
+
+
+def rational_factors(orig_sr, target_sr):
+    """Returns the (up, down) factors that take orig_sr to target_sr."""
+    g = math.gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // g, int(orig_sr) // g
+
+
+def polyphase_kernel(up, down, half_len_factor=10, beta=5.0):
+    """
+    Designs the anti-aliasing low-pass filter for rational resampling by up/down.
+
+    This is the same Kaiser-windowed sinc that scipy.signal.resample_poly designs by
+    default (window=('kaiser', 5.0)), computed with NumPy only so it can also be used
+    in method environments without SciPy.
+
+    Args:
+        up (int): Upsampling factor
+        down (int): Downsampling factor
+        half_len_factor (int): Filter half-length in units of max(up, down)
+        beta (float): Kaiser window shape parameter
+
+    Returns:
+        np.ndarray: Filter taps (length 2 * half_len_factor * max(up, down) + 1), unit DC gain
+    """
+    max_rate = max(up, down)
+    cutoff = 1.0 / max_rate
+    num_taps = 2 * half_len_factor * max_rate + 1
+    n = np.arange(num_taps) - (num_taps - 1) / 2.0
+    h = cutoff * np.sinc(cutoff * n)
+    h *= np.kaiser(num_taps, beta)
+    h /= np.sum(h)
+    return h
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(orig_sr, target_sr):
+    """Returns (up, down, kernel) for a rate pair; designed once per process and reused."""
+    up, down = rational_factors(orig_sr, target_sr)
+    return up, down, polyphase_kernel(up, down)
+
+
+class StreamingResampler:
+    """
+    Stateful polyphase resampler that can be fed a signal in chunks of any size.
+
+    The output is aligned with the input (the filter delay is compensated), so
+    concatenating the results of process() and flush() gives the same signal as
+    resampling in one piece with scipy.signal.resample_poly and the same kernel:
+    ceil(len(x) * up / down) samples. Only the last few input samples are kept
+    between calls, so memory does not grow with the signal length.
+    """
+
+    def __init__(self, orig_sr, target_sr, kernel=None):
+        """
+        Args:
+            orig_sr (int): Input sample rate
+            target_sr (int): Output sample rate
+            kernel (np.ndarray): Optional low-pass filter with unit DC gain and odd
+                length; defaults to polyphase_kernel(up, down)
+        """
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up, self.down = rational_factors(orig_sr, target_sr)
+        h = polyphase_filter(orig_sr, target_sr)[2] if kernel is None else np.asarray(kernel, dtype=np.float64)
+        h = h * self.up
+        self._half_len = (len(h) - 1) // 2
+
+        # Polyphase decomposition: phase r uses taps h[r], h[r + up], h[r + 2 * up], ...
+        self._num_taps = -(-len(h) // self.up)
+        phases = np.zeros((self.up, self._num_taps))
+        for r in range(self.up):
+            taps = h[r::self.up]
+            phases[r, :len(taps)] = taps
+        # Reversed so a phase can be applied to a forward window of input samples
+        self._phases_rev = phases[:, ::-1].copy()
+        self.reset()
+
+    def reset(self):
+        """Clears the stream state."""
+        # Input history; the samples before the start of the signal are zeros
+        self._history = np.zeros(self._num_taps - 1)
+        self._num_in = 0
+        self._num_out = 0
+
+    def _emit(self, chunk, out_limit):
+        """Appends a chunk to the input and returns the outputs that became computable."""
+        buf = np.concatenate((self._history, chunk))
+        num_in = self._num_in + len(chunk)
+        base = num_in - len(buf) # Stream index of buf[0]
+
+        # Output m needs inputs up to (m * down + half_len) // up
+        out_end = -(-(num_in * self.up - self._half_len) // self.down)
+        out_end = max(self._num_out, min(out_end, out_limit))
+        num_out = out_end - self._num_out
+        out = np.empty(num_out)
+        if num_out > 0:
+            windows = np.lib.stride_tricks.sliding_window_view(buf, self._num_taps)
+            # Outputs m, m + up, m + 2 * up, ... share a phase and their input windows
+            # advance by exactly `down` samples, so each phase is one strided matrix-vector product
+            for k in range(min(self.up, num_out)):
+                t = (self._num_out + k) * self.down + self._half_len
+                last_in = t // self.up
+                phase = t - last_in * self.up
+                start = last_in - (self._num_taps - 1) - base
+                count = (num_out - k + self.up - 1) // self.up
+                out[k::self.up] = windows[start:start + (count - 1) * self.down + 1:self.down] @ self._phases_rev[phase]
+
+        self._history = buf[len(buf) - (self._num_taps - 1):]
+        self._num_in = num_in
+        self._num_out = out_end
+        return out
+
+    def process(self, chunk):
+        """Resamples the next chunk of a mono signal and returns the new output samples."""
+        chunk = np.asarray(chunk, dtype=np.float64)
+        return self._emit(chunk, np.iinfo(np.int64).max).astype(np.float32)
+
+    def flush(self):
+        """Ends the stream and returns the remaining output samples; call reset() to reuse."""
+        total_out = -(-(self._num_in * self.up) // self.down)
+        if total_out > self._num_out:
+            last_in = ((total_out - 1) * self.down + self._half_len) // self.up
+            padding = np.zeros(max(0, last_in - self._num_in + 1))
+            num_in = self._num_in
+            out = self._emit(padding, total_out)
+            self._num_in = num_in
+        else:
+            out = np.zeros(0)
+        return out.astype(np.float32)
+
+
+class _SoxrStream:
+    """Adapts soxr.ResampleStream to the process()/flush() interface of StreamingResampler."""
+
+    def __init__(self, orig_sr, target_sr, quality):
+        import soxr
+        self._stream = soxr.ResampleStream(orig_sr, target_sr, 1, dtype='float32', quality=quality)
+
+    def process(self, chunk):
+        return self._stream.resample_chunk(np.ascontiguousarray(chunk, dtype=np.float32))
+
+    def flush(self):
+        return self._stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def create_stream(backend, orig_sr, target_sr):
+    """
+    Returns a stateful resampler with process(chunk) and flush() for a backend.
+
+    Raises:
+        ValueError: If the backend has no streaming mode (torchaudio)
+    """
+    if backend in ('numpy_poly', 'scipy_poly'):
+        # Same kernel as the one-shot scipy_poly path
+        return StreamingResampler(orig_sr, target_sr)
+    if backend in SOXR_QUALITIES:
+        return _SoxrStream(orig_sr, target_sr, SOXR_QUALITIES[backend])
+    raise ValueError(f"Resampler backend '{backend}' has no streaming mode")
+
+
+def resample(y, orig_sr, target_sr, backend=DEFAULT_BACKEND):
+    """
+    Resamples a mono signal with the selected backend.
+
+    Args:
+        y (np.ndarray): Mono signal
+        orig_sr (int): Its sample rate
+        target_sr (int): Output sample rate
+        backend (str): One of BACKENDS
+
+    Returns:
+        np.ndarray: The resampled float32 signal
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown resampler backend '{backend}', choose one of {BACKENDS}")
+    y = np.asarray(y, dtype=np.float32)
+    if orig_sr == target_sr:
+        return y
+
+    if backend == 'numpy_poly':
+        stream = StreamingResampler(orig_sr, target_sr)
+        return np.concatenate((stream.process(y), stream.flush()))
+    if backend == 'scipy_poly':
+        from scipy.signal import resample_poly
+        up, down, kernel = polyphase_filter(orig_sr, target_sr)
+        return resample_poly(y, up, down, window=kernel).astype(np.float32)
+    if backend in SOXR_QUALITIES:
+        import soxr
+        return soxr.resample(y, orig_sr, target_sr, quality=SOXR_QUALITIES[backend]).astype(np.float32)
+
+    import torch
+    with torch.inference_mode():
+        out = torchaudio_resampler(backend, orig_sr, target_sr)(torch.from_numpy(y))
+    return out.numpy().astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def torchaudio_resampler(backend, orig_sr, target_sr):
+    """
+    Returns a torchaudio Resample transform for a torchaudio backend and rate pair.
+
+    torchaudio.functional.resample() designs its sinc kernel on every call; the
+    transform designs it once, and is kept for the rest of the process.
+    """
+    import torch
+    import torchaudio
+    if backend == 'torchaudio_kaiser_best':
+        # The "kaiser_best" settings from torchaudio's resampling tutorial
+        return torchaudio.transforms.Resample(orig_sr, target_sr, lowpass_filter_width=64,
+                                              rolloff=0.9475937167399596, resampling_method='sinc_interp_kaiser',
+                                              beta=14.769656459379492, dtype=torch.float32)
+    return torchaudio.transforms.Resample(orig_sr, target_sr, dtype=torch.float32)
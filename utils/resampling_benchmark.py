@@ -0,0 +1,117 @@
+import sys
+import json
+import time
+import argparse
+import logging
+import numpy as np
+
+from utils.resampling import BACKENDS, resample
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_SOURCE_RATE = 48000 # Rate of the recordings in assets/audio_samples/original_rate
+PASSBAND_FRACTION = 0.8 # Tones up to this fraction of the output Nyquist must pass unchanged
+EDGE_SECONDS = 0.1 # Ignored at both ends when measuring the error
+
+
+def rate_pairs(source_rate):
+    """The (label, orig_sr, target_sr) pairs used by the pipeline."""
+    return [
+        ("source->16k", source_rate, 16000),
+        ("source->44.1k", source_rate, 44100),
+        ("44.1k->24k", 44100, 24000),
+    ]
+
+
+def _tones(freqs, phases, sr, num_samples):
+    t = np.arange(num_samples) / sr
+    return np.sum(np.sin(2 * np.pi * freqs[:, None] * t[None, :] + phases[:, None]), axis=0) / len(freqs)
+
+
+def passband_snr(backend, orig_sr, target_sr, seconds, rng):
+    """SNR in dB of a multitone signal within the passband against the exact resampled tones."""
+    nyquist = min(orig_sr, target_sr) / 2
+    freqs = np.geomspace(50.0, PASSBAND_FRACTION * nyquist, 24)
+    phases = rng.uniform(0, 2 * np.pi, len(freqs))
+    x = _tones(freqs, phases, orig_sr, int(seconds * orig_sr)).astype(np.float32)
+    y = resample(x, orig_sr, target_sr, backend)
+    ideal = _tones(freqs, phases, target_sr, len(y))
+    edge = int(EDGE_SECONDS * target_sr)
+    err = y[edge:-edge] - ideal[edge:-edge]
+    return 10 * np.log10(np.sum(ideal[edge:-edge] ** 2) / max(np.sum(err ** 2), 1e-30))
+
+
+def alias_level(backend, orig_sr, target_sr, seconds, rng):
+    """Output power in dB (relative to the input) of tones above the output Nyquist, or None when upsampling."""
+    target_nyquist, source_nyquist = target_sr / 2, orig_sr / 2
+    if target_nyquist >= source_nyquist:
+        return None
+    # Leave the first 10% above Nyquist to the filter's transition band
+    low = target_nyquist + 0.1 * (source_nyquist - target_nyquist)
+    freqs = np.linspace(low, 0.98 * source_nyquist, 16)
+    phases = rng.uniform(0, 2 * np.pi, len(freqs))
+    x = _tones(freqs, phases, orig_sr, int(seconds * orig_sr)).astype(np.float32)
+    y = resample(x, orig_sr, target_sr, backend)
+    edge = int(EDGE_SECONDS * target_sr)
+    return 10 * np.log10(max(np.mean(y[edge:-edge] ** 2), 1e-30) / np.mean(x ** 2))
+
+
+def throughput(backend, orig_sr, target_sr, seconds, repeats, rng):
+    """Seconds of audio resampled per second of wall time (best of repeats)."""
+    x = (0.1 * rng.standard_normal(int(seconds * orig_sr))).astype(np.float32)
+    resample(x[:orig_sr], orig_sr, target_sr, backend) # Warm-up: imports, filter design
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        resample(x, orig_sr, target_sr, backend)
+        best = min(best, time.perf_counter() - start)
+    return seconds / best
+
+
+def run_benchmark(backends, source_rate, seconds, repeats, seed=0):
+    """Measures every backend on every rate pair; returns a list of result dicts."""
+    results = []
+    for backend in backends:
+        for label, orig_sr, target_sr in rate_pairs(source_rate):
+            rng = np.random.default_rng(seed)
+            try:
+                result = {
+                    'backend': backend,
+                    'pair': label,
+                    'orig_sr': orig_sr,
+                    'target_sr': target_sr,
+                    'realtime_factor': throughput(backend, orig_sr, target_sr, seconds, repeats, rng),
+                    'snr_db': passband_snr(backend, orig_sr, target_sr, 2.0, rng),
+                    'alias_db': alias_level(backend, orig_sr, target_sr, 2.0, rng),
+                }
+            except ImportError as e:
+                logging.warning(f"Skipping backend {backend}: {e}")
+                break
+            results.append(result)
+            alias = "n/a" if result['alias_db'] is None else f"{result['alias_db']:.1f} dB"
+            logging.info(f"{backend:<24} {label:<14} {result['realtime_factor']:>9.0f}x realtime   "
+                         f"SNR {result['snr_db']:6.1f} dB   alias {alias}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare resampler backends on speed, passband SNR and aliasing for the pipeline's rate pairs.")
+    parser.add_argument("--backends", nargs='+', default=BACKENDS, choices=BACKENDS,
+                        help="Backends to measure (default: all; missing libraries are skipped)")
+    parser.add_argument("--source-rate", type=int, default=DEFAULT_SOURCE_RATE,
+                        help=f"Sample rate of the source recordings (default: {DEFAULT_SOURCE_RATE})")
+    parser.add_argument("--seconds", type=float, default=30.0,
+                        help="Length of the signal used for the throughput measurement (default: 30)")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Timing repeats; the best is reported (default: 3)")
+    parser.add_argument("--output-json", type=str, default=None,
+                        help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.backends, args.source_rate, args.seconds, args.repeats)
+    if args.output_json:
+        with open(args.output_json, 'w') as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Results written to {args.output_json}")
+    if not results:
+        sys.exit(1)
@@ -1,14 +1,61 @@
 import os
-import numpy as np
-import librosa
-import librosa.display
-import matplotlib.pyplot as plt
-from pathlib import Path
+import sys
+import time
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Make the utils package importable when this file is run as a script
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
+
+from utils import wavio
+from utils.spectrogram_engine import DEFAULT_FIGSIZE, DEFAULT_DPI, image_size, render_spectrogram, write_png
+from utils.spectrogram_tiles import tiles_dir_for, wants_tiles, write_tiles, remove_tiles
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def create_spectrogram(audio_path, output_path, figsize=(8, 4)):
+# numpy: utils/spectrogram_engine.py, no figure; matplotlib: the original plt.specgram + savefig path
+RENDERERS = ['numpy', 'matplotlib']
+DEFAULT_RENDERER = 'numpy'
+
+def _save_with_matplotlib(y, sr, output_path, figsize, dpi):
+    import matplotlib.pyplot as plt
+    # Create spectrogram
+    plt.figure(figsize=figsize)
+    plt.specgram(y, Fs=sr, cmap='viridis')
+    plt.axis('off')  # Remove axes for cleaner look
+    
+    # Save with tight layout and transparent background
+    plt.savefig(output_path, bbox_inches='tight', pad_inches=0, transparent=True, dpi=dpi)
+    plt.close()
+
+def save_spectrogram(y, sr, output_path, figsize=DEFAULT_FIGSIZE, renderer=DEFAULT_RENDERER, dpi=DEFAULT_DPI):
+    """
+    Renders mono samples already in memory to output_path, as create_spectrogram() does for a file.
+
+    Files of utils.spectrogram_tiles.TILED_MIN_SECONDS or longer also get a tile
+    pyramid in <output>_tiles/; the numpy renderer draws both from one STFT pass.
+    """
+    # Create output directory if it doesn't exist
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    logging.debug(f"Generating spectrogram for: {os.path.basename(output_path)} ({renderer})")
+    tiles_dir = tiles_dir_for(output_path)
+    tiled = wants_tiles(len(y), sr)
+    if renderer == 'matplotlib':
+        _save_with_matplotlib(y, sr, output_path, figsize, dpi)
+        if tiled:
+            write_tiles(y, sr, tiles_dir)
+    elif tiled:
+        write_png(output_path, write_tiles(y, sr, tiles_dir, image_size(figsize, dpi)))
+    else:
+        write_png(output_path, render_spectrogram(y, sr, figsize, dpi))
+    if not tiled and remove_tiles(tiles_dir):
+        logging.debug(f"Removed the tiles of {output_path}, the file is too short for them now")
+    logging.debug(f"Saved spectrogram to: {output_path}")
+
+def create_spectrogram(audio_path, output_path, figsize=DEFAULT_FIGSIZE, renderer=DEFAULT_RENDERER, dpi=DEFAULT_DPI):
     """
     Create a spectrogram from an audio file and save it as an image.
     
@@ -16,65 +63,120 @@ def create_spectrogram(audio_path, output_path, figsize=(8, 4)):
         audio_path (str): Path to the audio file
         output_path (str): Path where to save the spectrogram image
         figsize (tuple): Figure size (width, height) in inches
+        renderer (str): 'numpy' (default) or 'matplotlib'; both draw the same image
+        dpi (int): Resolution of the figure
     """
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
     logging.debug(f"Loading audio file: {audio_path}")
-    # Load the audio file
-    y, sr = librosa.load(audio_path)
-    
-    logging.debug(f"Generating spectrogram for: {os.path.basename(audio_path)}")
-    # Create spectrogram
-    plt.figure(figsize=figsize)
-    plt.specgram(y, Fs=sr, cmap='viridis')
-    plt.axis('off')  # Remove axes for cleaner look
-    
-    # Save with tight layout and transparent background
-    plt.savefig(output_path, bbox_inches='tight', pad_inches=0, transparent=True, dpi=100)
-    plt.close()
-    logging.debug(f"Saved spectrogram to: {output_path}")
+    # Load the audio file at its native rate
+    y, sr = wavio.read(audio_path, dtype='float32', mono=True)
+    save_spectrogram(y, sr, output_path, figsize, renderer, dpi)
+
+def init_worker(log_level=logging.INFO, renderer=DEFAULT_RENDERER):
+    """Pool initializer: sets up matplotlib once per worker process instead of once per file."""
+    logging.getLogger().setLevel(log_level)
+    if renderer == 'matplotlib':
+        import matplotlib.pyplot as plt
+        # Non-interactive backend, so workers never try to open a display
+        plt.switch_backend('Agg')
 
-def generate_spectrograms_for_directory(audio_dir, output_dir):
+def render_task(task, renderer=DEFAULT_RENDERER):
+    """
+    Renders one (audio_path, output_path) task; errors stay with the file instead of stopping the run.
+
+    Returns:
+        tuple: (audio_path, error message or None, seconds)
+    """
+    audio_path, output_path = task
+    start = time.perf_counter()
+    try:
+        create_spectrogram(audio_path, output_path, renderer=renderer)
+        return audio_path, None, time.perf_counter() - start
+    except Exception as e:
+        if renderer == 'matplotlib':
+            import matplotlib.pyplot as plt
+            plt.close('all') # Don't leak a half-built figure into the next file
+        return audio_path, str(e) or type(e).__name__, time.perf_counter() - start
+
+def find_spectrogram_tasks(audio_dir, output_dir):
+    """Lists an (audio_path, output_path) task for every WAV file under audio_dir, mirroring its layout."""
+    tasks = []
+    for root, _, files in os.walk(audio_dir):
+        for file in sorted(f for f in files if f.endswith('.wav')):
+            audio_path = os.path.join(root, file)
+            # Create relative path structure in output directory
+            rel_path = os.path.relpath(audio_path, audio_dir)
+            tasks.append((audio_path, os.path.join(output_dir, rel_path.replace('.wav', '_spectrogram.png'))))
+    return tasks
+
+def run_spectrogram_tasks(tasks, jobs=1, renderer=DEFAULT_RENDERER):
+    """
+    Renders the tasks, serially or on a pool of jobs worker processes.
+
+    Args:
+        tasks (list): (audio_path, output_path) pairs
+        jobs (int): Number of worker processes; 1 renders in this process
+        renderer (str): See RENDERERS
+
+    Returns:
+        tuple: (number rendered, list of (audio_path, error) for the files that failed)
+    """
+    failed = []
+    if not tasks:
+        return 0, failed
+    start = time.perf_counter()
+
+    def report(done, result):
+        audio_path, error, seconds = result
+        if error is None:
+            logging.info(f"[{done}/{len(tasks)}] {audio_path} ({seconds:.2f}s)")
+        else:
+            logging.error(f"[{done}/{len(tasks)}] Error processing {audio_path}: {error}")
+            failed.append((audio_path, error))
+
+    if jobs > 1 and len(tasks) > 1:
+        # Largest files first, so a long recording doesn't start last and hold up the run
+        tasks = sorted(tasks, key=lambda task: os.path.getsize(task[0]), reverse=True)
+        logging.info(f"Rendering {len(tasks)} spectrogram(s) with {jobs} worker processes...")
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+                                 initargs=(logging.getLogger().getEffectiveLevel(), renderer)) as executor:
+            futures = {executor.submit(render_task, task, renderer): task for task in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A worker that died takes only its own file down with it
+                    result = (futures[future][0], f"worker failed: {e!r}", 0.0)
+                report(done, result)
+    else:
+        for done, task in enumerate(tasks, 1):
+            report(done, render_task(task, renderer))
+
+    logging.info(f"Rendered {len(tasks) - len(failed)}/{len(tasks)} spectrogram(s) in {time.perf_counter() - start:.2f}s"
+                 + (f", {len(failed)} failed" if failed else ""))
+    return len(tasks) - len(failed), failed
+
+def generate_spectrograms_for_directory(audio_dir, output_dir, jobs=1, renderer=DEFAULT_RENDERER):
     """
     Generate spectrograms for all audio files in a directory.
     
     Args:
         audio_dir (str): Directory containing audio files
         output_dir (str): Directory where to save spectrogram images
+        jobs (int): Number of worker processes
+        renderer (str): See RENDERERS
     """
     os.makedirs(output_dir, exist_ok=True)
     
-    # Count total number of WAV files
-    total_files = sum(1 for root, _, files in os.walk(audio_dir) 
-                     for file in files if file.endswith('.wav'))
-    
-    if total_files == 0:
+    tasks = find_spectrogram_tasks(audio_dir, output_dir)
+    if not tasks:
         logging.info(f"No WAV files found in {audio_dir}")
         return
     
-    logging.info(f"Starting spectrogram generation for {total_files} files in {audio_dir}")
-    processed_count = 0
-    
-    # Process all wav files
-    for root, _, files in os.walk(audio_dir):
-        wav_files = [f for f in files if f.endswith('.wav')]
-        for file in wav_files:
-            processed_count += 1
-            audio_path = os.path.join(root, file)
-            # Create relative path structure in output directory
-            rel_path = os.path.relpath(audio_path, audio_dir)
-            output_path = os.path.join(output_dir, rel_path.replace('.wav', '_spectrogram.png'))
-            
-            # Create spectrogram
-            try:
-                logging.info(f"[{processed_count}/{total_files}] Processing: {rel_path}")
-                create_spectrogram(audio_path, output_path)
-            except Exception as e:
-                logging.error(f"Error processing {audio_path}: {e}")
+    logging.info(f"Starting spectrogram generation for {len(tasks)} files in {audio_dir}")
+    processed_count, _ = run_spectrogram_tasks(tasks, jobs, renderer)
     
     logging.info(f"Completed spectrogram generation for {audio_dir}")
-    logging.info(f"Successfully processed: {processed_count}/{total_files} files")
+    logging.info(f"Successfully processed: {processed_count}/{len(tasks)} files")
     logging.info(f"Output directory: {output_dir}")
 
 if __name__ == "__main__":
@@ -84,6 +186,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate spectrograms from audio files")
     parser.add_argument("--audio-dir", type=str, help="Directory containing audio files")
     parser.add_argument("--output-dir", type=str, default="spectrograms", help="Output directory for spectrograms")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument("--renderer", choices=RENDERERS, default=DEFAULT_RENDERER,
+                        help=f"Spectrogram renderer; matplotlib is the slower original (default: {DEFAULT_RENDERER})")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable debug logging")
     
     args = parser.parse_args()
@@ -92,6 +197,6 @@ if __name__ == "__main__":
         logging.getLogger().setLevel(logging.DEBUG)
     
     if args.audio_dir:
-        generate_spectrograms_for_directory(args.audio_dir, args.output_dir)
+        generate_spectrograms_for_directory(args.audio_dir, args.output_dir, max(1, args.jobs), args.renderer)
     else:
         logging.error("Please provide --audio-dir argument") 
\ No newline at end of file
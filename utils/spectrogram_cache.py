@@ -0,0 +1,198 @@
+import os
+import json
+import fcntl
+import shutil
+import logging
+from contextlib import contextmanager
+
+from utils.hashing import cached_file_sha256
+from utils.spectrogram import DEFAULT_RENDERER, find_spectrogram_tasks, run_spectrogram_tasks
+from utils import spectrogram_engine as engine
+from utils.spectrogram_tiles import MANIFEST_FILENAME, TILES_SUFFIX, tile_params, tiles_dir_for
+
+# Every spectrogram directory (spectrograms/prepared, spectrograms/<method>) keeps a
+# cache file mapping each image to the content hash of the audio it was rendered
+# from and the render parameters. Only images whose audio or parameters changed
+# are rendered again, and images whose audio is gone are removed. The tile pyramid
+# of a long file (utils/spectrogram_tiles.py) belongs to its image and is kept,
+# rebuilt and removed with it. Method runners add entries too
+# (utils/output_spectrograms.py), so changes are saved under a file lock.
+CACHE_FILENAME = "spectrogram_cache.json"
+CACHE_VERSION = 1
+IMAGE_SUFFIX = "_spectrogram.png"
+
+
+def render_params(renderer=DEFAULT_RENDERER, figsize=engine.DEFAULT_FIGSIZE, dpi=engine.DEFAULT_DPI):
+    """Describes how an image is rendered; images made with different parameters are rebuilt."""
+    return {
+        'renderer': renderer,
+        'figsize': list(figsize),
+        'dpi': dpi,
+        'colormap': 'viridis',
+        'nfft': engine.NFFT,
+        'noverlap': engine.NOVERLAP,
+        'window': 'hann',
+        'scale': 'dB',
+        'tiles': tile_params(),
+    }
+
+
+def load_cache(output_dir):
+    """Loads a directory's spectrogram cache, or returns an empty one if it's missing or unreadable."""
+    empty = {'version': CACHE_VERSION, 'images': {}}
+    path = os.path.join(output_dir, CACHE_FILENAME)
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable spectrogram cache {path}: {e}")
+        return empty
+    if cache.get('version') != CACHE_VERSION:
+        logging.info(f"Spectrogram cache {path} has an old format; its images will be rebuilt.")
+        return empty
+    return cache
+
+
+def save_cache(output_dir, cache):
+    """Writes the cache atomically, so an interrupted run never leaves a truncated file."""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, CACHE_FILENAME)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def cache_lock(output_dir):
+    """Holds an exclusive lock on a directory's cache while its file is read, changed and written."""
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, CACHE_FILENAME + ".lock"), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield # Released when the lock file is closed
+
+
+def record_image(output_dir, image_name, entry):
+    """Adds one image's entry to a directory's cache, keeping the entries other processes wrote."""
+    with cache_lock(output_dir):
+        cache = load_cache(output_dir)
+        cache['images'][image_name] = entry
+        save_cache(output_dir, cache)
+
+
+def cache_entry(audio_path, audio_record, params, tiles=False):
+    """
+    The cache entry of an image rendered from audio_path (audio_record: from cached_file_sha256 or buffer_record).
+
+    tiles records whether the image has a tile pyramid, so a deleted pyramid is rendered again.
+    """
+    return {'audio': audio_path, 'audio_file': audio_record, 'params': params, 'tiles': tiles}
+
+
+def has_tiles(image_path):
+    """Whether an image has a complete tile pyramid next to it."""
+    return os.path.exists(os.path.join(tiles_dir_for(image_path), MANIFEST_FILENAME))
+
+
+def image_is_current(image_path, entry, audio_record, params):
+    """Checks an image (and its tiles, if it had any) against its cache entry: same audio content and render parameters."""
+    if entry is None or not os.path.exists(image_path):
+        return False
+    if entry.get('tiles') and not has_tiles(image_path):
+        return False
+    return entry.get('audio_file', {}).get('sha256') == audio_record['sha256'] and entry.get('params') == params
+
+
+def remove_orphans(output_dir, cache, image_names, log_each=True):
+    """Deletes the images (and tile pyramids) in output_dir that no audio file maps to anymore, cached or not."""
+    removed = 0
+    for image_name in list(cache['images']):
+        if image_name not in image_names:
+            del cache['images'][image_name]
+    for root, dirs, files in os.walk(output_dir):
+        for tiles_name in [d for d in dirs if d.endswith(TILES_SUFFIX)]:
+            dirs.remove(tiles_name) # Nothing else lives inside a pyramid
+            image_path = os.path.join(root, tiles_name[:-len(TILES_SUFFIX)] + '.png')
+            if os.path.relpath(image_path, output_dir) not in image_names:
+                shutil.rmtree(os.path.join(root, tiles_name))
+        for file in files:
+            if not file.endswith(IMAGE_SUFFIX):
+                continue
+            image_path = os.path.join(root, file)
+            if os.path.relpath(image_path, output_dir) not in image_names:
+                if log_each:
+                    logging.info(f"Removing {image_path}, its audio file is gone.")
+                os.remove(image_path)
+                removed += 1
+    return removed
+
+
+def sync_spectrograms(dir_pairs, jobs=1, renderer=DEFAULT_RENDERER, force=False):
+    """
+    Brings the spectrograms of several directories up to date in one pass.
+
+    Args:
+        dir_pairs (list): (audio_dir, output_dir) pairs
+        jobs (int): Worker processes for the rendering (one pool for all directories)
+        renderer (str): See utils.spectrogram.RENDERERS
+        force (bool): Render every image again
+
+    Returns:
+        dict: Counts of 'current', 'rendered', 'failed' and 'removed' images
+    """
+    params = render_params(renderer)
+    stats = {'current': 0, 'rendered': 0, 'failed': 0, 'removed': 0}
+    caches = {}
+    listed = {} # output_dir -> image names found for its audio
+    pending = {} # audio_path -> (output_dir, image_name, audio_record)
+    tasks = []
+    for audio_dir, output_dir in dir_pairs:
+        cache = caches[output_dir] = load_cache(output_dir)
+        image_names = set()
+        for audio_path, image_path in find_spectrogram_tasks(audio_dir, output_dir):
+            image_name = os.path.relpath(image_path, output_dir)
+            image_names.add(image_name)
+            entry = cache['images'].get(image_name)
+            audio_record = cached_file_sha256(audio_path, entry.get('audio_file') if entry else None)
+            if not force and image_is_current(image_path, entry, audio_record, params):
+                stats['current'] += 1
+                continue
+            pending[audio_path] = (output_dir, image_name, audio_record)
+            tasks.append((audio_path, image_path))
+        listed[output_dir] = image_names
+        stats['removed'] += remove_orphans(output_dir, cache, image_names)
+
+    logging.info(f"Spectrograms: {stats['current']} up to date, {len(tasks)} to render, {stats['removed']} orphaned image(s) removed.")
+    try:
+        _, failed = run_spectrogram_tasks(tasks, jobs, renderer)
+        failed_paths = {audio_path for audio_path, _ in failed}
+        for audio_path, (output_dir, image_name, audio_record) in pending.items():
+            if audio_path in failed_paths:
+                caches[output_dir]['images'].pop(image_name, None)
+                continue
+            image_path = os.path.join(output_dir, image_name)
+            caches[output_dir]['images'][image_name] = cache_entry(audio_path, audio_record, params, has_tiles(image_path))
+        stats['rendered'] = len(tasks) - len(failed)
+        stats['failed'] = len(failed)
+    finally:
+        # Keep what was rendered even if the run is interrupted
+        for output_dir, cache in caches.items():
+            with cache_lock(output_dir):
+                # Keep images a runner recorded since this run listed the directory
+                for image_name, entry in load_cache(output_dir)['images'].items():
+                    if image_name not in listed.get(output_dir, ()) and os.path.exists(os.path.join(output_dir, image_name)):
+                        cache['images'][image_name] = entry
+                save_cache(output_dir, cache)
+    return stats
+
+
+def prune_directory(output_dir):
+    """Removes a spectrogram directory's cached images and cache file, e.g. for a method that has no output anymore."""
+    cache = load_cache(output_dir)
+    removed = remove_orphans(output_dir, cache, set(), log_each=False)
+    for path in (os.path.join(output_dir, CACHE_FILENAME), os.path.join(output_dir, CACHE_FILENAME + ".lock")):
+        if os.path.exists(path):
+            os.remove(path)
+    return removed
@@ -0,0 +1,194 @@
+import zlib
+import struct
+import numpy as np
+
+# Figure-free spectrogram renderer. It computes the same PSD in dB as matplotlib's
+# plt.specgram (NFFT 256, 50% overlap, Hann window, one-sided density scaled by
+# the sample rate), resamples it to the pixel grid of the axes area that
+# create_spectrogram() used to save, maps it through a viridis lookup table and
+# writes the RGBA PNG directly.
+NFFT = 256
+NOVERLAP = 128
+DEFAULT_FIGSIZE = (8, 4)
+DEFAULT_DPI = 100
+# Fraction of the figure covered by matplotlib's default subplot, which is all
+# that savefig(bbox_inches='tight', pad_inches=0) keeps once the axis is off
+AXES_FRACTION = (0.9 - 0.125, 0.88 - 0.11)
+STFT_BLOCK_FRAMES = 4096 # Frames transformed per batch, bounds the complex temporaries
+
+# matplotlib's viridis as 256 RGB triplets, exactly as Colormap(..., bytes=True) returns them
+_VIRIDIS_HEX = (
+    "44015444025544035745055845065a45085b46095c460b5e460c5f460e61470f62471163471265471466471567471669"
+    "47186a48196b481a6c481c6e481d6f481e70482071482172482273482374472575472676472777472878472a79472b7a"
+    "472c7b462d7c462f7c46307d46317e45327f45347f453580453681443781443982433a83433b83433c84423d84423e85"
+    "4240854141864142864043874044873f45873f47883e48883e49893d4a893d4b893d4c893c4d8a3c4e8a3b508a3b518a"
+    "3a528b3a538b39548b39558b38568b38578c37588c37598c365a8c365b8c355c8c355d8c345e8d345f8d33608d33618d"
+    "32628d32638d31648d31658d31668d30678d30688d2f698d2f6a8d2e6b8e2e6c8e2e6d8e2d6e8e2d6f8e2c708e2c718e"
+    "2c728e2b738e2b748e2a758e2a768e2a778e29788e29798e287a8e287a8e287b8e277c8e277d8e277e8e267f8e26808e"
+    "26818e25828e25838d24848d24858d24868d23878d23888d23898d22898d228a8d228b8d218c8d218d8c218e8c208f8c"
+    "20908c20918c1f928c1f938b1f948b1f958b1f968b1e978a1e988a1e998a1e998a1e9a891e9b891e9c891e9d881e9e88"
+    "1e9f881ea0871fa1871fa2861fa38620a48520a58521a68521a78422a78423a88323a98224aa8225ab8126ac8127ad80"
+    "28ae7f29af7f2ab07e2bb17d2cb17d2eb27c2fb37b30b47a32b57a33b67935b77836b87738b97639b9763bba753dbb74"
+    "3ebc7340bd7242be7144be7045bf6f47c06e49c16d4bc26c4dc26b4fc36951c46853c56755c66657c66559c7645bc862"
+    "5ec96160c96062ca5f64cb5d67cc5c69cc5b6bcd596dce5870ce5672cf5574d05477d05279d1517cd24f7ed24e81d34c"
+    "83d34b86d44988d5478bd5468dd64490d64392d74195d73f97d83e9ad83c9dd93a9fd938a2da37a5da35a7db33aadb32"
+    "addc30afdc2eb2dd2cb5dd2bb7dd29bade27bdde26bfdf24c2df22c5df21c7e01fcae01ecde01dcfe11cd2e11bd4e11a"
+    "d7e219dae218dce218dfe318e1e318e4e318e7e419e9e419ece41aeee51bf1e51cf3e51ef6e61ff8e621fae622fde724"
+)
+_VIRIDIS_LUT = None
+
+
+def viridis_lut():
+    """Returns the (256, 3) uint8 viridis lookup table."""
+    global _VIRIDIS_LUT
+    if _VIRIDIS_LUT is None:
+        _VIRIDIS_LUT = np.frombuffer(bytes.fromhex(_VIRIDIS_HEX), dtype=np.uint8).reshape(256, 3)
+    return _VIRIDIS_LUT
+
+
+def image_size(figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    """Returns the (width, height) in pixels of the image create_spectrogram() saves for a figure size."""
+    return int(round(figsize[0] * dpi * AXES_FRACTION[0])), int(round(figsize[1] * dpi * AXES_FRACTION[1]))
+
+
+def num_frames(num_samples, nfft=NFFT, noverlap=NOVERLAP):
+    """Number of STFT frames psd_db() returns for num_samples samples."""
+    return (max(num_samples, nfft) - nfft) // (nfft - noverlap) + 1
+
+
+def iter_psd_db(audio, sr, nfft=NFFT, noverlap=NOVERLAP, block_frames=STFT_BLOCK_FRAMES):
+    """
+    Computes the spectrogram plt.specgram draws (one-sided PSD in dB per frame) block by block.
+
+    The frames are windowed and transformed in batches of block_frames, so a caller
+    that consumes the blocks as they come never holds the whole spectrogram.
+
+    Yields:
+        np.ndarray: (nfft // 2 + 1, <= block_frames) float32, lowest frequency first; -inf where the power is 0
+    """
+    x = np.asarray(audio)
+    if x.ndim > 1:
+        x = np.mean(x, axis=1)
+    if len(x) < nfft:
+        x = np.concatenate([x, np.zeros(nfft - len(x), dtype=x.dtype)])
+    step = nfft - noverlap
+    frames = np.lib.stride_tricks.sliding_window_view(x, nfft)[::step]
+    window = np.hanning(nfft)
+    # Density scaling; every bin but DC and Nyquist also carries the mirrored negative frequency
+    scale = np.full(nfft // 2 + 1, 2.0 / (sr * np.sum(window ** 2)))
+    scale[0] /= 2
+    scale[-1] /= 2
+
+    with np.errstate(divide='ignore'):
+        for start in range(0, len(frames), block_frames):
+            spec = np.fft.rfft(frames[start:start + block_frames] * window, axis=1)
+            power = spec.real ** 2 + spec.imag ** 2
+            yield (10.0 * np.log10(power * scale)).astype(np.float32).T
+
+
+def psd_db(audio, sr, nfft=NFFT, noverlap=NOVERLAP, block_frames=STFT_BLOCK_FRAMES):
+    """
+    Computes the whole spectrogram plt.specgram draws; only the float32 result grows with the audio.
+
+    Returns:
+        np.ndarray: (nfft // 2 + 1, frames) float32, lowest frequency first; -inf where the power is 0
+    """
+    x = np.asarray(audio)
+    out = np.empty((nfft // 2 + 1, num_frames(len(x), nfft, noverlap)), dtype=np.float32)
+    start = 0
+    for block in iter_psd_db(x, sr, nfft, noverlap, block_frames):
+        out[:, start:start + block.shape[1]] = block
+        start += block.shape[1]
+    return out
+
+
+def _resample_axis(data, size, axis):
+    """Resamples one axis to size points: box average when shrinking, linear interpolation when growing."""
+    n = data.shape[axis]
+    if n == size:
+        return data
+    if n > size:
+        edges = (np.arange(size) * n) // size
+        counts = np.diff(np.append(edges, n)).astype(data.dtype)
+        shape = [1] * data.ndim
+        shape[axis] = size
+        return np.add.reduceat(data, edges, axis=axis) / counts.reshape(shape)
+    positions = np.clip((np.arange(size) + 0.5) * n / size - 0.5, 0, n - 1)
+    lo = np.floor(positions).astype(int)
+    hi = np.minimum(lo + 1, n - 1)
+    frac = (positions - lo).astype(data.dtype)
+    shape = [1] * data.ndim
+    shape[axis] = size
+    frac = frac.reshape(shape)
+    return np.take(data, lo, axis=axis) * (1 - frac) + np.take(data, hi, axis=axis) * frac
+
+
+def colorize(db, size, vmin=None, vmax=None):
+    """
+    Maps a dB spectrogram to a (height, width, 4) uint8 RGBA image, highest frequency at the top.
+
+    Like imshow, the colors span the finite min..max of the data unless vmin/vmax are
+    given, and bins with no power (-inf dB) are transparent.
+    """
+    width, height = size
+    finite = np.isfinite(db)
+    if not finite.any():
+        return np.zeros((height, width, 4), dtype=np.uint8)
+    vmin = float(db[finite].min()) if vmin is None else vmin
+    vmax = float(db[finite].max()) if vmax is None else vmax
+
+    filled = np.where(finite, db, np.float32(vmin))
+    coverage = finite.astype(np.float32)
+    # Shrink the (long) time axis first, so the frequency axis is resampled on few columns
+    return colorize_columns(_resample_axis(filled, width, 1), _resample_axis(coverage, width, 1), height, vmin, vmax)
+
+
+def colorize_columns(filled, coverage, height, vmin, vmax):
+    """
+    Second half of colorize(), for a spectrogram whose time axis is already resampled to the image width.
+
+    Args:
+        filled (np.ndarray): (bins, width) dB, with -inf bins replaced by vmin before resampling
+        coverage (np.ndarray): (bins, width) fraction of finite bins behind each value
+        height (int): Image height in pixels
+    """
+    width = filled.shape[1]
+    filled = _resample_axis(filled, height, 0)
+    coverage = _resample_axis(coverage, height, 0)
+
+    if vmax > vmin:
+        index = np.clip((filled - vmin) * (256.0 / (vmax - vmin)), 0, 255).astype(np.uint8)
+    else:
+        index = np.zeros(filled.shape, dtype=np.uint8)
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = viridis_lut()[index]
+    rgba[..., 3] = np.round(coverage * 255).astype(np.uint8)
+    return rgba[::-1]
+
+
+def render_spectrogram(audio, sr, figsize=DEFAULT_FIGSIZE, dpi=DEFAULT_DPI):
+    """Renders audio to the RGBA image create_spectrogram() saves, without matplotlib."""
+    return colorize(psd_db(audio, sr), image_size(figsize, dpi))
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def encode_png(rgba, compress_level=6):
+    """Encodes a (height, width, 4) uint8 array as an RGBA PNG."""
+    rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+    height, width, _ = rgba.shape
+    # Filter type 0 on every row: spectrogram noise makes the predictive filters compress worse
+    rows = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = rgba.reshape(height, width * 4)
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0) # 8-bit RGBA, no interlace
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(rows.tobytes(), compress_level)) + _png_chunk(b'IEND', b''))
+
+
+def write_png(path, rgba, compress_level=6):
+    """Writes an RGBA array to a PNG file."""
+    with open(path, 'wb') as f:
+        f.write(encode_png(rgba, compress_level))
@@ -0,0 +1,218 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from utils import spectrogram_engine as engine
+
+# Long files get a tiled pyramid of zoom levels next to their overview image, so
+# summary.html can show them at full STFT resolution without multi-megabyte PNGs.
+# One streaming STFT pass feeds the finest level (one column per STFT frame); every
+# coarser level averages pairs of columns of the level below it, down to a level
+# that fits in one tile. Tiles use a fixed dBFS color range, so neighbouring tiles
+# and levels (and different files) line up.
+#
+# Layout, next to <name>_spectrogram.png:
+#   <name>_spectrogram_tiles/tiles.json     metadata (see write_tiles)
+#   <name>_spectrogram_tiles/<level>/<i>.png  level 0 is the coarsest
+TILES_VERSION = 1
+TILES_SUFFIX = "_tiles"
+MANIFEST_FILENAME = "tiles.json"
+TILED_MIN_SECONDS = 20.0 # Shorter files only get the overview image
+TILE_WIDTH = 256 # STFT columns per tile; even, so column pairs never straddle two tiles
+TILE_HEIGHT = engine.NFFT // 2 + 1 # One row per frequency bin; the page scales it
+DBFS_RANGE = (-110.0, 0.0) # Color range; 0 dBFS is a full-scale sine
+
+
+def tile_params():
+    """Describes how the tiles are rendered, for the spectrogram cache."""
+    return {
+        'version': TILES_VERSION,
+        'min_seconds': TILED_MIN_SECONDS,
+        'tile_width': TILE_WIDTH,
+        'tile_height': TILE_HEIGHT,
+        'db_range': list(DBFS_RANGE),
+    }
+
+
+def tiles_dir_for(image_path):
+    """The tile directory that belongs to an overview image."""
+    return os.path.splitext(image_path)[0] + TILES_SUFFIX
+
+
+def wants_tiles(num_samples, sr):
+    """Whether a file is long enough to get a tile pyramid."""
+    return num_samples >= TILED_MIN_SECONDS * sr
+
+
+def dbfs_offset(sr, nfft=engine.NFFT):
+    """dB to add to engine.psd_db() values so that a full-scale sine peaks at 0 dBFS."""
+    window = np.hanning(nfft)
+    return float(10 * np.log10(2 * sr * np.sum(window ** 2) / np.sum(window) ** 2))
+
+
+def level_columns(frames):
+    """Columns per level, coarsest first, for a spectrogram of frames STFT frames."""
+    columns = [frames]
+    while columns[0] > TILE_WIDTH:
+        columns.insert(0, (columns[0] + 1) // 2)
+    return columns
+
+
+class _Overview:
+    """
+    Builds the overview image colorize() would make from the whole spectrogram, one block at a time.
+
+    The time axis is box-averaged as the blocks arrive. -inf bins are counted instead
+    of summed, since the value colorize() fills them with (the finite minimum) is only
+    known at the end.
+    """
+
+    def __init__(self, frames, size):
+        self.frames = frames
+        self.width, self.height = size
+        self.edges = (np.arange(self.width) * frames) // self.width
+        self.sums = np.zeros((TILE_HEIGHT, self.width))
+        self.finite = np.zeros((TILE_HEIGHT, self.width))
+        self.vmin, self.vmax = np.inf, -np.inf
+        self.start = 0
+
+    def add(self, block):
+        columns = np.arange(self.start, self.start + block.shape[1])
+        self.start += block.shape[1]
+        finite = np.isfinite(block)
+        if finite.any():
+            self.vmin = min(self.vmin, float(block[finite].min()))
+            self.vmax = max(self.vmax, float(block[finite].max()))
+        # Split the block where it crosses into the next output column
+        bins = np.searchsorted(self.edges, columns, side='right') - 1
+        starts = np.flatnonzero(np.diff(bins, prepend=-1))
+        self.sums[:, bins[starts]] += np.add.reduceat(np.where(finite, block, 0.0), starts, axis=1)
+        self.finite[:, bins[starts]] += np.add.reduceat(finite.astype(np.float32), starts, axis=1)
+
+    def image(self):
+        if not np.isfinite(self.vmin):
+            return np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        counts = np.diff(np.append(self.edges, self.frames)).astype(np.float64)
+        filled = ((self.sums + (counts - self.finite) * self.vmin) / counts).astype(np.float32)
+        coverage = (self.finite / counts).astype(np.float32)
+        return engine.colorize_columns(filled, coverage, self.height, self.vmin, self.vmax)
+
+
+class _Pyramid:
+    """Cuts a stream of finest-level columns into tiles, and feeds pair averages to the coarser levels."""
+
+    def __init__(self, tiles_dir, columns):
+        self.tiles_dir = tiles_dir
+        self.levels = len(columns)
+        self.pending = [[] for _ in columns] # Columns of each level not written to a tile yet
+        self.tiles = [0] * self.levels
+        for level in range(self.levels):
+            os.makedirs(os.path.join(tiles_dir, str(level)), exist_ok=True)
+
+    def add(self, level, block):
+        self.pending[level].append(block)
+        if sum(b.shape[1] for b in self.pending[level]) < TILE_WIDTH:
+            return
+        data = np.concatenate(self.pending[level], axis=1)
+        full = (data.shape[1] // TILE_WIDTH) * TILE_WIDTH
+        self.pending[level] = [data[:, full:]]
+        for start in range(0, full, TILE_WIDTH):
+            self._write(level, data[:, start:start + TILE_WIDTH])
+
+    def finish(self):
+        # Finest level first, so each level's last columns reach its parent before that is flushed
+        for level in range(self.levels - 1, -1, -1):
+            data = np.concatenate(self.pending[level], axis=1) if self.pending[level] else None
+            self.pending[level] = []
+            if data is not None and data.shape[1]:
+                self._write(level, data)
+
+    def _write(self, level, data):
+        rgba = engine.colorize(data, (data.shape[1], TILE_HEIGHT), *DBFS_RANGE)
+        engine.write_png(os.path.join(self.tiles_dir, str(level), f"{self.tiles[level]}.png"), rgba)
+        self.tiles[level] += 1
+        if level > 0:
+            if data.shape[1] % 2:
+                data = np.concatenate([data, data[:, -1:]], axis=1) # A lone last column is its own average
+            self.add(level - 1, (data[:, 0::2] + data[:, 1::2]) * np.float32(0.5))
+
+
+def write_tiles(audio, sr, tiles_dir, overview_size=None):
+    """
+    Renders the tile pyramid of a spectrogram, and optionally its overview image, from one STFT pass.
+
+    The pyramid is built in a temporary directory and swapped in when complete, so a
+    failed or interrupted render never leaves a partial pyramid behind.
+
+    Args:
+        audio (np.ndarray): Mono samples
+        sr (int): Sample rate
+        tiles_dir (str): Output directory, replaced if it exists
+        overview_size (tuple): (width, height) of the overview image to return, or None
+
+    Returns:
+        np.ndarray: The overview as colorize() draws it, or None
+    """
+    frames = engine.num_frames(len(audio))
+    columns = level_columns(frames)
+    offset = np.float32(dbfs_offset(sr))
+    # Clamp to the color range before averaging, so silence (-inf) doesn't swallow its neighbours
+    floor, ceiling = (np.float32(v) for v in DBFS_RANGE)
+    overview = _Overview(frames, overview_size) if overview_size and frames > overview_size[0] else None
+
+    tmp_dir = f"{tiles_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        pyramid = _Pyramid(tmp_dir, columns)
+        full = [] if overview_size and overview is None else None # Too few frames to box-average
+        for block in engine.iter_psd_db(audio, sr):
+            if overview is not None:
+                overview.add(block)
+            elif full is not None:
+                full.append(block)
+            pyramid.add(len(columns) - 1, np.clip(block + offset, floor, ceiling))
+        pyramid.finish()
+
+        manifest = {
+            'version': TILES_VERSION,
+            'sample_rate': sr,
+            'duration': len(audio) / sr,
+            'hop_seconds': (engine.NFFT - engine.NOVERLAP) / sr, # Time per column at the finest level
+            'tile_width': TILE_WIDTH,
+            'tile_height': TILE_HEIGHT,
+            'columns': columns,
+            'tiles': pyramid.tiles,
+            'db_range': list(DBFS_RANGE),
+            'max_frequency': sr / 2,
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILENAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+        os.rename(tmp_dir, tiles_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if overview is not None:
+        return overview.image()
+    if full is not None:
+        return engine.colorize(np.concatenate(full, axis=1), overview_size)
+    return None
+
+
+def load_manifest(tiles_dir):
+    """Reads a pyramid's tiles.json, or returns None if there is no usable pyramid."""
+    try:
+        with open(os.path.join(tiles_dir, MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == TILES_VERSION else None
+
+
+def remove_tiles(tiles_dir):
+    """Deletes a pyramid, e.g. when its file got too short to need one. Returns whether there was one."""
+    if not os.path.isdir(tiles_dir):
+        return False
+    shutil.rmtree(tiles_dir)
+    return True
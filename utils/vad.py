@@ -0,0 +1,169 @@
+import os
+import re
+import logging
+import numpy as np
+
+VAD_FRAME_MS = 10 # RNNoise reports one probability per 10 ms frame
+DEFAULT_VAD_DIR = "../../assets/vad"
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_PADDING_MS = 300 # Context kept around speech so onsets and tails aren't clipped
+DEFAULT_FADE_MS = 10
+DEFAULT_NON_SPEECH_GAIN_DB = -20.0
+
+
+def vad_track_name(audio_filename):
+    """Returns the track name for an audio file: its stem without the _16k/_44k rate suffix."""
+    stem = os.path.splitext(os.path.basename(audio_filename))[0]
+    return re.sub(r'_\d+k$', '', stem)
+
+
+def vad_track_path(vad_dir, audio_filename):
+    """Returns the path of the VAD track that belongs to an audio file."""
+    return os.path.join(vad_dir, f"{vad_track_name(audio_filename)}.npz")
+
+
+def save_vad_track(path, probabilities, frame_ms=VAD_FRAME_MS, source=""):
+    """Saves per-frame speech probabilities, quantized to uint8 (1/255 steps)."""
+    quantized = np.round(np.clip(probabilities, 0.0, 1.0) * 255.0).astype(np.uint8)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez_compressed(path, prob=quantized, frame_ms=np.int32(frame_ms), source=np.str_(source))
+
+
+def load_vad_track(path):
+    """Loads a VAD track; returns (probabilities as float32 in [0, 1], frame_ms)."""
+    with np.load(path) as data:
+        return data['prob'].astype(np.float32) / 255.0, int(data['frame_ms'])
+
+
+def speech_regions(probabilities, frame_ms, sr, num_samples, threshold=DEFAULT_THRESHOLD, padding_ms=DEFAULT_PADDING_MS):
+    """
+    Finds the speech regions of a signal from its VAD track.
+
+    Args:
+        probabilities (np.ndarray): Per-frame speech probabilities
+        frame_ms (int): Frame length of the track
+        sr (int): Sample rate of the signal the regions are for
+        num_samples (int): Length of that signal
+        threshold (float): Frames with a probability at or above this are speech
+        padding_ms (float): Context added on both sides of every region
+
+    Returns:
+        list: Sorted, non-overlapping (start, end) sample ranges
+    """
+    speech = np.concatenate(([False], np.asarray(probabilities) >= threshold, [False]))
+    edges = np.flatnonzero(np.diff(speech.astype(np.int8)))
+    frame_len = sr * frame_ms / 1000.0
+    padding = int(round(sr * padding_ms / 1000.0))
+
+    regions = []
+    for first, last in zip(edges[::2], edges[1::2]):
+        start = max(0, int(first * frame_len) - padding)
+        end = min(num_samples, int(np.ceil(last * frame_len)) + padding)
+        if start >= end:
+            continue
+        # Merge regions whose padding overlaps
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(regions[-1][1], end))
+        else:
+            regions.append((start, end))
+    return regions
+
+
+def _fit_length(audio, num_samples):
+    """Trims or zero-pads a model output to the length of its input segment."""
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if len(audio) >= num_samples:
+        return audio[:num_samples]
+    return np.pad(audio, (0, num_samples - len(audio)))
+
+
+class VadGate:
+    """Runs an expensive model only on the speech regions of a signal.
+
+    Non-speech audio is passed through or attenuated instead, and short fades
+    blend the model output in and out at the region edges.
+    """
+
+    def __init__(self, vad_dir=DEFAULT_VAD_DIR, threshold=DEFAULT_THRESHOLD, padding_ms=DEFAULT_PADDING_MS,
+                 non_speech='passthrough', non_speech_gain_db=DEFAULT_NON_SPEECH_GAIN_DB, fade_ms=DEFAULT_FADE_MS):
+        self.vad_dir = vad_dir
+        self.threshold = threshold
+        self.padding_ms = padding_ms
+        self.non_speech = non_speech
+        self.non_speech_gain_db = non_speech_gain_db
+        self.fade_ms = fade_ms
+
+    @classmethod
+    def from_args(cls, args):
+        """Builds a gate from the options added by add_vad_gate_arguments(), or None if gating is off."""
+        if not args.vad_gate:
+            return None
+        return cls(args.vad_dir, args.vad_threshold, args.vad_padding_ms, args.non_speech, args.non_speech_gain_db,
+                   args.vad_fade_ms)
+
+    def regions_for(self, audio_filename, sr, num_samples):
+        """Returns the speech regions of an audio file, or None if it has no VAD track."""
+        path = vad_track_path(self.vad_dir, audio_filename)
+        if not os.path.exists(path):
+            logging.warning(f"No VAD track at {path}; processing the whole file. Run methods/rnnoise/vad_analysis.py first.")
+            return None
+        probabilities, frame_ms = load_vad_track(path)
+        return speech_regions(probabilities, frame_ms, sr, num_samples, self.threshold, self.padding_ms)
+
+    def apply(self, audio, sr, regions, process_fn):
+        """
+        Processes the speech regions of audio with process_fn and gates the rest.
+
+        Args:
+            audio (np.ndarray): Mono float32 signal
+            sr (int): Its sample rate
+            regions (list): (start, end) sample ranges from regions_for()
+            process_fn (callable): Takes a float32 segment and returns the processed
+                segment at the same sample rate; its length is fitted to the input
+
+        Returns:
+            np.ndarray: The gated output, same length as audio
+        """
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.non_speech == 'attenuate':
+            output = audio * np.float32(10.0 ** (self.non_speech_gain_db / 20.0))
+        else:
+            output = audio.copy()
+
+        fade_len = int(round(sr * self.fade_ms / 1000.0))
+        speech_samples = 0
+        for start, end in regions:
+            processed = _fit_length(process_fn(audio[start:end]), end - start)
+            weight = np.ones(end - start, dtype=np.float32)
+            fade = min(fade_len, (end - start) // 2)
+            if fade > 0:
+                ramp = np.linspace(0.0, 1.0, fade, endpoint=False, dtype=np.float32)
+                # No fade where the region touches the start or end of the signal
+                if start > 0:
+                    weight[:fade] = ramp
+                if end < len(audio):
+                    weight[-fade:] = ramp[::-1]
+            output[start:end] = weight * processed + (1.0 - weight) * output[start:end]
+            speech_samples += end - start
+
+        if len(audio) > 0:
+            logging.info(f"VAD gate: {len(regions)} speech region(s), {100.0 * speech_samples / len(audio):.1f}% of the audio processed by the model.")
+        return output
+
+
+def add_vad_gate_arguments(parser):
+    """Adds the VAD gating options shared by the heavy-model runners."""
+    parser.add_argument("--vad-gate", action="store_true",
+                        help="Only run the model on speech regions from the RNNoise VAD tracks")
+    parser.add_argument("--vad-dir", type=str, default=DEFAULT_VAD_DIR,
+                        help=f"Directory with VAD tracks from methods/rnnoise/vad_analysis.py (default: {DEFAULT_VAD_DIR})")
+    parser.add_argument("--vad-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Speech probability threshold (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--vad-padding-ms", type=float, default=DEFAULT_PADDING_MS,
+                        help=f"Padding added around each speech region in ms (default: {DEFAULT_PADDING_MS})")
+    parser.add_argument("--vad-fade-ms", type=float, default=DEFAULT_FADE_MS,
+                        help=f"Crossfade between model output and non-speech audio at region edges in ms (default: {DEFAULT_FADE_MS})")
+    parser.add_argument("--non-speech", choices=['passthrough', 'attenuate'], default='passthrough',
+                        help="What to do with non-speech audio (default: passthrough)")
+    parser.add_argument("--non-speech-gain-db", type=float, default=DEFAULT_NON_SPEECH_GAIN_DB,
+                        help=f"Gain applied to non-speech audio with --non-speech attenuate (default: {DEFAULT_NON_SPEECH_GAIN_DB})")
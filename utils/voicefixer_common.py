@@ -0,0 +1,62 @@
+import logging
+import numpy as np
+import soundfile as sf
+
+from utils.corpus_store import input_filename, read_input
+from utils.wavio import to_pcm16
+
+# File handling shared by the VoiceFixer runners (methods/voice_fixer_mode_0 and
+# voice_fixer_mode_1), which only differ in the VoiceFixer mode and output names.
+# Outputs are written as 16-bit PCM like voicefixer's save_wave(), but quantized
+# with utils.wavio.to_pcm16 like every other int16 file here: clipped instead of
+# wrapping around at full scale, and without scaling the caller's buffer in place.
+
+
+def save_output(output_path, enhanced, sr, spectrograms=None):
+    """Writes a VoiceFixer output ((1, N) or (N,) floats) as 16-bit PCM and hands the written samples to spectrograms, if given."""
+    pcm = to_pcm16(np.asarray(enhanced).reshape(-1))
+    sf.write(output_path, pcm, sr)
+    if spectrograms is not None:
+        spectrograms.add(output_path, pcm, sr)
+
+
+def process_file_gated(vf, input_path, output_path, mode, vad_gate, expected_sr, spectrograms=None):
+    """Runs VoiceFixer in memory on the speech regions only; returns False if the file has no VAD track."""
+    audio, sr = read_input(input_path, mono=True)
+    if sr != expected_sr:
+        logging.warning(f"Input sample rate {sr} doesn't match expected {expected_sr}; not gating.")
+        return False
+    regions = vad_gate.regions_for(input_filename(input_path), sr, len(audio))
+    if regions is None:
+        return False
+    # restore_inmem() takes and returns 44.1k audio, like restore() does with files
+    enhanced = vad_gate.apply(audio, sr, regions, lambda segment: vf.restore_inmem(segment, mode=mode))
+    save_output(output_path, enhanced, sr, spectrograms)
+    return True
+
+
+def process_file(vf, input_path, output_path, mode, expected_sr, vad_gate=None, spectrograms=None):
+    """Processes a single audio file using VoiceFixer with a specific mode.
+
+    Outputs enhanced in memory are handed to spectrograms (an OutputSpectrograms), if given.
+    """
+    try:
+        logging.info(f"Processing {input_path} with mode {mode}...")
+        if vad_gate is not None and process_file_gated(vf, input_path, output_path, mode, vad_gate, expected_sr, spectrograms):
+            logging.info(f"Saved enhanced audio to {output_path}")
+            return
+        # Memory-mapped WAV reader (or corpus store clip) instead of VoiceFixer's librosa.load
+        audio, sr = read_input(input_path, mono=True)
+        # mode=0: original model
+        # mode=1: Add microphone noise suppression
+        # mode=2: Add speech restoration
+        if sr == expected_sr:
+            # restore() is librosa.load at 44.1k + restore_inmem() + save_wave(), minus the load
+            enhanced = vf.restore_inmem(np.require(audio, requirements='W'), mode=mode)
+            save_output(output_path, enhanced, sr, spectrograms)
+        else:
+            # Let VoiceFixer load and resample files at other rates itself (summary.py renders their spectrograms)
+            vf.restore(input=input_path, output=output_path, mode=mode) # Use the specified mode
+        logging.info(f"Saved enhanced audio to {output_path}")
+    except Exception as e:
+        logging.error(f"Error processing {input_path}: {e}")
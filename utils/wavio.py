@@ -0,0 +1,201 @@
+import struct
+import logging
+from collections import namedtuple
+import numpy as np
+
+# Minimal RIFF/WAVE reader: parses the header and maps the PCM data chunk with
+# np.memmap, so reading a file costs no decode and no copy. Float output is
+# converted chunk by chunk into one preallocated array, without a full-length
+# integer or float64 temporary. Anything that isn't plain PCM/IEEE-float WAV
+# falls back to soundfile.
+CHUNK_FRAMES = 1 << 16 # Frames converted per step when a float dtype is requested
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+WavInfo = namedtuple('WavInfo', ['samplerate', 'channels', 'frames', 'bits_per_sample', 'is_float', 'data_offset'])
+
+
+class WavFormatError(ValueError):
+    """The file isn't a WAV file this module can map (read() then falls back to soundfile)."""
+
+
+def read_info(path):
+    """Parses the RIFF header of a WAV file; returns a WavInfo."""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise WavFormatError(f"{path} is not a RIFF/WAVE file")
+        f.seek(0, 2)
+        file_size = f.tell()
+        f.seek(12)
+
+        fmt = None
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise WavFormatError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == b'fmt ':
+                body = f.read(chunk_size)
+                if len(body) < 16:
+                    raise WavFormatError(f"{path} has a truncated fmt chunk")
+                format_tag, channels, samplerate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    # The first two bytes of the SubFormat GUID are the actual format tag
+                    format_tag = struct.unpack('<H', body[24:26])[0]
+                fmt = (format_tag, channels, samplerate, block_align, bits)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise WavFormatError(f"{path} has its data chunk before the fmt chunk")
+                data_offset = f.tell()
+                # Writers that never finalized the header leave 0 or 0xFFFFFFFF here
+                data_size = min(chunk_size, file_size - data_offset) if chunk_size else file_size - data_offset
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), 1) # Chunks are padded to an even size
+
+    format_tag, channels, samplerate, block_align, bits = fmt
+    if format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+        is_float = False
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        is_float = True
+    else:
+        raise WavFormatError(f"{path}: unsupported WAV format {format_tag:#06x} with {bits} bits")
+    if channels < 1 or block_align != channels * bits // 8:
+        raise WavFormatError(f"{path}: inconsistent block alignment {block_align} for {channels} x {bits} bits")
+    return WavInfo(samplerate, channels, data_size // block_align, bits, is_float, data_offset)
+
+
+def _raw_dtype(info):
+    if info.is_float:
+        return np.dtype(f'<f{info.bits_per_sample // 8}')
+    return {8: np.dtype('u1'), 16: np.dtype('<i2'), 24: np.dtype('u1'), 32: np.dtype('<i4')}[info.bits_per_sample]
+
+
+def pcm_view(path, info=None):
+    """
+    Returns a read-only np.memmap of the samples in the data chunk, shaped (frames, channels).
+
+    24-bit files have no NumPy sample type; their view is (frames, channels, 3) bytes.
+    """
+    info = info or read_info(path)
+    shape = (info.frames, info.channels, 3) if info.bits_per_sample == 24 else (info.frames, info.channels)
+    if info.frames == 0:
+        return np.zeros(shape, dtype=_raw_dtype(info))
+    return np.memmap(path, dtype=_raw_dtype(info), mode='r', offset=info.data_offset, shape=shape)
+
+
+def _to_float(raw, info, dtype):
+    """Converts a block of raw samples to floats in [-1, 1), scaled the way libsndfile does."""
+    bits = info.bits_per_sample
+    if info.is_float:
+        return raw.astype(dtype, copy=False)
+    if bits == 8:
+        block = raw.astype(dtype)
+        block -= 128
+        block *= dtype.type(1 / 128)
+        return block
+    if bits == 24:
+        raw = raw.astype(np.int32)
+        raw = (raw[..., 0] << 8) | (raw[..., 1] << 16) | (raw[..., 2] << 24)
+        bits = 32
+    block = raw.astype(dtype)
+    block *= dtype.type(2.0 ** (1 - bits))
+    return block
+
+
+def _downmix(block):
+    """Averages the channels of a (frames, channels) block like np.mean(block, axis=1), but much faster."""
+    total = block[:, 0].copy()
+    for c in range(1, block.shape[1]):
+        total += block[:, c]
+    total /= block.dtype.type(block.shape[1])
+    return total
+
+
+def read(path, dtype='float32', mono=False, chunk_frames=CHUNK_FRAMES):
+    """
+    Reads a WAV file like soundfile.read(path, dtype=dtype); returns (audio, samplerate).
+
+    The result is 1-D for mono files (or with mono=True, which averages the
+    channels) and (frames, channels) otherwise. When no conversion is needed
+    (float32 file read as float32, int16 file read as int16, or dtype=None for
+    the raw samples) it is a zero-copy, read-only memmap of the file.
+    """
+    try:
+        info = read_info(path)
+    except WavFormatError as e:
+        logging.debug(f"{e}; reading with soundfile")
+        import soundfile as sf
+        audio, sr = sf.read(path, dtype=dtype or 'float32')
+        if mono and audio.ndim > 1:
+            audio = np.mean(audio, axis=1)
+        return audio, sr
+
+    raw = pcm_view(path, info)
+    raw_dtype = _raw_dtype(info)
+    downmix = mono and info.channels > 1
+    if dtype is None or (np.dtype(dtype) == raw_dtype and info.bits_per_sample not in (8, 24)):
+        if not downmix:
+            return (raw[:, 0] if info.channels == 1 else raw), info.samplerate
+        dtype = dtype or 'float32'
+
+    return _convert(raw, info, dtype, downmix, chunk_frames, path), info.samplerate
+
+
+def _convert(raw, info, dtype, downmix, chunk_frames=CHUNK_FRAMES, name="audio"):
+    """Converts (frames, channels) raw samples to a float array, block by block."""
+    dtype = np.dtype(dtype)
+    if dtype.kind != 'f':
+        raise WavFormatError(f"Can't convert {info.bits_per_sample}-bit samples of {name} to {dtype}")
+    frames = len(raw)
+    squeeze = downmix or info.channels == 1
+    out = np.empty((frames,) if squeeze else (frames, info.channels), dtype=dtype)
+    for start in range(0, frames, chunk_frames):
+        block = _to_float(raw[start:start + chunk_frames], info, dtype)
+        if downmix:
+            block = _downmix(block)
+        elif squeeze:
+            block = block[:, 0]
+        out[start:start + len(block)] = block
+    return out
+
+
+def to_pcm16(audio):
+    """
+    Converts float audio to the 16-bit samples sf.write() stores for it in a PCM_16 file.
+
+    libsndfile scales float32 samples by 2**15, rounds toward minus infinity and clips, so
+    writing the result gives the same file as writing the float audio. Every int16 output
+    (prepared files, VoiceFixer outputs) goes through here, so a signal is quantized the
+    same way whichever path wrote it.
+    """
+    return np.clip(np.floor(np.asarray(audio, dtype=np.float32) * np.float32(32768)), -32768, 32767).astype(np.int16)
+
+
+def as_read(audio, info, dtype='float32', mono=False):
+    """
+    Returns what read() gives for a WAV file with header info that soundfile wrote from audio,
+    without reading the file back.
+
+    libsndfile's rounding and clipping differ between sample formats and versions, so
+    the samples are encoded in memory by libsndfile itself (a RAW file with the same
+    sample format) and then converted like read() converts the file.
+    """
+    import io
+    import soundfile as sf
+    audio = np.asarray(audio)
+    frames = audio.reshape(len(audio), -1)
+    if frames.shape[1] != info.channels:
+        raise WavFormatError(f"Buffer has {frames.shape[1]} channel(s), the file {info.channels}")
+    subtype = ({32: 'FLOAT', 64: 'DOUBLE'} if info.is_float else
+               {8: 'PCM_U8', 16: 'PCM_16', 24: 'PCM_24', 32: 'PCM_32'})[info.bits_per_sample]
+    encoded = io.BytesIO()
+    with sf.SoundFile(encoded, mode='w', samplerate=info.samplerate, channels=info.channels,
+                      format='RAW', subtype=subtype, endian='LITTLE') as f:
+        f.write(frames)
+    raw = np.frombuffer(encoded.getbuffer(), dtype=_raw_dtype(info))
+    raw = raw.reshape((len(frames), info.channels, 3) if info.bits_per_sample == 24 else (len(frames), info.channels))
+    return _convert(raw, info, dtype, mono and info.channels > 1)